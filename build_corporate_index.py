@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CompanyGenius 検索インデックス構築スクリプト
+corporate_phase2_stable.db にオフラインで検索用構造を追加する
+
+- name_length 列（部分一致候補の並び替え用）
+- corporate_name_fts（FTS5 trigram 部分一致インデックス）
+- core_name / legal_form / legal_form_position 列（法人格を除いた中核名と索引）
+- <db>.bloom（社名・中核名の否定検索用 Bloom フィルタ）
+- INDEX_MANIFEST の B-tree 索引 + ANALYZE（サーバーは起動時に索引を作らず、欠けていれば起動しない）
+- corporate_metadata（件数・前株/後株の集計とスキーマ指紋。起動時の全件走査を不要にする）
+"""
+
+import sqlite3
+import os
+import sys
+import argparse
+from datetime import datetime
+
+from phase15_bloom_filter import (
+    BloomFilter, BLOOM_NAME, BLOOM_CORE, DEFAULT_FP_RATE, bloom_path_for
+)
+from phase15_db_metadata import compute_metadata, write_metadata
+
+# 部分一致用FTS5テーブル名（カスケードシステムと共通）
+FTS_TABLE = 'corporate_name_fts'
+# trigram は3文字未満の部分文字列を索引で絞り込めない
+FTS_MIN_QUERY_LENGTH = 3
+
+# 中核名の算出対象となる法人格（長いものを先に判定）
+LEGAL_FORMS = [
+    '一般社団法人', '一般財団法人', '公益社団法人', '公益財団法人',
+    '特定非営利活動法人', '株式会社', '有限会社', '合同会社', '合資会社', '合名会社'
+]
+LEGAL_FORM_PREFIX = '前'
+LEGAL_FORM_SUFFIX = '後'
+
+CORE_NAME_INDEX = 'idx_core_name'
+
+# 必須索引の宣言（索引名, corporate_master の列, 用途）
+# 列が存在しない DB（中核名未構築など）では該当索引は対象外
+INDEX_MANIFEST = [
+    ('idx_corporate_name', 'name', 'Level 4 完全一致・法人格パターン・一括照合'),
+    ('idx_corporate_number', 'corporate_number', '法人番号による参照・差分更新'),
+    (CORE_NAME_INDEX, 'core_name', '中核名による法人格パターン解決'),
+]
+
+# 旧版サーバーが起動時に作成していた索引（重複・未使用のため構築時に削除）
+LEGACY_INDEXES = [
+    'idx_name_fast', 'idx_name_exact', 'idx_name_prefix', 'idx_name_suffix',
+    'idx_corporate_number_fast', 'idx_prefecture_fast'
+]
+
+
+def split_legal_form(name):
+    """社名を (中核名, 法人格, 位置) に分解。法人格がなければ (None, None, None)"""
+    if not name:
+        return None, None, None
+    for form in LEGAL_FORMS:
+        if name.startswith(form) and len(name) > len(form):
+            return name[len(form):], form, LEGAL_FORM_PREFIX
+    for form in LEGAL_FORMS:
+        if name.endswith(form) and len(name) > len(form):
+            return name[:-len(form)], form, LEGAL_FORM_SUFFIX
+    return None, None, None
+
+
+def has_legal_form_affix(query):
+    """クエリ自体が法人格で始まる・終わるか（中核名1件では表せない組み合わせ）"""
+    return any(query.startswith(form) or query.endswith(form) for form in LEGAL_FORMS)
+
+
+class MissingIndexError(RuntimeError):
+    """必須索引がない DB でサーバーを起動しようとした"""
+
+
+def missing_indexes(conn):
+    """INDEX_MANIFEST のうち存在しない（または列が異なる）索引名のリスト"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(corporate_master)")}
+    indexed = {}
+    for row in conn.execute("PRAGMA index_list(corporate_master)").fetchall():
+        index_name = row[1]
+        indexed[index_name] = [info[2] for info in conn.execute(f"PRAGMA index_info({index_name})")]
+    return [
+        index_name for index_name, column, _ in INDEX_MANIFEST
+        if column in columns and indexed.get(index_name) != [column]
+    ]
+
+
+def require_indexes(db_pool):
+    """サーバー起動時の索引確認（読み取り専用。欠けていれば MissingIndexError）"""
+    with db_pool.connection() as conn:
+        missing = missing_indexes(conn)
+    if missing:
+        raise MissingIndexError(
+            f"Required indexes missing in {db_pool.db_path}: {', '.join(missing)} "
+            f"- run: python build_corporate_index.py --db {db_pool.db_path}"
+        )
+
+
+class CorporateIndexBuilder:
+    """corporate_master 向けオフライン検索インデックス構築"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+
+    def connect(self):
+        """書き込み用接続を開く（サーバー停止中・またはコピーに対して実行）"""
+        if not os.path.exists(self.db_path):
+            print(f"❌ データベースが見つかりません: {self.db_path}")
+            return False
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-200000")
+        return True
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _columns(self, table):
+        cursor = self.conn.execute(f"PRAGMA table_info({table})")
+        return {row[1] for row in cursor.fetchall()}
+
+    def _table_exists(self, name):
+        cursor = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ? LIMIT 1", (name,)
+        )
+        return cursor.fetchone() is not None
+
+    def build_name_length(self):
+        """name_length 列を追加・更新"""
+        print("📏 name_length 列を構築中...")
+        started = datetime.now()
+
+        if 'name_length' not in self._columns('corporate_master'):
+            self.conn.execute("ALTER TABLE corporate_master ADD COLUMN name_length INTEGER")
+        self.conn.execute("UPDATE corporate_master SET name_length = LENGTH(name)")
+        self.conn.commit()
+
+        print(f"✅ name_length 構築完了 ({datetime.now() - started})")
+
+    def build_fts_index(self):
+        """FTS5 trigram 部分一致インデックスを構築"""
+        print("🔍 FTS5 trigram インデックスを構築中...")
+        started = datetime.now()
+
+        if self._table_exists(FTS_TABLE):
+            self.conn.execute(f"DROP TABLE {FTS_TABLE}")
+
+        # 外部コンテンツ方式: 名称本体は corporate_master に保持し、索引のみ持つ
+        self.conn.execute(f"""
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                name,
+                content='corporate_master',
+                content_rowid='rowid',
+                tokenize='trigram'
+            )
+        """)
+        self.conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')")
+        self.conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
+        self.conn.commit()
+
+        print(f"✅ FTS5 インデックス構築完了 ({datetime.now() - started})")
+
+    def build_core_names(self, batch_size=50000):
+        """法人格を除いた中核名・法人格・位置（前/後）の列を構築（索引は build_indexes）"""
+        print("🏷️  中核名（法人格除去）列を構築中...")
+        started = datetime.now()
+
+        columns = self._columns('corporate_master')
+        for column in ('core_name', 'legal_form', 'legal_form_position'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE corporate_master ADD COLUMN {column} TEXT")
+
+        # 更新中のテーブルを走査しないよう rowid 範囲ごとに読み出す
+        last_rowid = -1
+        updated = 0
+        while True:
+            rows = self.conn.execute(
+                "SELECT rowid, name FROM corporate_master WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            self.conn.executemany(
+                """
+                UPDATE corporate_master
+                SET core_name = ?, legal_form = ?, legal_form_position = ?
+                WHERE rowid = ?
+                """,
+                [(*split_legal_form(name), rowid) for rowid, name in rows]
+            )
+            updated += len(rows)
+            print(f"  📈 {updated:,} 件処理完了")
+
+        self.conn.commit()
+
+        print(f"✅ 中核名構築完了 ({datetime.now() - started})")
+
+    def build_indexes(self):
+        """INDEX_MANIFEST の索引を作成し、旧版の重複索引を削除して ANALYZE"""
+        print("🗂️  索引を構築中...")
+        started = datetime.now()
+
+        for index_name in LEGACY_INDEXES:
+            if self._table_exists(index_name):
+                self.conn.execute(f"DROP INDEX {index_name}")
+                print(f"  🗑️  旧索引を削除: {index_name}")
+
+        columns = self._columns('corporate_master')
+        for index_name, column, purpose in INDEX_MANIFEST:
+            if column not in columns:
+                print(f"  ⏭️  {index_name}: 列 {column} がないためスキップ")
+                continue
+            if index_name in missing_indexes(self.conn) and self._table_exists(index_name):
+                # 同名で列が異なる索引は作り直す
+                self.conn.execute(f"DROP INDEX {index_name}")
+            index_started = datetime.now()
+            self.conn.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON corporate_master({column})"
+            )
+            print(f"  ✅ {index_name} ({column}: {purpose}) {datetime.now() - index_started}")
+        self.conn.commit()
+
+        # クエリプランナー用の統計（sqlite_stat1）
+        print("  📊 ANALYZE 実行中...")
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+
+        print(f"✅ 索引構築完了 ({datetime.now() - started})")
+
+    def check_indexes(self):
+        """必須索引の確認（欠けていれば索引名を表示して False）"""
+        missing = missing_indexes(self.conn)
+        columns = self._columns('corporate_master')
+        for index_name, column, purpose in INDEX_MANIFEST:
+            if column not in columns:
+                mark = '⏭️ '
+            else:
+                mark = '❌' if index_name in missing else '✅'
+            print(f"  {mark} {index_name} ({column}: {purpose})")
+        return not missing
+
+    def build_bloom_filter(self, fp_rate=DEFAULT_FP_RATE):
+        """社名・中核名の Bloom フィルタを構築して DB の隣に保存"""
+        print("🌸 Bloom フィルタを構築中...")
+        started = datetime.now()
+
+        has_core_name = 'core_name' in self._columns('corporate_master')
+        name_count, core_count, max_rowid = self.conn.execute(f"""
+            SELECT COUNT(name), {'COUNT(core_name)' if has_core_name else '0'}, MAX(rowid)
+            FROM corporate_master
+        """).fetchone()
+
+        bloom = BloomFilter.for_capacity(name_count + core_count, fp_rate)
+        bloom.max_rowid = max_rowid or 0
+
+        cursor = self.conn.execute(
+            f"SELECT name, {'core_name' if has_core_name else 'NULL'} FROM corporate_master"
+        )
+        for name, core_name in cursor:
+            if name:
+                bloom.add(BLOOM_NAME, name)
+            if core_name:
+                bloom.add(BLOOM_CORE, core_name)
+
+        path = bloom_path_for(self.db_path)
+        bloom.save(path)
+
+        print(f"✅ Bloom フィルタ構築完了: {path} ({bloom.count:,} キー, "
+              f"{len(bloom.bits) / 1024 / 1024:.1f}MB, 偽陽性率 {fp_rate:.2%}, {datetime.now() - started})")
+
+    def build_metadata(self):
+        """件数・法人格分布の集計とスキーマ指紋を保存（列追加後の最終ステップ）"""
+        print("📋 メタデータを集計中...")
+        started = datetime.now()
+
+        metadata = compute_metadata(self.conn)
+        write_metadata(self.conn, metadata)
+        self.conn.commit()
+
+        print(f"✅ メタデータ保存完了: {metadata['total_count']:,} 社 "
+              f"(前株 {metadata['mae_kabu']:,} / 後株 {metadata['ato_kabu']:,}, "
+              f"指紋 {metadata['schema_fingerprint']}, {datetime.now() - started})")
+
+    def build_all(self, fp_rate=DEFAULT_FP_RATE):
+        """全ステップ実行"""
+        self.build_name_length()
+        self.build_fts_index()
+        self.build_core_names()
+        self.build_indexes()
+        self.build_bloom_filter(fp_rate)
+        self.build_metadata()
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="CompanyGenius 検索インデックス構築")
+    parser.add_argument(
+        '--db',
+        default=os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db'),
+        help="対象データベース（既定: $DATABASE_PATH）"
+    )
+    parser.add_argument(
+        '--bloom-fp-rate',
+        type=float,
+        default=DEFAULT_FP_RATE,
+        help=f"Bloom フィルタの偽陽性率（既定: {DEFAULT_FP_RATE}）"
+    )
+    parser.add_argument(
+        '--indexes-only',
+        action='store_true',
+        help="索引（INDEX_MANIFEST）と ANALYZE のみ実行"
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help="必須索引の有無のみ確認（欠けていれば終了コード 1）"
+    )
+    args = parser.parse_args()
+
+    print("🧠 CompanyGenius 検索インデックス構築")
+    print("=" * 50)
+    print(f"📁 対象データベース: {args.db}")
+
+    builder = CorporateIndexBuilder(args.db)
+    if not builder.connect():
+        sys.exit(1)
+
+    if args.check:
+        try:
+            ok = builder.check_indexes()
+        finally:
+            builder.close()
+        sys.exit(0 if ok else 1)
+
+    started = datetime.now()
+    try:
+        if args.indexes_only:
+            builder.build_indexes()
+        else:
+            builder.build_all(args.bloom_fp_rate)
+    except sqlite3.Error as e:
+        print(f"❌ インデックス構築エラー: {e}")
+        sys.exit(1)
+    finally:
+        builder.close()
+
+    print(f"\n🎉 インデックス構築完了 (総時間: {datetime.now() - started})")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,349 @@ import sqlite3
 import csv
 import os
 import sys
+import argparse
+import multiprocessing
+import queue
 from datetime import datetime
 
-def create_corporate_database():
-    """法人番号CSVからSQLiteデータベースを作成"""
+from phase15_import_checkpoint import (
+    OffsetLineReader, STATUS_COMPLETE, STATUS_LOADED, resumable_checkpoint, write_checkpoint
+)
+
+# 列数（先頭の連番を含む）
+CSV_COLUMNS = 27
+
+CREATE_COMPANIES_SQL = '''
+    CREATE TABLE companies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        corporate_number TEXT UNIQUE,
+        process_type TEXT,
+        correct_flag TEXT,
+        update_date TEXT,
+        change_date TEXT,
+        company_name TEXT,
+        company_name_kana TEXT,
+        prefecture_code TEXT,
+        city_code TEXT,
+        street_address TEXT,
+        business_category TEXT,
+        capital TEXT,
+        employee_count TEXT,
+        status TEXT,
+        close_date TEXT,
+        close_reason TEXT,
+        successor_corporate_number TEXT,
+        change_reason TEXT,
+        assignment_date TEXT,
+        latest_update_date TEXT,
+        en_company_name TEXT,
+        en_address_line TEXT,
+        en_prefecture_name TEXT,
+        en_city_name TEXT,
+        en_address_outside_city TEXT,
+        nearest_station TEXT
+    )
+'''
+
+# companies の id 以外の列（CSV の2列目以降と同じ順序）
+COMPANY_COLUMNS = [
+    'corporate_number', 'process_type', 'correct_flag', 'update_date',
+    'change_date', 'company_name', 'company_name_kana', 'prefecture_code',
+    'city_code', 'street_address', 'business_category', 'capital',
+    'employee_count', 'status', 'close_date', 'close_reason',
+    'successor_corporate_number', 'change_reason', 'assignment_date',
+    'latest_update_date', 'en_company_name', 'en_address_line',
+    'en_prefecture_name', 'en_city_name', 'en_address_outside_city',
+    'nearest_station'
+]
+
+INSERT_COMPANIES_SQL = f'''
+    INSERT OR IGNORE INTO companies ({', '.join(COMPANY_COLUMNS)})
+    VALUES ({', '.join('?' for _ in COMPANY_COLUMNS)})
+'''
+
+COMPANY_INDEXES = [
+    ('idx_company_name', 'company_name'),
+    ('idx_corporate_number', 'corporate_number'),
+    ('idx_company_name_kana', 'company_name_kana'),
+    ('idx_status', 'status'),
+]
+
+# バルクロード: 解析ワーカー数（CSVを行境界で分割し、各ワーカーが自分の作業用DBに取り込む）
+# 作業用DBは ATTACH するため SQLite の既定上限（10）未満に抑える
+BULK_WORKERS = max(1, min(int(os.getenv('BULK_WORKERS', os.cpu_count() or 1)), 8))
+BULK_BATCH_SIZE = 50000
+# 進捗待ちの間隔（秒）。この間隔でワーカーの異常終了（SIGKILL・OOM など）を確認する
+BULK_POLL_SECONDS = 1.0
+# 取り込み中の一時テーブル（作業用DBに置き、完了後にファイルごと削除）
+STAGING_TABLE = 'companies_load'
+
+
+def detect_delimiter(csv_file):
+    """CSVの区切り文字を先頭から判定"""
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        sample = f.read(1024)
+    if '\t' in sample:
+        return '\t'
+    return ','
+
+
+def split_ranges(csv_file, parts):
+    """CSVをほぼ等しいバイト範囲に分割（ヘッダー行は除く。境界は各ワーカーが行頭に合わせる）"""
+    with open(csv_file, 'rb') as f:
+        header_end = len(f.readline())
+    size = os.path.getsize(csv_file)
+    step = max(1, (size - header_end) // parts)
+    bounds = [header_end + step * i for i in range(parts)] + [size]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+def iter_range_lines(f, start, end):
+    """start 以降の最初の行頭から、行頭が end 未満の行を返す（法人番号CSVは1行1レコード）"""
+    if start > 0:
+        f.seek(start - 1)
+        start += len(f.readline()) - 1
+    position = start
+    while position < end:
+        line = f.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode('utf-8')
+
+
+def parse_worker(index, csv_file, delimiter, start, end, staging_path, progress):
+    """解析ワーカー: 担当範囲を解析して作業用DBに追記（行データをプロセス間で受け渡さない）
+
+    progress に ('rows', 件数) を随時、最後に ('done', ワーカー番号, 件数, エラー件数) を送る。失敗時は ('error', メッセージ)
+    """
+    try:
+        columns = ', '.join(COMPANY_COLUMNS)
+        placeholders = ', '.join('?' for _ in COMPANY_COLUMNS)
+        conn = sqlite3.connect(staging_path)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"CREATE TABLE {STAGING_TABLE} ({columns})")
+
+        batch = []
+        count = 0
+        error_count = 0
+        with open(csv_file, 'rb') as f:
+            for row in csv.reader(iter_range_lines(f, start, end), delimiter=delimiter):
+                try:
+                    # 不足分は空文字で埋め、先頭の連番を除いた26列
+                    adjusted_row = row[:CSV_COLUMNS] + [''] * (CSV_COLUMNS - len(row[:CSV_COLUMNS]))
+                    batch.append(adjusted_row[1:])
+                    count += 1
+                except Exception:
+                    error_count += 1
+                    continue
+                if len(batch) >= BULK_BATCH_SIZE:
+                    conn.executemany(f"INSERT INTO {STAGING_TABLE} VALUES ({placeholders})", batch)
+                    progress.put(('rows', len(batch)))
+                    batch = []
+        if batch:
+            conn.executemany(f"INSERT INTO {STAGING_TABLE} VALUES ({placeholders})", batch)
+            progress.put(('rows', len(batch)))
+        conn.commit()
+        conn.close()
+        progress.put(('done', index, count, error_count))
+    except Exception as e:
+        progress.put(('error', str(e)))
+
+
+def bulk_load(csv_file, conn, db_path):
+    """バルクロード（--bulk）
+
+    1. 取り込み: BULK_WORKERS 個のワーカーが CSV を分担して解析し、索引なしの作業用DBへ並列に追記
+    2. 整列挿入: 法人番号順に companies へ一括挿入（UNIQUE 索引・rowid とも末尾追記になる）
+    3. 索引作成: 独立したフェーズとして計測
+    ロード中のみ journal_mode=OFF / synchronous=OFF（完了後に既定値へ戻す）
+    """
+    with open(csv_file, 'rb') as f:
+        header = f.readline().decode('utf-8').rstrip('\r\n')
+    if not header:
+        raise RuntimeError("CSVファイルが空です")
+    delimiter = detect_delimiter(csv_file)
+    print(f"📋 ヘッダー列数: {len(next(csv.reader([header], delimiter=delimiter)))}")
+
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-500000")
+
+    ranges = split_ranges(csv_file, BULK_WORKERS)
+    staging_paths = [f"{db_path}.load-{i}" for i in range(len(ranges))]
+    for path in staging_paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+    progress = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=parse_worker,
+            args=(index, csv_file, delimiter, start, end, staging_path, progress),
+            daemon=True
+        )
+        for index, ((start, end), staging_path) in enumerate(zip(ranges, staging_paths))
+    ]
+    attached = []
+
+    try:
+        # フェーズ1: 取り込み（ワーカー並列）
+        load_started = datetime.now()
+        for worker in workers:
+            worker.start()
+        print(f"👷 解析ワーカー: {len(workers)}")
+        count = 0
+        error_count = 0
+        loaded = 0
+        finished = set()
+        while len(finished) < len(workers):
+            try:
+                message = progress.get(timeout=BULK_POLL_SECONDS)
+            except queue.Empty:
+                # 報告前に異常終了したワーカーがいれば中断（finally の後始末に任せる）
+                for index, worker in enumerate(workers):
+                    if index not in finished and worker.exitcode not in (None, 0):
+                        raise RuntimeError(f"解析ワーカー {index} が異常終了しました (exitcode={worker.exitcode})")
+                continue
+            if message[0] == 'rows':
+                loaded += message[1]
+                if loaded % (BULK_BATCH_SIZE * 10) < message[1]:
+                    elapsed = (datetime.now() - load_started).total_seconds()
+                    print(f"  📈 {loaded:,} 件取り込み ({loaded / max(elapsed, 1e-9):,.0f} 行/秒)")
+            elif message[0] == 'done':
+                finished.add(message[1])
+                count += message[2]
+                error_count += message[3]
+            else:
+                raise RuntimeError(message[1])
+        for worker in workers:
+            worker.join()
+        load_seconds = (datetime.now() - load_started).total_seconds()
+        print(f"✅ 取り込み完了: {count:,} 件 ({load_seconds:.1f}秒, {count / max(load_seconds, 1e-9):,.0f} 行/秒)")
+
+        # フェーズ2: 法人番号順に整列して本テーブルへ（重複は入力順で先の行を採用）
+        sort_started = datetime.now()
+        print("🔃 法人番号順に整列挿入中...")
+        columns = ', '.join(COMPANY_COLUMNS)
+        parts = []
+        for i, path in enumerate(staging_paths):
+            conn.execute(f"ATTACH DATABASE ? AS load_{i}", (path,))
+            attached.append(f"load_{i}")
+            parts.append(f"SELECT {i} AS part, rowid AS seq, {columns} FROM load_{i}.{STAGING_TABLE}")
+        conn.execute(f'''
+            INSERT OR IGNORE INTO companies ({columns})
+            SELECT {columns} FROM ({' UNION ALL '.join(parts)})
+            ORDER BY corporate_number, part, seq
+        ''')
+        conn.commit()
+        sort_seconds = (datetime.now() - sort_started).total_seconds()
+        print(f"✅ 整列挿入完了 ({sort_seconds:.1f}秒, {count / max(sort_seconds, 1e-9):,.0f} 行/秒)")
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for schema in attached:
+            conn.execute(f"DETACH DATABASE {schema}")
+        for path in staging_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    # フェーズ3: 索引作成
+    index_started = datetime.now()
+    create_indexes(conn)
+    index_seconds = (datetime.now() - index_started).total_seconds()
+
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute("PRAGMA journal_mode=DELETE")
+
+    total_seconds = load_seconds + sort_seconds + index_seconds
+    print("⏱️  バルクロード内訳:")
+    print(f"   取り込み   {load_seconds:8.1f}秒  ({count / max(load_seconds, 1e-9):,.0f} 行/秒)")
+    print(f"   整列挿入   {sort_seconds:8.1f}秒  ({count / max(sort_seconds, 1e-9):,.0f} 行/秒)")
+    print(f"   索引作成   {index_seconds:8.1f}秒")
+    print(f"   合計       {total_seconds:8.1f}秒  ({count / max(total_seconds, 1e-9):,.0f} 行/秒)")
+    return count, error_count
+
+
+def create_indexes(conn):
+    """検索用インデックス作成（索引ごとの所要時間を表示）"""
+    print("🔍 インデックス作成中...")
+    for index_name, column in COMPANY_INDEXES:
+        started = datetime.now()
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON companies({column})')
+        print(f"  ✅ {index_name} ({datetime.now() - started})")
+    conn.commit()
+    print("✅ インデックス作成完了")
+
+
+def load_rows(csv_file, conn, start_time, checkpoint=None):
+    """1行ずつ読み込み 10,000件ごとにコミット（既定モード）。空のCSVなら None
+
+    各バッチと同じトランザクションでチェックポイント（入力のバイト位置・件数）を記録し、
+    checkpoint を渡すとその位置から再開する。
+    """
+    # CSVデータ読み込み
+    print("📥 CSVデータ読み込み中...")
+    
+    with open(csv_file, 'rb') as f:
+        # CSVの区切り文字を自動検出
+        delimiter = detect_delimiter(csv_file)
+        
+        if checkpoint:
+            lines = OffsetLineReader(f, start=checkpoint['byte_offset'])
+            reader = csv.reader(lines, delimiter=delimiter)
+            count = checkpoint['row_count']
+            error_count = checkpoint['error_count']
+            print(f"⏩ {count:,} 件目（{checkpoint['byte_offset']:,} バイト）から再開")
+        else:
+            lines = OffsetLineReader(f)
+            reader = csv.reader(lines, delimiter=delimiter)
+            try:
+                header = next(reader)  # ヘッダーをスキップ
+                print(f"📋 ヘッダー列数: {len(header)}")
+            except StopIteration:
+                print("❌ CSVファイルが空です")
+                return None
+            count = 0
+            error_count = 0
+        
+        batch_size = 10000
+        batch_data = []
+        
+        for row_num, row in enumerate(reader, start=count + error_count + 2):  # ヘッダーを除いて2行目から
+            try:
+                # データの長さを調整（不足分は空文字で埋める）
+                adjusted_row = row[:CSV_COLUMNS] + [''] * (CSV_COLUMNS - len(row[:CSV_COLUMNS]))
+                batch_data.append(adjusted_row)
+                count += 1
+                
+                # バッチサイズに達したらデータベースに挿入（チェックポイントも同じトランザクション）
+                if len(batch_data) >= batch_size:
+                    conn.executemany(INSERT_COMPANIES_SQL, [row[1:] for row in batch_data])  # IDを除いた26列
+                    write_checkpoint(conn, csv_file, lines.offset, count, error_count)
+                    conn.commit()
+                    batch_data = []
+                    print(f"  📈 {count:,} 件処理完了 ({datetime.now() - start_time})")
+            
+            except Exception as e:
+                error_count += 1
+                if error_count <= 10:  # 最初の10エラーのみ表示
+                    print(f"  ⚠️  行 {row_num} でエラー: {str(e)[:100]}")
+                continue
+        
+        # 残りのデータを挿入
+        if batch_data:
+            conn.executemany(INSERT_COMPANIES_SQL, [row[1:] for row in batch_data])
+        write_checkpoint(conn, csv_file, lines.offset, count, error_count, status=STATUS_LOADED)
+        conn.commit()
+    
+    return count, error_count
+
+
+def create_corporate_database(bulk=False):
+    """法人番号CSVからSQLiteデータベースを作成（bulk=True でバルクロード）"""
     
     print("🧠 CompanyGenius データベース作成スクリプト")
     print("=" * 50)
@@ -46,15 +385,27 @@ def create_corporate_database():
     if csv_size > 5:
         print("⚠️  大容量ファイルです。処理に時間がかかる可能性があります")
     
+    # 中断した取り込みの再開（バルクロードは作業用DB を使うため再開不可）
+    checkpoint = None
+    if os.path.exists(db_path) and not bulk:
+        checkpoint, _ = resumable_checkpoint(db_path, csv_file)
+        if checkpoint is not None:
+            response = input(
+                f"⏸️  中断した取り込みが見つかりました: {checkpoint['row_count']:,} 件"
+                f"（{checkpoint['updated_at']}）\n続きから再開しますか？ (Y/n): "
+            )
+            if response.lower() in ['n', 'no']:
+                checkpoint = None
+    
     # 既存データベースの確認
-    if os.path.exists(db_path):
+    if os.path.exists(db_path) and checkpoint is None:
         response = input(f"⚠️  既存のデータベースが見つかりました: {db_path}\n上書きしますか？ (y/N): ")
         if response.lower() not in ['y', 'yes']:
             print("❌ 処理を中止しました")
             return False
         os.remove(db_path)
     
-    print("\n🔧 データベース作成開始...")
+    print("\n🔧 データベース作成開始..." if checkpoint is None else "\n🔧 データベース作成再開...")
     start_time = datetime.now()
     
     try:
@@ -62,130 +413,34 @@ def create_corporate_database():
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
-        # テーブル作成
-        cursor.execute('''
-            CREATE TABLE companies (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                corporate_number TEXT UNIQUE,
-                process_type TEXT,
-                correct_flag TEXT,
-                update_date TEXT,
-                change_date TEXT,
-                company_name TEXT,
-                company_name_kana TEXT,
-                prefecture_code TEXT,
-                city_code TEXT,
-                street_address TEXT,
-                business_category TEXT,
-                capital TEXT,
-                employee_count TEXT,
-                status TEXT,
-                close_date TEXT,
-                close_reason TEXT,
-                successor_corporate_number TEXT,
-                change_reason TEXT,
-                assignment_date TEXT,
-                latest_update_date TEXT,
-                en_company_name TEXT,
-                en_address_line TEXT,
-                en_prefecture_name TEXT,
-                en_city_name TEXT,
-                en_address_outside_city TEXT,
-                nearest_station TEXT
-            )
-        ''')
-        
-        print("✅ テーブル作成完了")
-        
-        # CSVデータ読み込み
-        print("📥 CSVデータ読み込み中...")
-        
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            # CSVの区切り文字を自動検出
-            sample = f.read(1024)
-            f.seek(0)
-            
-            # 一般的な区切り文字を試行
-            if '\t' in sample:
-                delimiter = '\t'
-            elif ',' in sample:
-                delimiter = ','
-            else:
-                delimiter = ','
-            
-            reader = csv.reader(f, delimiter=delimiter)
+        if checkpoint is None:
+            # テーブル作成
+            cursor.execute(CREATE_COMPANIES_SQL)
             
-            try:
-                header = next(reader)  # ヘッダーをスキップ
-                print(f"📋 ヘッダー列数: {len(header)}")
-            except StopIteration:
-                print("❌ CSVファイルが空です")
+            print("✅ テーブル作成完了")
+        
+        if bulk:
+            print("📥 CSVデータ バルクロード中...")
+            count, error_count = bulk_load(csv_file, conn, db_path)
+        elif checkpoint is not None and checkpoint['status'] == STATUS_LOADED:
+            # 全行取り込み済み（索引作成中に中断）
+            count, error_count = checkpoint['row_count'], checkpoint['error_count']
+            print(f"⏩ 取り込み済み: {count:,} 件 - 索引作成から再開")
+        else:
+            loaded = load_rows(csv_file, conn, start_time, checkpoint)
+            if loaded is None:
                 return False
-            
-            batch_size = 10000
-            batch_data = []
-            count = 0
-            error_count = 0
-            
-            for row_num, row in enumerate(reader, start=2):  # ヘッダーを除いて2行目から
-                try:
-                    # データの長さを調整（不足分は空文字で埋める）
-                    adjusted_row = row[:27] + [''] * (27 - len(row[:27]))
-                    batch_data.append(adjusted_row)
-                    count += 1
-                    
-                    # バッチサイズに達したらデータベースに挿入
-                    if len(batch_data) >= batch_size:
-                        cursor.executemany('''
-                            INSERT OR IGNORE INTO companies (
-                                corporate_number, process_type, correct_flag, update_date, 
-                                change_date, company_name, company_name_kana, prefecture_code, 
-                                city_code, street_address, business_category, capital, 
-                                employee_count, status, close_date, close_reason, 
-                                successor_corporate_number, change_reason, assignment_date, 
-                                latest_update_date, en_company_name, en_address_line, 
-                                en_prefecture_name, en_city_name, en_address_outside_city, 
-                                nearest_station
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', [row[1:] for row in batch_data])  # IDを除いた25列
-                        conn.commit()
-                        batch_data = []
-                        print(f"  📈 {count:,} 件処理完了 ({datetime.now() - start_time})")
-                
-                except Exception as e:
-                    error_count += 1
-                    if error_count <= 10:  # 最初の10エラーのみ表示
-                        print(f"  ⚠️  行 {row_num} でエラー: {str(e)[:100]}")
-                    continue
-            
-            # 残りのデータを挿入
-            if batch_data:
-                cursor.executemany('''
-                    INSERT OR IGNORE INTO companies (
-                        corporate_number, process_type, correct_flag, update_date, 
-                        change_date, company_name, company_name_kana, prefecture_code, 
-                        city_code, street_address, business_category, capital, 
-                        employee_count, status, close_date, close_reason, 
-                        successor_corporate_number, change_reason, assignment_date, 
-                        latest_update_date, en_company_name, en_address_line, 
-                        en_prefecture_name, en_city_name, en_address_outside_city, 
-                        nearest_station
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', [row[1:] for row in batch_data])
-                conn.commit()
+            count, error_count = loaded
         
         print(f"📊 データ挿入完了: {count:,} 件")
         if error_count > 0:
             print(f"⚠️  エラー行数: {error_count} 件")
         
-        # インデックス作成（検索高速化）
-        print("🔍 インデックス作成中...")
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_company_name ON companies(company_name)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_corporate_number ON companies(corporate_number)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_company_name_kana ON companies(company_name_kana)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_status ON companies(status)')
-        
-        print("✅ インデックス作成完了")
+        if not bulk:
+            # インデックス作成（検索高速化）
+            create_indexes(conn)
+            write_checkpoint(conn, csv_file, os.path.getsize(csv_file), count, error_count, status=STATUS_COMPLETE)
+            conn.commit()
         
         # 統計情報取得
         cursor.execute('SELECT COUNT(*) FROM companies')
@@ -217,27 +472,32 @@ def create_corporate_database():
         print(f"❌ エラーが発生しました: {str(e)}")
         if 'conn' in locals():
             conn.close()
-        if os.path.exists(db_path):
-            os.remove(db_path)
+        if bulk:
+            # ジャーナル無効でロード中のため途中の DB は使えない
+            if os.path.exists(db_path):
+                os.remove(db_path)
+        elif os.path.exists(db_path):
+            # コミット済みのバッチは残し、再実行時にチェックポイントから再開する
+            print("⏸️  再実行すると最後にコミットしたバッチの続きから再開します")
         return False
 
 def main():
     """メイン関数"""
-    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
-        print("CompanyGenius データベース作成スクリプト")
-        print("")
-        print("使用方法:")
-        print("  python create_database.py")
-        print("")
-        print("前提条件:")
-        print("  - 法人番号公表システムのCSVファイルが同じディレクトリにある")
-        print("  - ./data/ ディレクトリへの書き込み権限")
-        print("")
-        print("出力:")
-        print("  ./data/corporate_phase2_stable.db")
-        return
+    parser = argparse.ArgumentParser(
+        description="CompanyGenius データベース作成スクリプト",
+        epilog=(
+            "前提条件: 法人番号公表システムのCSVファイルが同じディレクトリにあること、"
+            "./data/ への書き込み権限。出力: ./data/corporate_phase2_stable.db"
+        )
+    )
+    parser.add_argument(
+        '--bulk',
+        action='store_true',
+        help="バルクロード（別プロセスで解析・ロード中のみジャーナル無効・法人番号順に挿入・索引は最後に作成）"
+    )
+    args = parser.parse_args()
     
-    success = create_corporate_database()
+    success = create_corporate_database(bulk=args.bulk)
     
     if success:
         print("\n✅ セットアップ完了")
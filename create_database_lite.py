@@ -15,6 +15,11 @@ import glob
 import sys
 from datetime import datetime
 
+from phase15_import_checkpoint import OffsetLineReader, STATUS_COMPLETE, resumable_checkpoint, write_checkpoint
+
+# 挿入バッチ（チェックポイントの間隔）
+LITE_BATCH_SIZE = 1000
+
 class CompanyGeniusLiteBuilder:
     """CompanyGenius Lite データベース作成（EDINETコードリスト版）"""
     
@@ -78,15 +83,13 @@ class CompanyGeniusLiteBuilder:
                 print("❌ CSVファイルの文字コードを特定できません")
                 return False
             
-            # CSVファイル読み込み
-            with open(self.csv_file, 'r', encoding=encoding) as f:
+            # CSVファイル読み込み（各行の終端バイト位置をチェックポイント用に保持）
+            with open(self.csv_file, 'rb') as f:
+                lines = OffsetLineReader(f, encoding=encoding)
                 # BOM除去
-                content = f.read()
-                if content.startswith('\ufeff'):
-                    content = content[1:]
-                
-                lines = content.splitlines()
-                reader = csv.DictReader(lines)
+                reader = csv.DictReader(
+                    line[1:] if line.startswith('\ufeff') else line for line in lines
+                )
                 
                 company_count = 0
                 for row in reader:
@@ -128,7 +131,8 @@ class CompanyGeniusLiteBuilder:
                                        row.get('submitterIndustry', '')).strip(),
                             'location': (row.get('所在地') or 
                                        row.get('LOCATION') or 
-                                       row.get('location', '')).strip()
+                                       row.get('location', '')).strip(),
+                            'source_offset': lines.offset
                         }
                         
                         self.companies.append(company_info)
@@ -148,8 +152,20 @@ class CompanyGeniusLiteBuilder:
         # データディレクトリ作成
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        # 既存データベースの確認
+        # 中断した作成の再開
+        checkpoint = None
         if os.path.exists(self.db_path):
+            checkpoint, _ = resumable_checkpoint(self.db_path, self.csv_file)
+            if checkpoint is not None:
+                response = input(
+                    f"⏸️  中断したLiteデータベース作成が見つかりました: {checkpoint['row_count']} 社"
+                    f"（{checkpoint['updated_at']}）\n続きから再開しますか？ (Y/n): "
+                )
+                if response.lower() in ['n', 'no']:
+                    checkpoint = None
+        
+        # 既存データベースの確認
+        if os.path.exists(self.db_path) and checkpoint is None:
             response = input(f"⚠️  既存のLiteデータベースが見つかりました: {self.db_path}\n上書きしますか？ (y/N): ")
             if response.lower() not in ['y', 'yes']:
                 print("❌ 処理を中止しました")
@@ -159,41 +175,51 @@ class CompanyGeniusLiteBuilder:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # CompanyGenius Lite テーブル作成
-        cursor.execute('''
-            CREATE TABLE companies_lite (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                edinet_code TEXT UNIQUE,
-                company_name TEXT,
-                company_name_en TEXT,
-                company_name_kana TEXT,
-                securities_code TEXT,
-                corporate_number TEXT,
-                listing_classification TEXT,
-                industry TEXT,
-                location TEXT,
-                last_updated TEXT
-            )
-        ''')
-        
-        # ユーザー修正データテーブル（フル版と共通構造）
-        cursor.execute('''
-            CREATE TABLE user_corrections (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                original_query TEXT,
-                predicted_name TEXT,
-                correct_name TEXT,
-                correction_date TEXT,
-                confidence REAL DEFAULT 1.0
-            )
-        ''')
+        if checkpoint is None:
+            # CompanyGenius Lite テーブル作成
+            cursor.execute('''
+                CREATE TABLE companies_lite (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    edinet_code TEXT UNIQUE,
+                    company_name TEXT,
+                    company_name_en TEXT,
+                    company_name_kana TEXT,
+                    securities_code TEXT,
+                    corporate_number TEXT,
+                    listing_classification TEXT,
+                    industry TEXT,
+                    location TEXT,
+                    last_updated TEXT
+                )
+            ''')
         
-        # データ挿入
-        for company in self.companies:
+            # ユーザー修正データテーブル（フル版と共通構造）
             cursor.execute('''
+                CREATE TABLE user_corrections (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    original_query TEXT,
+                    predicted_name TEXT,
+                    correct_name TEXT,
+                    correction_date TEXT,
+                    confidence REAL DEFAULT 1.0
+                )
+            ''')
+        
+        # データ挿入（LITE_BATCH_SIZE 件ごとにチェックポイントと一緒にコミット）
+        if checkpoint is not None:
+            companies = [c for c in self.companies if c['source_offset'] > checkpoint['byte_offset']]
+            inserted = checkpoint['row_count']
+            print(f"⏩ {inserted} 社目（{checkpoint['byte_offset']:,} バイト）から再開")
+        else:
+            companies = self.companies
+            inserted = 0
+        
+        for start in range(0, len(companies), LITE_BATCH_SIZE):
+            batch = companies[start:start + LITE_BATCH_SIZE]
+            cursor.executemany('''
                 INSERT OR REPLACE INTO companies_lite VALUES 
                 (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            ''', [(
                 None,
                 company['edinet_code'],
                 company['submitter_name'],
@@ -205,18 +231,22 @@ class CompanyGeniusLiteBuilder:
                 company['industry'],
                 company['location'],
                 datetime.now().isoformat()
-            ))
+            ) for company in batch])
+            inserted += len(batch)
+            write_checkpoint(conn, self.csv_file, batch[-1]['source_offset'], inserted)
+            conn.commit()
         
         # 検索用インデックス
         print("🔍 検索インデックス作成中...")
-        cursor.execute('CREATE INDEX idx_lite_name ON companies_lite(company_name)')
-        cursor.execute('CREATE INDEX idx_lite_kana ON companies_lite(company_name_kana)')
-        cursor.execute('CREATE INDEX idx_lite_securities ON companies_lite(securities_code)')
-        cursor.execute('CREATE INDEX idx_lite_edinet ON companies_lite(edinet_code)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lite_name ON companies_lite(company_name)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lite_kana ON companies_lite(company_name_kana)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lite_securities ON companies_lite(securities_code)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_lite_edinet ON companies_lite(edinet_code)')
         
         # ユーザー修正データ用インデックス
-        cursor.execute('CREATE INDEX idx_corrections_query ON user_corrections(original_query)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_corrections_query ON user_corrections(original_query)')
         
+        write_checkpoint(conn, self.csv_file, os.path.getsize(self.csv_file), inserted, status=STATUS_COMPLETE)
         conn.commit()
         conn.close()
         
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 統合回答テーブル（Level 4 法人番号DB のマテリアライズ）
+正規化クエリ → 法人番号DBの最良回答 をオフラインでコンパイルし、mmap したハッシュ表から O(1) で引く
+Level 1（ユーザー修正）と Level 2/5（ブランドレジストリ）は実行時に更新・再読み込みされるため含めない
+（テーブルはそれらの後に参照し、コンパイル後の修正・ブランド追加を隠さない）
+
+ファイル形式（リトルエンディアン）:
+    ヘッダー  : MAGIC(8) | version u32 | entry_count u64 | slot_count u64 | source_len u32
+    生成元    : source_len バイトの JSON（コンパイル元 DB のスキーマ指紋・MAX(rowid)・メタデータ更新時刻）
+    スロット  : slot_count × u64（レコードへの絶対オフセット、0 は空き）
+    レコード  : key_len u16 | key(UTF-8) | value_len u32 | value(JSON UTF-8)
+"""
+
+import mmap
+import struct
+import hashlib
+import json
+import os
+import sys
+import sqlite3
+import argparse
+import tempfile
+from datetime import datetime
+
+from phase15_db_metadata import METADATA_TABLE, schema_fingerprint
+
+MAGIC = b'CGANSWR\x00'
+# v2: Level 4 のみ（v1 は Level 1/2/5 を含むため読み込まない）
+# v3: 生成元 DB の記録（なければ DB と照合できないため読み込まない）
+FORMAT_VERSION = 3
+HEADER = struct.Struct('<8sIQQI')
+SLOT = struct.Struct('<Q')
+KEY_LEN = struct.Struct('<H')
+VALUE_LEN = struct.Struct('<I')
+
+DEFAULT_TABLE_PATH = './data/answer_table.bin'
+
+# 収録する段階（同じキーは先に登録した回答が優先）
+LEVEL_PRIORITY = [
+    'level4_corporate_number'
+]
+
+
+def source_stamp(conn):
+    """DB の同一性の目印: スキーマ指紋・MAX(rowid)・メタデータの構築/差分更新時刻
+
+    行の追加は MAX(rowid)、update_database.py による商号変更・削除はメタデータの updated_at で検出する。
+    """
+    max_rowid = conn.execute("SELECT MAX(rowid) FROM corporate_master").fetchone()[0] or 0
+    try:
+        metadata = dict(conn.execute(
+            f"SELECT key, value FROM {METADATA_TABLE} WHERE key IN ('built_at', 'updated_at')"
+        ).fetchall())
+    except sqlite3.OperationalError:
+        metadata = {}
+    return {
+        'schema_fingerprint': schema_fingerprint(conn),
+        'max_rowid': max_rowid,
+        'built_at': metadata.get('built_at'),
+        'updated_at': metadata.get('updated_at')
+    }
+
+
+def _slot_hash(key_bytes):
+    """プロセス間で安定したハッシュ（組み込み hash() はランダム化されるため使わない）"""
+    return int.from_bytes(hashlib.blake2b(key_bytes, digest_size=8).digest(), 'little')
+
+
+class AnswerTable:
+    """mmap 読み取り専用の回答テーブル"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.entry_count, self.slot_count, source_len = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported answer table format: {path}")
+        self.source = json.loads(self._mm[HEADER.size:HEADER.size + source_len])
+        self._slots_base = HEADER.size + source_len
+        self._mask = self.slot_count - 1
+
+        self.stats = {'lookups': 0, 'hits': 0}
+
+    def get(self, key):
+        """正規化済みキーで回答を取得（なければ None）"""
+        self.stats['lookups'] += 1
+        key_bytes = key.encode('utf-8')
+        slot = _slot_hash(key_bytes) & self._mask
+
+        # 線形探索（負荷率 0.5 以下なので探索長は短い）
+        for _ in range(self.slot_count):
+            (offset,) = SLOT.unpack_from(self._mm, self._slots_base + slot * SLOT.size)
+            if offset == 0:
+                return None
+            (key_len,) = KEY_LEN.unpack_from(self._mm, offset)
+            start = offset + KEY_LEN.size
+            if self._mm[start:start + key_len] == key_bytes:
+                (value_len,) = VALUE_LEN.unpack_from(self._mm, start + key_len)
+                value_start = start + key_len + VALUE_LEN.size
+                self.stats['hits'] += 1
+                return json.loads(self._mm[value_start:value_start + value_len])
+            slot = (slot + 1) & self._mask
+        return None
+
+    def __len__(self):
+        return self.entry_count
+
+    def close(self):
+        if getattr(self, '_mm', None) is not None:
+            self._mm.close()
+            self._mm = None
+        if getattr(self, '_file', None) is not None:
+            self._file.close()
+            self._file = None
+
+    def get_stats(self):
+        return {'path': self.path, 'entries': self.entry_count, **self.stats}
+
+
+def load_answer_table(path, db_path):
+    """回答テーブルを開く（ファイルがない・形式が古い・db_path の DB と生成元が一致しなければ None）"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        table = AnswerTable(path)
+    except ValueError as e:
+        print(f"⚠️  {e} - recompile with phase15_answer_table.py")
+        return None
+
+    # 生成後に DB が差し替え・差分更新されていれば、削除・商号変更前の回答を返すため使わない
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+        try:
+            current = source_stamp(conn)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"⚠️  Answer table not verified against {db_path}: {e}")
+        table.close()
+        return None
+    if table.source != current:
+        print(f"⚠️  Answer table is stale ({path}) - recompile with phase15_answer_table.py --db {db_path}")
+        table.close()
+        return None
+    return table
+
+
+class AnswerTableWriter:
+    """回答テーブルのコンパイル（先に追加したキーが優先）"""
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.source = source or {}
+        self._records = tempfile.TemporaryFile()
+        self._offsets = {}  # key bytes -> records 内オフセット
+        self._size = 0
+
+    def add(self, key, answer):
+        """キーが未登録なら追加。追加したら True"""
+        if not key:
+            return False
+        key_bytes = key.encode('utf-8')
+        if key_bytes in self._offsets or len(key_bytes) > 0xFFFF:
+            return False
+
+        value = json.dumps(answer, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        record = KEY_LEN.pack(len(key_bytes)) + key_bytes + VALUE_LEN.pack(len(value)) + value
+        self._offsets[key_bytes] = self._size
+        self._records.write(record)
+        self._size += len(record)
+        return True
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def write(self):
+        """スロット表を組み立てて原子的に書き出す"""
+        slot_count = 1
+        while slot_count < max(2 * len(self._offsets), 16):
+            slot_count <<= 1
+        mask = slot_count - 1
+        source = json.dumps(self.source, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        records_base = HEADER.size + len(source) + slot_count * SLOT.size
+
+        slots = bytearray(slot_count * SLOT.size)
+        for key_bytes, offset in self._offsets.items():
+            slot = _slot_hash(key_bytes) & mask
+            while SLOT.unpack_from(slots, slot * SLOT.size)[0] != 0:
+                slot = (slot + 1) & mask
+            SLOT.pack_into(slots, slot * SLOT.size, records_base + offset)
+
+        # 稼働中サーバーの mmap を壊さないよう一時ファイル経由で置き換える
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self._offsets), slot_count, len(source)))
+                out.write(source)
+                out.write(slots)
+                self._records.seek(0)
+                while True:
+                    chunk = self._records.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self._records.close()
+
+
+def compile_answer_table(output_path, db_path):
+    """法人番号DBから回答テーブルを生成"""
+    from phase15_final_system import normalize_query
+
+    print("🧩 Compiling unified answer table...")
+    started = datetime.now()
+
+    if not db_path or not os.path.exists(db_path):
+        print(f"❌ Corporate database not found: {db_path}")
+        return False
+
+    counts = {level: 0 for level in LEVEL_PRIORITY}
+
+    # Level 4: 法人番号DB（完全一致 → 前株/後株パターン）
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    try:
+        # 読み込み中に DB が書き換えられても生成元の記録と内容が食い違わないよう、1トランザクションで読む
+        conn.execute("BEGIN")
+        writer = AnswerTableWriter(output_path, source_stamp(conn))
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(corporate_master)")}
+
+        cursor = conn.execute(
+            "SELECT name, corporate_number, prefecture_name FROM corporate_master ORDER BY rowid"
+        )
+        for name, corporate_number, prefecture in cursor:
+            if name and writer.add(normalize_query(name), {
+                'prediction': name,
+                'confidence': 0.95,
+                'source': 'corporate_number_exact',
+                'corporate_number': corporate_number,
+                'prefecture': prefecture,
+                'level': 'level4_corporate_number'
+            }):
+                counts['level4_corporate_number'] += 1
+
+        if 'core_name' in columns:
+            cursor = conn.execute("""
+                SELECT core_name, name, corporate_number, prefecture_name
+                FROM corporate_master
+                WHERE legal_form = '株式会社'
+                ORDER BY legal_form_position = '後', rowid
+            """)
+            for core_name, name, corporate_number, prefecture in cursor:
+                if writer.add(normalize_query(core_name), {
+                    'prediction': name,
+                    'confidence': 0.92,
+                    'source': 'corporate_number_pattern',
+                    'corporate_number': corporate_number,
+                    'prefecture': prefecture,
+                    'level': 'level4_corporate_number'
+                }):
+                    counts['level4_corporate_number'] += 1
+        else:
+            print("⚠️  core_name column not found - pattern answers skipped (run build_corporate_index.py)")
+    finally:
+        conn.close()
+
+    writer.write()
+
+    print(f"✅ Answer table written: {output_path}")
+    for level, count in counts.items():
+        print(f"  {level}: {count:,}")
+    print(f"  total: {sum(counts.values()):,} ({datetime.now() - started})")
+    return True
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="Phase 15 統合回答テーブルのコンパイル")
+    parser.add_argument(
+        '--db',
+        default=os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db'),
+        help="法人番号データベース（既定: $DATABASE_PATH）"
+    )
+    parser.add_argument(
+        '--out',
+        default=os.getenv('ANSWER_TABLE_PATH', DEFAULT_TABLE_PATH),
+        help="出力ファイル（既定: $ANSWER_TABLE_PATH）"
+    )
+    args = parser.parse_args()
+
+    ok = compile_answer_table(args.out, args.db)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
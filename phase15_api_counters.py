@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: API サーバーの集計（一定メモリ）と修正IDの連番
+CharsetStats     : 直近の予測サンプルをリングバッファ（deque maxlen）に保持し、全件は集計カウンタのみ
+CorrectionSequence: 修正IDを <corrections.log>.seq に保存した連番から払い出す
+                    （スレッド間はロック、pre-fork ワーカー間は flock で直列化。再起動後も続きから）
+
+CharsetStats はプロセス内の集計（pre-fork 時はワーカーごと）。
+"""
+
+import os
+import threading
+from collections import deque, Counter
+
+try:
+    import fcntl
+except ImportError:  # Windows: プロセス間ロックなし（単一プロセス前提）
+    fcntl = None
+
+# 直近サンプルの保持件数
+CHARSET_SAMPLE_SIZE = int(os.getenv('CHARSET_SAMPLE_SIZE', '1000'))
+
+# 連番ファイルの桁数（固定長で上書きするため途中で切り詰められない）
+SEQUENCE_WIDTH = 20
+
+
+def has_japanese(text):
+    """ひらがな・カタカナ・漢字を含むか"""
+    return any('\u3040' <= c <= '\u309F' or '\u30A0' <= c <= '\u30FF' or '\u4E00' <= c <= '\u9FAF' for c in text)
+
+
+class CharsetStats:
+    """予測クエリの文字コード品質集計（直近 max_samples 件 + 全件カウンタ）"""
+
+    def __init__(self, max_samples=CHARSET_SAMPLE_SIZE):
+        self.max_samples = max_samples
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.total = 0
+        self.japanese = 0
+        self.with_issues = 0
+        self.issue_counts = Counter()  # 問題の種類は check_charset_quality の固定パターンのみ
+
+    def record(self, sample):
+        """1件記録（sample: query, has_japanese, charset_issues, ...）"""
+        with self._lock:
+            self._samples.append(sample)
+            self.total += 1
+            self.japanese += bool(sample['has_japanese'])
+            if sample['charset_issues']:
+                self.with_issues += 1
+                self.issue_counts.update(sample['charset_issues'])
+
+    def recent(self, limit=None):
+        """直近のサンプル（新しい順）"""
+        with self._lock:
+            samples = list(self._samples)
+        samples.reverse()
+        return samples[:limit] if limit is not None else samples
+
+    def get_stats(self):
+        """集計値（日本語クエリ率・文字コード問題率）"""
+        with self._lock:
+            total = self.total
+            return {
+                'total_queries': total,
+                'japanese_queries': self.japanese,
+                'japanese_ratio': self.japanese / total if total else 0.0,
+                'queries_with_issues': self.with_issues,
+                'charset_issue_rate': self.with_issues / total if total else 0.0,
+                'issue_counts': dict(self.issue_counts),
+                'recent_samples': len(self._samples),
+                'max_samples': self.max_samples
+            }
+
+
+class CorrectionSequence:
+    """修正IDの連番（ファイル永続・単調増加）"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def next(self):
+        """次の ID を払い出す"""
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.read(fd, SEQUENCE_WIDTH).strip()
+                value = int(data) + 1 if data else 1
+                os.lseek(fd, 0, os.SEEK_SET)
+                os.write(fd, f"{value:0{SEQUENCE_WIDTH}d}".encode('ascii'))
+                return value
+            finally:
+                # close で flock も解放される
+                os.close(fd)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 大量バッチ予測ジョブ
+数万〜数十万件の企業名リストを受け付け、重複を除いてチャンク単位でバックグラウンド処理する。
+進捗と結果は SQLite に保存するため、pre-fork の別ワーカーからも参照・ページングできる。
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_JOBS_DB = './data/batch_jobs.db'
+MAX_JOB_QUERIES = int(os.getenv('BATCH_JOB_MAX_QUERIES', '200000'))
+JOB_CHUNK_SIZE = int(os.getenv('BATCH_JOB_CHUNK_SIZE', '500'))
+JOB_WORKERS = int(os.getenv('BATCH_JOB_WORKERS', '1'))
+JOB_TTL_SECONDS = float(os.getenv('BATCH_JOB_TTL', str(24 * 3600)))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS batch_jobs (
+        job_id TEXT PRIMARY KEY,
+        status TEXT NOT NULL,
+        total_queries INTEGER NOT NULL,
+        unique_queries INTEGER NOT NULL,
+        processed_queries INTEGER NOT NULL DEFAULT 0,
+        failed_queries INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        error TEXT,
+        pid INTEGER
+    );
+    CREATE TABLE IF NOT EXISTS batch_job_queries (
+        job_id TEXT NOT NULL,
+        query_id INTEGER NOT NULL,
+        query TEXT NOT NULL,
+        result TEXT,
+        PRIMARY KEY (job_id, query_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS batch_job_positions (
+        job_id TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        query_id INTEGER NOT NULL,
+        PRIMARY KEY (job_id, position)
+    ) WITHOUT ROWID;
+"""
+
+
+class BatchJobError(ValueError):
+    """ジョブ投入時の入力エラー（HTTP 400 相当）"""
+
+
+class BatchJobManager:
+    """バッチジョブの投入・処理・進捗/結果参照"""
+
+    def __init__(self, predict_chunk, db_path=None, workers=JOB_WORKERS, chunk_size=JOB_CHUNK_SIZE):
+        """
+        predict_chunk: クエリのリストを受け取り、同じ順序で結果 dict のリストを返す関数
+        """
+        self.predict_chunk = predict_chunk
+        self.db_path = db_path or os.getenv('BATCH_JOBS_DB', DEFAULT_JOBS_DB)
+        self.chunk_size = chunk_size
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-job')
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _ensure_schema(self):
+        with self._init_lock:
+            if self._initialized:
+                return
+            directory = os.path.dirname(os.path.abspath(self.db_path))
+            os.makedirs(directory, exist_ok=True)
+            conn = self._connect()
+            try:
+                # 処理中ワーカーの書き込みと他ワーカーの参照を並行させる
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                conn.commit()
+            finally:
+                conn.close()
+            self._initialized = True
+
+    def submit(self, queries):
+        """ジョブ登録（重複除去）して処理を開始。ジョブ情報を返す"""
+        if not isinstance(queries, list) or not queries:
+            raise BatchJobError("'queries' must be a non-empty list")
+        if len(queries) > MAX_JOB_QUERIES:
+            raise BatchJobError(f"Too many queries: {len(queries):,} (max {MAX_JOB_QUERIES:,})")
+        if not all(isinstance(query, str) for query in queries):
+            raise BatchJobError("All queries must be strings")
+
+        self._ensure_schema()
+        self.cleanup_expired()
+
+        # 重複除去: 同じクエリは1回だけ予測し、結果を全出現位置で共有する
+        query_ids = {}
+        positions = []
+        for query in queries:
+            positions.append(query_ids.setdefault(query, len(query_ids)))
+
+        job_id = uuid.uuid4().hex
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO batch_jobs (job_id, status, total_queries, unique_queries, created_at, pid)
+                    VALUES (?, 'queued', ?, ?, ?, ?)
+                    """,
+                    (job_id, len(queries), len(query_ids), time.time(), os.getpid())
+                )
+                conn.executemany(
+                    "INSERT INTO batch_job_queries (job_id, query_id, query) VALUES (?, ?, ?)",
+                    ((job_id, query_id, query) for query, query_id in query_ids.items())
+                )
+                conn.executemany(
+                    "INSERT INTO batch_job_positions (job_id, position, query_id) VALUES (?, ?, ?)",
+                    ((job_id, position, query_id) for position, query_id in enumerate(positions))
+                )
+        finally:
+            conn.close()
+
+        print(f"📦 Batch job {job_id}: {len(queries):,} queries ({len(query_ids):,} unique)")
+        self.executor.submit(self._run_job, job_id)
+        return self.get_job(job_id)
+
+    def _run_job(self, job_id):
+        """チャンク単位で予測し、チャンクごとに結果と進捗を確定する"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE batch_jobs SET status = 'running', started_at = ?, pid = ? WHERE job_id = ?",
+                    (time.time(), os.getpid(), job_id)
+                )
+
+            last_id = -1
+            while True:
+                rows = conn.execute(
+                    """
+                    SELECT query_id, query FROM batch_job_queries
+                    WHERE job_id = ? AND query_id > ?
+                    ORDER BY query_id LIMIT ?
+                    """,
+                    (job_id, last_id, self.chunk_size)
+                ).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1]['query_id']
+
+                chunk = [row['query'] for row in rows]
+                try:
+                    results = self.predict_chunk(chunk)
+                    encoded = [
+                        json.dumps({'status': 'ok', **result}, ensure_ascii=False)
+                        for result in results
+                    ]
+                    failed = 0
+                except Exception:
+                    # チャンク単位の失敗は1件ずつ再試行して失敗クエリを特定する
+                    encoded, failed = self._predict_one_by_one(chunk)
+
+                with conn:
+                    conn.executemany(
+                        "UPDATE batch_job_queries SET result = ? WHERE job_id = ? AND query_id = ?",
+                        ((value, job_id, row['query_id']) for value, row in zip(encoded, rows))
+                    )
+                    conn.execute(
+                        """
+                        UPDATE batch_jobs
+                        SET processed_queries = processed_queries + ?, failed_queries = failed_queries + ?
+                        WHERE job_id = ?
+                        """,
+                        (len(rows), failed, job_id)
+                    )
+
+            with conn:
+                conn.execute(
+                    "UPDATE batch_jobs SET status = 'completed', finished_at = ? WHERE job_id = ?",
+                    (time.time(), job_id)
+                )
+            print(f"✅ Batch job {job_id} completed")
+        except Exception as e:
+            print(f"❌ Batch job {job_id} failed: {e}")
+            try:
+                with conn:
+                    conn.execute(
+                        "UPDATE batch_jobs SET status = 'failed', finished_at = ?, error = ? WHERE job_id = ?",
+                        (time.time(), str(e), job_id)
+                    )
+            except sqlite3.Error:
+                pass
+        finally:
+            conn.close()
+
+    def _predict_one_by_one(self, chunk):
+        encoded = []
+        failed = 0
+        for query in chunk:
+            try:
+                result = self.predict_chunk([query])[0]
+                encoded.append(json.dumps({'status': 'ok', **result}, ensure_ascii=False))
+            except Exception as e:
+                failed += 1
+                encoded.append(json.dumps({'status': 'error', 'error': str(e)}, ensure_ascii=False))
+        return encoded, failed
+
+    def get_job(self, job_id):
+        """ジョブの状態・進捗（存在しなければ None）"""
+        self._ensure_schema()
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM batch_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+
+        job = dict(row)
+        if job['status'] in ('queued', 'running') and not _process_alive(job['pid']):
+            # 処理していたワーカーが終了した（再起動など）
+            job['status'] = 'failed'
+            job['error'] = 'worker process exited before the job finished'
+
+        unique = job['unique_queries']
+        job['progress'] = job['processed_queries'] / unique if unique else 1.0
+        job['duplicates_removed'] = job['total_queries'] - unique
+        job.pop('pid', None)
+        return job
+
+    def get_results(self, job_id, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """入力順の結果ページ（未処理のクエリは status=pending）"""
+        job = self.get_job(job_id)
+        if job is None:
+            return None
+
+        offset = max(0, int(offset))
+        limit = min(max(1, int(limit)), MAX_PAGE_SIZE)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                """
+                SELECT p.position, q.query, q.result
+                FROM batch_job_positions p
+                JOIN batch_job_queries q ON q.job_id = p.job_id AND q.query_id = p.query_id
+                WHERE p.job_id = ? AND p.position >= ?
+                ORDER BY p.position
+                LIMIT ?
+                """,
+                (job_id, offset, limit)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        results = []
+        for row in rows:
+            item = {'position': row['position'], 'query': row['query']}
+            item.update(json.loads(row['result']) if row['result'] is not None else {'status': 'pending'})
+            results.append(item)
+
+        next_offset = offset + len(results)
+        return {
+            'job_id': job_id,
+            'status': job['status'],
+            'progress': job['progress'],
+            'total_queries': job['total_queries'],
+            'offset': offset,
+            'limit': limit,
+            'results': results,
+            'next_offset': next_offset if next_offset < job['total_queries'] else None
+        }
+
+    def cleanup_expired(self):
+        """TTL を過ぎた完了ジョブを削除"""
+        cutoff = time.time() - JOB_TTL_SECONDS
+        conn = self._connect()
+        try:
+            expired = [
+                row['job_id'] for row in conn.execute(
+                    "SELECT job_id FROM batch_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                    (cutoff,)
+                )
+            ]
+            if expired:
+                with conn:
+                    for table in ('batch_job_positions', 'batch_job_queries', 'batch_jobs'):
+                        conn.executemany(f"DELETE FROM {table} WHERE job_id = ?", ((job_id,) for job_id in expired))
+        finally:
+            conn.close()
+        return len(expired)
+
+
+def _process_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
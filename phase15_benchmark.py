@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 性能ベンチマーク
+- search: Level 4 部分一致検索の LIKE 全件走査と FTS5 trigram 索引の比較
+- load  : 稼働中 API サーバーへの並列負荷（スループット・レイテンシ）
+- serving: DB 接続モード別のワーカーあたりメモリと cold/warm レイテンシ
+          （従来のヒープキャッシュ vs immutable + mmap）
+- keepalive: 逐次リクエストのレイテンシ（毎回新規 TCP 接続 vs HTTP/1.1 持続的接続）
+"""
+
+import sqlite3
+import time
+import os
+import sys
+import argparse
+import statistics
+import json
+import urllib.request
+import urllib.parse
+import urllib.error
+import http.client
+import random
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from build_corporate_index import FTS_TABLE, FTS_MIN_QUERY_LENGTH
+from phase15_db_pool import SQLiteConnectionPool, DEFAULT_SERVING_MMAP_SIZE
+
+# 現行の部分一致SQL（全件走査）
+SQL_LIKE_SCAN = """
+    SELECT name, corporate_number, prefecture_name
+    FROM corporate_master
+    WHERE name LIKE ?
+    ORDER BY LENGTH(name), rowid
+    LIMIT 1
+"""
+
+# FTS5 trigram 索引SQL
+SQL_FTS_INDEX = f"""
+    SELECT m.name, m.corporate_number, m.prefecture_name
+    FROM {FTS_TABLE} f
+    JOIN corporate_master m ON m.rowid = f.rowid
+    WHERE f.name LIKE ?
+    ORDER BY m.name_length, m.rowid
+    LIMIT 1
+"""
+
+# 配信モード（serving ベンチマーク）: 従来の接続ごとヒープキャッシュ vs immutable + mmap
+SERVING_MODES = {
+    'heap': {'immutable': False, 'mmap_size': 0, 'cache_size': 200000},
+    'immutable': {'immutable': True, 'mmap_size': DEFAULT_SERVING_MMAP_SIZE, 'cache_size': None},
+}
+
+SQL_EXACT_LOOKUP = """
+    SELECT name, corporate_number, prefecture_name
+    FROM corporate_master
+    WHERE name = ?
+    LIMIT 1
+"""
+
+# 既定のベンチマーククエリ（部分一致に落ちる典型例）
+DEFAULT_QUERIES = [
+    "トヨタ自動", "ソニーグル", "テスト商事", "サンプル工業", "架空工業",
+    "ファーストリテ", "マクドナルド", "存在しない企業名", "山田商店", "東京建設"
+]
+
+
+def percentile(values, pct):
+    """パーセンタイル（最近傍法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(label, timings_ms):
+    """計測結果サマリー表示"""
+    print(f"  {label:<12} avg {statistics.mean(timings_ms):9.2f}ms | "
+          f"p50 {percentile(timings_ms, 50):9.2f}ms | "
+          f"p95 {percentile(timings_ms, 95):9.2f}ms | "
+          f"max {max(timings_ms):9.2f}ms")
+
+
+def run_search_benchmark(db_path, queries, repeat):
+    """LIKE 全件走査 vs FTS5 索引"""
+    print("🔍 Level 4 partial match benchmark: LIKE scan vs FTS5 trigram")
+    print(f"📁 Database: {db_path}")
+    print(f"🧪 Queries: {len(queries)} x {repeat} repeat(s)")
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,))
+    if cursor.fetchone() is None:
+        print(f"❌ {FTS_TABLE} not found - run build_corporate_index.py first")
+        conn.close()
+        return False
+
+    like_timings = []
+    fts_timings = []
+    mismatches = []
+
+    for _ in range(repeat):
+        for query in queries:
+            pattern = f"%{query}%"
+
+            start = time.perf_counter()
+            cursor.execute(SQL_LIKE_SCAN, (pattern,))
+            like_result = cursor.fetchone()
+            like_timings.append((time.perf_counter() - start) * 1000)
+
+            # 3文字未満は本番同様 LIKE 走査にフォールバック
+            sql = SQL_FTS_INDEX if len(query) >= FTS_MIN_QUERY_LENGTH else SQL_LIKE_SCAN
+            start = time.perf_counter()
+            cursor.execute(sql, (pattern,))
+            fts_result = cursor.fetchone()
+            fts_timings.append((time.perf_counter() - start) * 1000)
+
+            if like_result != fts_result and query not in mismatches:
+                mismatches.append(query)
+
+    conn.close()
+
+    print("\n📊 Results")
+    summarize("LIKE scan", like_timings)
+    summarize("FTS5", fts_timings)
+    speedup = statistics.mean(like_timings) / max(statistics.mean(fts_timings), 1e-9)
+    print(f"  Speedup (avg): {speedup:.1f}x")
+
+    if mismatches:
+        print(f"❌ Result mismatch for: {', '.join(mismatches)}")
+        return False
+    print("✅ Identical results for all queries")
+    return True
+
+
+def _send_request(url, query, api):
+    """1リクエスト送信し (成功可否, 所要ms) を返す"""
+    if api == 'fastapi':
+        body = json.dumps({'query': query, 'include_alternatives': False}, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(
+            f"{url}/api/v1/predict", data=body,
+            headers={'Content-Type': 'application/json; charset=utf-8'}
+        )
+    else:
+        request = urllib.request.Request(f"{url}/predict?q={urllib.parse.quote(query)}")
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except (urllib.error.URLError, OSError):
+        ok = False
+    return ok, (time.perf_counter() - start) * 1000
+
+
+def run_load_benchmark(url, api, queries, concurrency_levels, requests_per_level):
+    """並列度ごとのスループット計測"""
+    print(f"🚀 Load benchmark: {url} ({api})")
+    print(f"🧪 {requests_per_level} requests per concurrency level")
+
+    url = url.rstrip('/')
+    all_ok = True
+    for concurrency in concurrency_levels:
+        workload = [queries[i % len(queries)] for i in range(requests_per_level)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(lambda q: _send_request(url, q, api), workload))
+        elapsed = time.perf_counter() - started
+
+        timings = [ms for ok, ms in outcomes if ok]
+        failures = len(outcomes) - len(timings)
+        print(f"\n📊 Concurrency {concurrency}: {len(timings) / elapsed:8.1f} req/s "
+              f"({elapsed:.2f}s, {failures} failed)")
+        if timings:
+            summarize("latency", timings)
+        all_ok = all_ok and failures == 0
+    return all_ok
+
+
+def _keepalive_path(api, query):
+    if api == 'fastapi':
+        return 'POST', '/api/v1/predict', json.dumps({'query': query}, ensure_ascii=False).encode('utf-8')
+    return 'GET', f"/predict?q={urllib.parse.quote(query)}", None
+
+
+def run_keepalive_benchmark(url, api, queries, requests_count):
+    """同じリクエスト列を 新規接続/持続的接続 で逐次送信し、1リクエストあたりのレイテンシを比較"""
+    parsed = urllib.parse.urlsplit(url)
+    host, port = parsed.hostname, parsed.port or 80
+    workload = [queries[i % len(queries)] for i in range(requests_count)]
+    headers = {'Content-Type': 'application/json; charset=utf-8'}
+
+    print(f"🔌 Keep-alive benchmark: {url} ({api})")
+    print(f"🧪 {requests_count} sequential requests per mode")
+
+    def send(conn, query, close):
+        method, path, body = _keepalive_path(api, query)
+        request_headers = dict(headers, Connection='close') if close else headers
+        start = time.perf_counter()
+        conn.request(method, path, body=body, headers=request_headers)
+        response = conn.getresponse()
+        response.read()
+        elapsed = (time.perf_counter() - start) * 1000
+        return response.status == 200, elapsed, response.getheader('Connection', '')
+
+    # ウォームアップ（予測システム・結果キャッシュを両モードで同条件にする）
+    warm = http.client.HTTPConnection(host, port, timeout=30)
+    for query in dict.fromkeys(workload):
+        send(warm, query, close=False)
+    warm.close()
+
+    results = {}
+    # 毎回新規接続（HTTP/1.0 相当: TCP ハンドシェイク + 接続ごとのハンドラー生成）
+    timings, failures = [], 0
+    for query in workload:
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        try:
+            ok, elapsed, _ = send(conn, query, close=True)
+        except (OSError, http.client.HTTPException):
+            ok, elapsed = False, 0.0
+        finally:
+            conn.close()
+        failures += not ok
+        if ok:
+            timings.append(elapsed)
+    results['new conn'] = (timings, failures, len(workload))
+
+    # 持続的接続（サーバーが Connection: close を返した・切断した場合のみ張り直す）
+    timings, failures, connections = [], 0, 1
+    conn = http.client.HTTPConnection(host, port, timeout=30)
+    for query in workload:
+        try:
+            ok, elapsed, connection_header = send(conn, query, close=False)
+        except (OSError, http.client.HTTPException):
+            ok, elapsed, connection_header = False, 0.0, 'close'
+        failures += not ok
+        if ok:
+            timings.append(elapsed)
+        if connection_header.lower() == 'close':
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=30)
+            connections += 1
+    conn.close()
+    results['keep-alive'] = (timings, failures, connections)
+
+    print("\n📊 Results (per request)")
+    for label, (timings, failures, connections) in results.items():
+        if timings:
+            summarize(label, timings)
+        print(f"  {'':<12} connections {connections} | failed {failures}")
+
+    new_timings, keep_timings = results['new conn'][0], results['keep-alive'][0]
+    if new_timings and keep_timings:
+        before, after = statistics.mean(new_timings), statistics.mean(keep_timings)
+        print(f"  Keep-alive reduction (avg): {before - after:.3f}ms/request "
+              f"({(1 - after / before) * 100:.1f}%)")
+        if results['keep-alive'][2] >= len(workload):
+            print("⚠️  Server closed every connection - keep-alive not in effect (HTTP/1.0 or single mode?)")
+    return results['new conn'][1] == 0 and results['keep-alive'][1] == 0
+
+
+def _memory_usage_mb():
+    """自プロセスの RSS / PSS / Private（MB）。PSS は共有ページをプロセス数で按分した値"""
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {'rss': rss, 'pss': rss, 'private': rss}
+    return {
+        'rss': usage.get('Rss', 0.0),
+        'pss': usage.get('Pss', 0.0),
+        'private': usage.get('Private_Clean', 0.0) + usage.get('Private_Dirty', 0.0)
+    }
+
+
+def _drop_os_cache(db_path):
+    """DB ファイルの OS ページキャッシュを破棄（cold 計測用・ベストエフォート）"""
+    if not hasattr(os, 'posix_fadvise'):
+        return False
+    try:
+        fd = os.open(db_path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+        return True
+    except OSError:
+        return False
+
+
+def _serving_worker(db_path, options, names, patterns, barrier, results):
+    """1ワーカー: 接続を開き、同じワークロードを cold → warm の2回実行"""
+    pool = SQLiteConnectionPool(db_path, **options)
+    barrier.wait()
+
+    timings = {}
+    for phase in ('cold', 'warm'):
+        lookup_timings = timings[f'{phase} lookup'] = []
+        scan_timings = timings[f'{phase} scan'] = []
+        with pool.connection() as conn:
+            for name in names:
+                start = time.perf_counter()
+                conn.execute(SQL_EXACT_LOOKUP, (name,)).fetchone()
+                lookup_timings.append((time.perf_counter() - start) * 1000)
+            for pattern in patterns:
+                # 全件走査でテーブル全体のページに触れる（キャッシュ保持量の差が出る）
+                start = time.perf_counter()
+                conn.execute(SQL_LIKE_SCAN, (pattern,)).fetchone()
+                scan_timings.append((time.perf_counter() - start) * 1000)
+
+    results.put({'timings': timings, 'memory': _memory_usage_mb()})
+    pool.close_all()
+
+
+def run_serving_benchmark(db_path, modes, workers, lookups, scans):
+    """配信モード別: ワーカーあたりメモリと cold/warm レイテンシ"""
+    print(f"🗄️  Serving mode benchmark: {workers} worker process(es)")
+    print(f"📁 Database: {db_path} ({os.path.getsize(db_path) / 1024 / 1024:.1f}MB)")
+    print(f"🧪 Workload per pass: {lookups} exact lookups + {scans} LIKE full scans")
+
+    conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    max_rowid = conn.execute("SELECT MAX(rowid) FROM corporate_master").fetchone()[0] or 0
+    rng = random.Random(15)
+    rowids = [rng.randint(1, max_rowid) for _ in range(lookups)] if max_rowid else []
+    names = [
+        row[0] for row in (
+            conn.execute("SELECT name FROM corporate_master WHERE rowid >= ? LIMIT 1", (rowid,)).fetchone()
+            for rowid in rowids
+        ) if row
+    ]
+    conn.close()
+    patterns = [f"%{query}%" for query in DEFAULT_QUERIES[:scans]]
+
+    context = multiprocessing.get_context('fork' if hasattr(os, 'fork') else 'spawn')
+    for mode in modes:
+        options = SERVING_MODES[mode]
+        dropped = _drop_os_cache(db_path)
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(target=_serving_worker, args=(db_path, options, names, patterns, barrier, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        outcomes = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        print(f"\n📊 Mode '{mode}' {options}" + ("" if dropped else " (OS cache not dropped)"))
+        for label in ('cold lookup', 'warm lookup', 'cold scan', 'warm scan'):
+            timings = [ms for outcome in outcomes for ms in outcome['timings'][label]]
+            if timings:
+                summarize(label, timings)
+        for key in ('rss', 'pss', 'private'):
+            values = [outcome['memory'][key] for outcome in outcomes]
+            print(f"  {key.upper() + '/worker':<14} avg {statistics.mean(values):9.1f}MB | "
+                  f"max {max(values):9.1f}MB | total {sum(values):9.1f}MB")
+    return True
+
+
+def main():
+    """メイン実行"""
+    parser = argparse.ArgumentParser(description="Phase 15 性能ベンチマーク")
+    parser.add_argument(
+        '--db',
+        default=os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db'),
+        help="対象データベース（既定: $DATABASE_PATH）"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    search = subparsers.add_parser('search', help="部分一致検索 LIKE vs FTS5")
+    search.add_argument('queries', nargs='*', help="ベンチマーククエリ（省略時は既定セット）")
+    search.add_argument('--repeat', type=int, default=3, help="繰り返し回数")
+
+    load = subparsers.add_parser('load', help="API サーバーへの並列負荷")
+    load.add_argument('queries', nargs='*', help="送信クエリ（省略時は既定セット）")
+    load.add_argument('--url', default='http://localhost:8001', help="サーバーURL")
+    load.add_argument('--api', choices=['fixed', 'fastapi'], default='fixed',
+                      help="fixed: GET /predict?q= / fastapi: POST /api/v1/predict")
+    load.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help="並列度（複数指定可）")
+    load.add_argument('--requests', type=int, default=200, help="並列度ごとのリクエスト数")
+
+    serving = subparsers.add_parser('serving', help="DB 配信モード別のメモリ・cold/warm レイテンシ")
+    serving.add_argument('--modes', nargs='+', choices=sorted(SERVING_MODES), default=['heap', 'immutable'],
+                         help="比較するモード")
+    serving.add_argument('--workers', type=int, default=4, help="ワーカープロセス数")
+    serving.add_argument('--lookups', type=int, default=2000, help="1パスあたりの完全一致検索数")
+    serving.add_argument('--scans', type=int, default=2, help="1パスあたりの LIKE 全件走査数")
+
+    keepalive = subparsers.add_parser('keepalive', help="逐次リクエスト: 新規接続 vs 持続的接続")
+    keepalive.add_argument('queries', nargs='*', help="送信クエリ（省略時は既定セット）")
+    keepalive.add_argument('--url', default='http://localhost:8001', help="サーバーURL")
+    keepalive.add_argument('--api', choices=['fixed', 'fastapi'], default='fixed',
+                           help="fixed: GET /predict?q= / fastapi: POST /api/v1/predict")
+    keepalive.add_argument('--requests', type=int, default=500, help="モードごとのリクエスト数")
+
+    args = parser.parse_args()
+
+    print("🌟 Phase 15 Benchmark")
+    print("📅 Date:", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    print()
+
+    if args.command == 'search':
+        ok = run_search_benchmark(args.db, args.queries or DEFAULT_QUERIES, args.repeat)
+        return 0 if ok else 1
+    if args.command == 'load':
+        ok = run_load_benchmark(
+            args.url, args.api, args.queries or DEFAULT_QUERIES, args.concurrency, args.requests
+        )
+        return 0 if ok else 1
+    if args.command == 'keepalive':
+        ok = run_keepalive_benchmark(args.url, args.api, args.queries or DEFAULT_QUERIES, args.requests)
+        return 0 if ok else 1
+    if args.command == 'serving':
+        ok = run_serving_benchmark(args.db, args.modes, args.workers, args.lookups, args.scans)
+        return 0 if ok else 1
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
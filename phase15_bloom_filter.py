@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 法人番号DB 否定検索用 Bloom フィルタ
+Level 4 の完全一致・法人格パターン検索の前に「確実に存在しない」名称を判定し、
+B-tree 探索（SQL）を省略する。偽陰性はないため検索結果は変わらない。
+
+build_corporate_index.py が全社名（name）と中核名（core_name）から構築し、
+データベースの隣に <db>.bloom として保存する。
+
+ファイル形式（リトルエンディアン）:
+    ヘッダー : MAGIC(8) | version u32 | num_bits u64 | num_hashes u32 | count u64
+               | fp_rate f64 | max_rowid i64
+    本体     : num_bits / 8 バイトのビット配列
+"""
+
+import math
+import struct
+import hashlib
+import os
+import sqlite3
+import tempfile
+
+MAGIC = b'CGBLOOM\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIQIQdq')
+
+DEFAULT_FP_RATE = 0.01
+
+# キーの名前空間（社名と中核名を1つのフィルタに格納）
+BLOOM_NAME = 'name'
+BLOOM_CORE = 'core'
+
+
+def bloom_path_for(db_path):
+    """データベースに対応するフィルタファイルのパス"""
+    return f"{db_path}.bloom"
+
+
+def _key_hashes(namespace, key):
+    """ダブルハッシュ用の2値（プロセス間で安定）"""
+    digest = hashlib.blake2b(f"{namespace}\x00{key}".encode('utf-8'), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return h1, h2
+
+
+class BloomFilter:
+    """ビット配列 + ダブルハッシュの Bloom フィルタ"""
+
+    def __init__(self, num_bits, num_hashes, fp_rate=DEFAULT_FP_RATE, bits=None, count=0, max_rowid=0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.fp_rate = fp_rate
+        self.count = count
+        self.max_rowid = max_rowid
+        self.bits = bits if bits is not None else bytearray((num_bits + 7) // 8)
+
+        self.stats = {
+            'checks': 0,
+            'probes_skipped': 0,
+            'false_positives': 0
+        }
+
+    @classmethod
+    def for_capacity(cls, capacity, fp_rate=DEFAULT_FP_RATE):
+        """想定件数と偽陽性率から最適なビット数・ハッシュ数を決める"""
+        capacity = max(capacity, 1)
+        num_bits = max(8, int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        return cls(num_bits, num_hashes, fp_rate)
+
+    def _positions(self, namespace, key):
+        h1, h2 = _key_hashes(namespace, key)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, namespace, key):
+        bits = self.bits
+        for position in self._positions(namespace, key):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        namespace, key = item
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(namespace, key))
+
+    def check(self, namespace, key):
+        """存在する可能性があれば True。False なら SQL 探索を省略できる"""
+        self.stats['checks'] += 1
+        if (namespace, key) in self:
+            return True
+        self.stats['probes_skipped'] += 1
+        return False
+
+    def record_false_positive(self):
+        """check() が True だったが SQL で見つからなかった"""
+        self.stats['false_positives'] += 1
+
+    def save(self, path):
+        """一時ファイル経由で原子的に書き出す"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(HEADER.pack(
+                    MAGIC, FORMAT_VERSION, self.num_bits, self.num_hashes,
+                    self.count, self.fp_rate, self.max_rowid
+                ))
+                out.write(self.bits)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size:
+                raise ValueError(f"Truncated bloom filter: {path}")
+            magic, version, num_bits, num_hashes, count, fp_rate, max_rowid = HEADER.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported bloom filter format: {path}")
+            bits = bytearray(f.read())
+        if len(bits) != (num_bits + 7) // 8:
+            raise ValueError(f"Truncated bloom filter: {path}")
+        return cls(num_bits, num_hashes, fp_rate, bits=bits, count=count, max_rowid=max_rowid)
+
+    def estimated_fp_rate(self):
+        """登録件数から見積もった現在の偽陽性率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def get_stats(self):
+        # 実測偽陽性率 = 偽陽性 / 実際に存在しなかったキー
+        negatives = self.stats['probes_skipped'] + self.stats['false_positives']
+        return {
+            'keys': self.count,
+            'size_bytes': len(self.bits),
+            'num_hashes': self.num_hashes,
+            'configured_fp_rate': self.fp_rate,
+            'estimated_fp_rate': self.estimated_fp_rate(),
+            'observed_fp_rate': self.stats['false_positives'] / negatives if negatives else 0.0,
+            **self.stats
+        }
+
+
+def load_bloom_filter(db_path, conn):
+    """DB ファイルに対応するフィルタを読み込む（なし・DB と不一致なら None）
+
+    接続プールの generation_resource から DB 世代ごとに呼ばれる。
+    """
+    path = bloom_path_for(db_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        bloom = BloomFilter.load(path)
+        max_rowid = conn.execute("SELECT MAX(rowid) FROM corporate_master").fetchone()[0] or 0
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"⚠️  Bloom filter load error: {e}")
+        return None
+
+    # 構築後に行が追加されていれば偽陰性が起こり得るため使わない
+    if max_rowid != bloom.max_rowid:
+        print(f"⚠️  Bloom filter is stale ({path}) - rebuild with build_corporate_index.py")
+        return None
+    return bloom
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: ブランド・別名レジストリ
+Level 2 / Level 5 のマッピングをデータファイル（JSON/CSV）から一度だけ読み込み、
+不変マッピングとして共有する。ファイル更新時は再起動なしで原子的に差し替える。
+
+JSON形式: {"version": 1, "tables": {"テーブル名": {"別名": ["正式名称", 信頼度]}}}
+CSV形式 : table,alias,name,confidence（ヘッダー行必須）
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from types import MappingProxyType
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'brand_registry.json')
+RELOAD_CHECK_INTERVAL = 30.0  # 秒（ファイル更新確認の間隔）
+
+_EMPTY_TABLE = MappingProxyType({})
+
+
+def _load_registry_file(path):
+    """レジストリファイルを読み込み {テーブル名: MappingProxyType} を返す"""
+    tables = {}
+
+    if path.lower().endswith('.csv'):
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f):
+                alias = (row.get('alias') or '').strip()
+                if not alias:
+                    continue
+                tables.setdefault(row['table'].strip(), {})[alias] = (
+                    row['name'].strip(), float(row['confidence'])
+                )
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for table_name, entries in data.get('tables', {}).items():
+            tables[table_name] = {
+                alias: (name, float(confidence))
+                for alias, (name, confidence) in entries.items()
+            }
+
+    return MappingProxyType({
+        table_name: MappingProxyType(entries) for table_name, entries in tables.items()
+    })
+
+
+class BrandRegistry:
+    """不変スナップショットを差し替えるブランド・別名レジストリ"""
+
+    def __init__(self, path):
+        self.path = path
+        self._reload_lock = threading.Lock()
+        self._snapshot = MappingProxyType({})
+        # 正規化キーの索引 {(テーブル名, 正規化関数): {正規化キー: 値}}（スナップショットごとに作り直す）
+        self._normalized = {}
+        self._mtime = None
+        self._last_check = 0.0
+        self.loaded_at = None
+
+        self.stats = {
+            'reloads': 0,
+            'reload_errors': 0
+        }
+        self.table_stats = {}
+        self._listeners = []
+
+        self.reload()
+
+    def reload(self):
+        """ファイルから再読み込み。失敗時は現行スナップショットを維持"""
+        with self._reload_lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                snapshot = _load_registry_file(self.path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                self.stats['reload_errors'] += 1
+                print(f"⚠️  Brand registry load error ({self.path}): {e}")
+                return False
+
+            # 参照の付け替え1回で切り替えるため、読み取り側はロック不要
+            self._snapshot = snapshot
+            self._normalized = {}
+            self._mtime = mtime
+            self._last_check = time.monotonic()
+            self.loaded_at = time.time()
+            self.stats['reloads'] += 1
+            for table_name in snapshot:
+                self.table_stats.setdefault(table_name, {'lookups': 0, 'hits': 0})
+
+        for callback in self._listeners:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Brand registry listener error: {e}")
+        return True
+
+    def add_reload_listener(self, callback):
+        """再読み込み後に callback() を呼ぶ（結果キャッシュの破棄など）"""
+        self._listeners.append(callback)
+
+    def reload_if_changed(self):
+        """ファイルの更新時刻が変わっていれば再読み込み"""
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        return self.reload()
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._last_check >= RELOAD_CHECK_INTERVAL:
+            self._last_check = now
+            self.reload_if_changed()
+
+    def table(self, table_name):
+        """テーブル全体（読み取り専用マッピング）"""
+        self._maybe_reload()
+        return self._snapshot.get(table_name, _EMPTY_TABLE)
+
+    def _normalized_table(self, table_name, normalize):
+        """normalize(別名) をキーにした索引（同じ正規化キーはファイル内で先の別名が優先）"""
+        normalized = self._normalized
+        key = (table_name, normalize)
+        index = normalized.get(key)
+        if index is None:
+            index = {}
+            for alias, entry in self._snapshot.get(table_name, _EMPTY_TABLE).items():
+                index.setdefault(normalize(alias), entry)
+            normalized[key] = index
+        return index
+
+    def lookup(self, table_name, alias, normalize=None):
+        """別名から (正式名称, 信頼度) を取得（なければ None）
+
+        normalize を渡すと、完全一致がない場合に正規化したキーで引く（'kddi' → 'KDDI' など）
+        """
+        self._maybe_reload()
+        entry = self._snapshot.get(table_name, _EMPTY_TABLE).get(alias)
+        if entry is None and normalize is not None:
+            entry = self._normalized_table(table_name, normalize).get(normalize(alias))
+
+        stats = self.table_stats.get(table_name)
+        if stats is not None:
+            stats['lookups'] += 1
+            if entry is not None:
+                stats['hits'] += 1
+        return entry
+
+    def get_stats(self):
+        """テーブルごとの件数・参照/ヒット数"""
+        snapshot = self._snapshot
+        return {
+            'path': self.path,
+            'loaded_at': self.loaded_at,
+            **self.stats,
+            'tables': {
+                table_name: {
+                    'aliases': len(snapshot.get(table_name, _EMPTY_TABLE)),
+                    **counters
+                }
+                for table_name, counters in self.table_stats.items()
+            }
+        }
+
+
+# プロセス内共有レジストリ
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_brand_registry():
+    """共有レジストリを取得（初回のみファイルを読み込む）"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = BrandRegistry(os.getenv('BRAND_REGISTRY_PATH', DEFAULT_REGISTRY_PATH))
+        return _registry
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: ユーザー修正データ部分一致インデックス
+Level 1 の部分一致（登録キー ⊂ クエリ / クエリ ⊂ 登録キー）を線形走査なしで解決する
+
+- 登録キー ⊂ クエリ: Aho-Corasick オートマトンでクエリを1回走査
+- クエリ ⊂ 登録キー: 全登録キーの接尾辞をソート済みリストに保持し二分探索
+いずれも登録順（dict の挿入順）の順位を持ち、最小順位を返すことで
+従来の「先頭から最初に一致したもの」と同じ結果になる。
+"""
+
+import bisect
+import threading
+from collections import deque
+
+
+class CorrectionIndex:
+    """修正キーの部分一致インデックス（追加のみ・逐次更新）"""
+
+    def __init__(self):
+        self._keys = []    # 順位 -> キー
+        self._ranks = {}   # キー -> 順位
+
+        # Aho-Corasick: ノードごとの遷移・出力（そのノードで終わるキーの順位）
+        self._goto = [{}]
+        self._output = [None]
+        self._fail = [0]
+        self._match_link = [0]  # 失敗リンクを辿った先で最初に出力を持つノード
+        self._links_dirty = False
+        self._lock = threading.Lock()  # 追加・失敗リンク再計算の排他
+
+        # 接尾辞リスト: (接尾辞, 順位) をソート順に保持
+        self._suffixes = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._ranks
+
+    def add(self, key):
+        """キーを追加（既存キーは順位を変えない＝dict の上書きと同じ）"""
+        with self._lock:
+            return self._add(key)
+
+    def add_many(self, keys):
+        """複数キーを登録順に追加（起動時の全件読み込み用。接尾辞はまとめて追加し1回だけソート）
+
+        add() の bisect.insort はリスト挿入が O(接尾辞数) のため、全件を1件ずつ追加すると二乗時間になる。
+        追加したキー数を返す。
+        """
+        with self._lock:
+            added = 0
+            for key in keys:
+                added += self._add(key, sort_suffixes=False)
+            if added:
+                # 既存部分はソート済みのため Timsort は追加分のソート + マージで済む
+                self._suffixes.sort()
+            return added
+
+    def _add(self, key, sort_suffixes=True):
+        if key in self._ranks:
+            return False
+        rank = len(self._keys)
+        self._keys.append(key)
+        self._ranks[key] = rank
+
+        # トライへ挿入（出力は最初に登録された順位を保持）
+        node = 0
+        for char in key:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto.append({})
+                self._output.append(None)
+                self._fail.append(0)
+                self._match_link.append(0)
+                self._goto[node][char] = next_node
+            node = next_node
+        if self._output[node] is None:
+            self._output[node] = rank
+        self._links_dirty = True
+
+        # 接尾辞を挿入（sort_suffixes=False なら末尾に追加し、呼び出し側でソートする）
+        if sort_suffixes:
+            for start in range(len(key)):
+                bisect.insort(self._suffixes, (key[start:], rank))
+        else:
+            self._suffixes.extend((key[start:], rank) for start in range(len(key)))
+        return True
+
+    def _build_links(self):
+        """失敗リンクを再計算（キー追加後の最初の検索時のみ）"""
+        with self._lock:
+            if self._links_dirty:
+                self._build_links_locked()
+
+    def _build_links_locked(self):
+        # 検索中のスレッドが未完成のリンクを見ないよう、組み立ててから差し替える
+        fail = [0] * len(self._goto)
+        match_link = [0] * len(self._goto)
+        queue = deque()
+        for child in self._goto[0].values():
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                state = fail[node]
+                while state and char not in self._goto[state]:
+                    state = fail[state]
+                target = self._goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+
+                linked = fail[child]
+                match_link[child] = linked if self._output[linked] is not None else match_link[linked]
+                queue.append(child)
+
+        self._fail, self._match_link = fail, match_link
+        self._links_dirty = False
+
+    def _best_contained_in(self, text):
+        """text に含まれる登録キーの最小順位"""
+        best = self._output[0]  # 空文字キーは常に含まれる
+        if not self._goto[0]:
+            return best
+        if self._links_dirty:
+            self._build_links()
+
+        goto, output = self._goto, self._output
+        fail, match_link = self._fail, self._match_link
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if node >= len(fail):
+                # リンク再計算後に追加されたノード（次回検索で反映）
+                node = 0
+                continue
+
+            match = node if output[node] is not None else match_link[node]
+            while match:
+                rank = output[match]
+                if best is None or rank < best:
+                    best = rank
+                match = match_link[match]
+        return best
+
+    def _best_containing(self, text):
+        """text を含む登録キーの最小順位"""
+        if not text:
+            return 0 if self._keys else None
+        best = None
+        position = bisect.bisect_left(self._suffixes, (text,))
+        while position < len(self._suffixes):
+            suffix, rank = self._suffixes[position]
+            if not suffix.startswith(text):
+                break
+            if best is None or rank < best:
+                best = rank
+            position += 1
+        return best
+
+    def first_match(self, text):
+        """部分一致する最初（登録順）のキー（なければ None）"""
+        ranks = [
+            rank for rank in (self._best_contained_in(text), self._best_containing(text))
+            if rank is not None
+        ]
+        if not ranks:
+            return None
+        return self._keys[min(ranks)]
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 法人番号DB 世代切り替え（無停止差し替え）
+新しい DB を既存ファイルの隣に構築・検証し、世代ポインタ <DATABASE_PATH>.generation を
+原子的に置き換える。稼働中のサーバーはポインタの変更を検知し、新しいリクエストから新世代の
+ファイルを使う。処理中のリクエストは旧世代の接続のまま完了し、旧接続は順次閉じられる。
+
+ポインタ形式（JSON）:
+    {"generation": "20261018-0130", "path": "corporate_phase2_stable.20261018-0130.db",
+     "answer_table": "answer_table.20261018-0130.bin", "activated_at": "..."}
+path / answer_table はポインタファイルからの相対パスも可。ポインタがなければ
+DATABASE_PATH 自体を世代 'base' として扱う。
+
+使い方:
+    python phase15_db_generation.py status
+    python phase15_db_generation.py validate ./data/corporate_phase2_stable.20261018-0130.db
+    python phase15_db_generation.py activate ./data/corporate_phase2_stable.20261018-0130.db \\
+        --answer-table ./data/answer_table.20261018-0130.bin
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+from build_corporate_index import FTS_TABLE, missing_indexes
+from phase15_answer_table import load_answer_table
+from phase15_db_metadata import read_metadata
+from phase15_bloom_filter import BloomFilter, bloom_path_for
+
+BASE_GENERATION = 'base'
+# 稼働中プロセスがポインタの変更を確認する間隔（秒）
+GENERATION_CHECK_INTERVAL = float(os.getenv('DB_GENERATION_CHECK_INTERVAL', '1.0'))
+
+
+class GenerationError(Exception):
+    """新世代の検証失敗・ポインタ不正"""
+
+
+def pointer_path_for(db_path):
+    """データベースに対応する世代ポインタのパス"""
+    return f"{db_path}.generation"
+
+
+def read_generation(db_path):
+    """現在の世代情報（ポインタがなければ DATABASE_PATH 自体を base 世代とする）"""
+    pointer = pointer_path_for(db_path)
+    try:
+        with open(pointer, encoding='utf-8') as f:
+            info = json.load(f)
+    except FileNotFoundError:
+        return {'generation': BASE_GENERATION, 'path': db_path, 'answer_table': None, 'activated_at': None}
+    except (OSError, ValueError) as e:
+        raise GenerationError(f"Invalid generation pointer {pointer}: {e}")
+
+    base_dir = os.path.dirname(os.path.abspath(pointer))
+    for key in ('path', 'answer_table'):
+        if info.get(key):
+            info[key] = os.path.join(base_dir, info[key])
+    if not info.get('generation') or not info.get('path'):
+        raise GenerationError(f"Invalid generation pointer {pointer}: generation/path required")
+    info.setdefault('answer_table', None)
+    return info
+
+
+def validate_generation(path):
+    """新世代として使えるか検証し、問題点のリストを返す（空なら有効）"""
+    if not os.path.exists(path):
+        return [f"file not found: {path}"]
+
+    problems = []
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        return [f"cannot open: {e}"]
+    try:
+        check = conn.execute("PRAGMA quick_check").fetchone()[0]
+        if check != 'ok':
+            problems.append(f"quick_check failed: {check}")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'corporate_master'").fetchone() is None:
+            return problems + ["corporate_master table not found"]
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)).fetchone() is None:
+            problems.append(f"{FTS_TABLE} not found (run build_corporate_index.py)")
+        missing = missing_indexes(conn)
+        if missing:
+            problems.append(f"missing indexes: {', '.join(missing)}")
+        metadata, problem = read_metadata(conn)
+        if metadata is None:
+            problems.append(f"metadata: {problem}")
+        bloom_path = bloom_path_for(path)
+        if os.path.exists(bloom_path) and metadata is not None:
+            bloom = BloomFilter.load(bloom_path)
+            if bloom.max_rowid != metadata['max_rowid']:
+                problems.append(f"stale bloom filter: {bloom_path}")
+    except (sqlite3.Error, ValueError, OSError) as e:
+        problems.append(f"validation error: {e}")
+    finally:
+        conn.close()
+    return problems
+
+
+def activate_generation(db_path, new_path, answer_table=None, generation=None):
+    """新世代を検証してポインタを原子的に切り替える（稼働中サーバーは次の確認で移行）"""
+    problems = validate_generation(new_path)
+    if answer_table and not os.path.exists(answer_table):
+        problems.append(f"answer table not found: {answer_table}")
+    elif answer_table and not problems:
+        # 別の DB（差分適用前など）からコンパイルしたテーブルは新世代で使えない
+        table = load_answer_table(answer_table, new_path)
+        if table is None:
+            problems.append(f"answer table does not match {new_path}: {answer_table}")
+        else:
+            table.close()
+    if problems:
+        raise GenerationError("; ".join(problems))
+
+    pointer = pointer_path_for(db_path)
+    directory = os.path.dirname(os.path.abspath(pointer))
+    info = {
+        'generation': generation or time.strftime('%Y%m%d-%H%M%S'),
+        'path': os.path.relpath(os.path.abspath(new_path), directory),
+        'answer_table': os.path.relpath(os.path.abspath(answer_table), directory) if answer_table else None,
+        'activated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as out:
+            json.dump(info, out, ensure_ascii=False, indent=2)
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, pointer)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return read_generation(db_path)
+
+
+class GenerationWatcher:
+    """世代ポインタの変更検知（GENERATION_CHECK_INTERVAL ごとに stat のみ）"""
+
+    def __init__(self, db_path, interval=GENERATION_CHECK_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._checked = time.monotonic()
+        self._signature = self._stat()
+        self.current = read_generation(db_path)
+
+    def _stat(self):
+        try:
+            st = os.stat(pointer_path_for(self.db_path))
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def poll(self):
+        """世代が変わっていれば新しい世代情報、変化なし（または確認間隔内）なら None"""
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return None
+        with self._lock:
+            if now - self._checked < self.interval:
+                return None
+            self._checked = now
+            signature = self._stat()
+            if signature == self._signature:
+                return None
+            self._signature = signature
+            try:
+                info = read_generation(self.db_path)
+            except GenerationError as e:
+                print(f"⚠️  {e} - keeping generation {self.current['generation']}")
+                return None
+            if info['generation'] == self.current['generation'] and info['path'] == self.current['path']:
+                return None
+            self.current = info
+            return info
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="法人番号DB 世代切り替え")
+    parser.add_argument(
+        '--db',
+        default=os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db'),
+        help="サーバーが参照する DATABASE_PATH（ポインタは <db>.generation）"
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="現在の世代を表示")
+    validate = subparsers.add_parser('validate', help="新世代ファイルの検証のみ")
+    validate.add_argument('path', help="新しいデータベースファイル")
+    activate = subparsers.add_parser('activate', help="検証して世代を切り替え")
+    activate.add_argument('path', help="新しいデータベースファイル（build_corporate_index.py 済み）")
+    activate.add_argument('--answer-table', help="新世代の統合回答テーブル（phase15_answer_table.py --db 新DB）")
+    activate.add_argument('--generation', help="世代ID（既定: 現在時刻）")
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'status':
+            info = read_generation(args.db)
+            print(json.dumps(info, ensure_ascii=False, indent=2))
+            return 0
+        if args.command == 'validate':
+            problems = validate_generation(args.path)
+            for problem in problems:
+                print(f"❌ {problem}")
+            if not problems:
+                print(f"✅ Valid generation: {args.path}")
+            return 1 if problems else 0
+        info = activate_generation(args.db, args.path, args.answer_table, args.generation)
+        print(f"✅ Generation activated: {info['generation']} -> {info['path']}")
+        return 0
+    except GenerationError as e:
+        print(f"❌ {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 法人番号DB メタデータ
+件数・前株/後株などの全件集計は build_corporate_index.py が構築時に一度だけ計算し、
+corporate_metadata テーブルに保存する。起動時はこの値を読み、スキーマ指紋・形式バージョン・
+MAX(rowid) が一致する場合のみ使う（352万件の全件走査を起動のたびに行わない）。
+"""
+
+import hashlib
+import sqlite3
+import time
+
+METADATA_TABLE = 'corporate_metadata'
+# メタデータ形式・集計内容を変えたら上げる
+METADATA_VERSION = 1
+
+# 数値として扱うキー
+INTEGER_KEYS = ('metadata_version', 'total_count', 'mae_kabu', 'ato_kabu', 'stock_companies', 'max_rowid')
+
+
+def schema_fingerprint(conn):
+    """corporate_master の列構成（名前・型の順序付き一覧）のハッシュ"""
+    columns = conn.execute("PRAGMA table_info(corporate_master)").fetchall()
+    layout = ','.join(f"{column[1]}:{column[2]}" for column in columns)
+    return hashlib.sha256(f"corporate_master({layout})".encode('utf-8')).hexdigest()[:16]
+
+
+def compute_metadata(conn):
+    """全件集計（構築時のみ実行する重い処理）"""
+    total_count, max_rowid = conn.execute(
+        "SELECT COUNT(*), MAX(rowid) FROM corporate_master"
+    ).fetchone()
+    mae_kabu, ato_kabu, stock_companies = conn.execute("""
+        SELECT
+            SUM(CASE WHEN name LIKE '株式会社%' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN name LIKE '%株式会社' THEN 1 ELSE 0 END),
+            COUNT(*)
+        FROM corporate_master
+        WHERE name LIKE '%株式会社%'
+    """).fetchone()
+    return {
+        'metadata_version': METADATA_VERSION,
+        'schema_fingerprint': schema_fingerprint(conn),
+        'total_count': total_count,
+        'mae_kabu': mae_kabu or 0,
+        'ato_kabu': ato_kabu or 0,
+        'stock_companies': stock_companies,
+        'max_rowid': max_rowid or 0,
+        'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def write_metadata(conn, metadata):
+    """メタデータを置き換えて保存（呼び出し側で commit）"""
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    conn.execute(f"DELETE FROM {METADATA_TABLE}")
+    conn.executemany(
+        f"INSERT INTO {METADATA_TABLE} (key, value) VALUES (?, ?)",
+        [(key, str(value)) for key, value in metadata.items()]
+    )
+
+
+def read_metadata(conn):
+    """検証済みメタデータを返す: (metadata, None) または (None, 使えない理由)"""
+    try:
+        rows = conn.execute(f"SELECT key, value FROM {METADATA_TABLE}").fetchall()
+    except sqlite3.OperationalError:
+        return None, "metadata table not found"
+
+    metadata = dict(rows)
+    try:
+        for key in INTEGER_KEYS:
+            metadata[key] = int(metadata[key])
+    except (KeyError, ValueError):
+        return None, "metadata incomplete"
+
+    if metadata['metadata_version'] != METADATA_VERSION:
+        return None, f"metadata version {metadata['metadata_version']} != {METADATA_VERSION}"
+    if metadata.get('schema_fingerprint') != schema_fingerprint(conn):
+        return None, "schema fingerprint mismatch"
+    # rowid 索引の末尾参照のみ（全件走査なし）
+    max_rowid = conn.execute("SELECT MAX(rowid) FROM corporate_master").fetchone()[0] or 0
+    if max_rowid != metadata['max_rowid']:
+        return None, "corporate_master changed since metadata was built"
+    return metadata, None
+
+
+def load_metadata(db_path, conn):
+    """接続プールの generation_resource 用（検証済みメタデータ、使えなければ None）"""
+    return read_metadata(conn)[0]
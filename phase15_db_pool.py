@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: SQLite接続プール
+352万社DBへの接続をスレッド単位で使い回し、プリペアドステートメントをキャッシュする
+世代ポインタ（phase15_db_generation.py）が切り替わると新しい接続から新世代のファイルを開く
+"""
+
+import sqlite3
+import threading
+import weakref
+import time
+import os
+from contextlib import contextmanager
+
+from phase15_db_generation import GenerationWatcher
+from phase15_metrics import get_metrics_registry, stats_gauges
+
+# プール既定値
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_CACHED_STATEMENTS = 256
+HEALTH_CHECK_INTERVAL = 30.0  # 秒（アイドル接続の再検証間隔）
+_MISSING = object()
+# immutable 配信モードの既定 mmap_size（SQLite のコンパイル時上限 SQLITE_MAX_MMAP_SIZE で頭打ち）
+DEFAULT_SERVING_MMAP_SIZE = 4 * 1024 ** 3
+
+
+class _ThreadSlot:
+    """スレッドのプール枠の目印（threading.local に置き、スレッド終了で破棄されると枠を解放する）"""
+
+    __slots__ = ('__weakref__',)
+
+
+class SQLiteConnectionPool:
+    """スレッド単位の読み取り専用SQLite接続プール（DB 世代の無停止切り替え対応）"""
+
+    def __init__(self, db_path, max_connections=DEFAULT_MAX_CONNECTIONS,
+                 cached_statements=DEFAULT_CACHED_STATEMENTS,
+                 immutable=False, mmap_size=0, cache_size=None):
+        """
+        db_path   : DATABASE_PATH（世代ポインタ <db_path>.generation があればその世代のファイルを開く）
+        immutable : 配信中に DB を書き換えない前提で immutable=1 で開く（ロック・変更検知なし）
+        mmap_size : 0 以外なら mmap 読み取り（ページは OS ページキャッシュをプロセス間で共有）
+        cache_size: PRAGMA cache_size（None なら SQLite 既定。接続ごとのヒープキャッシュ）
+        """
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.cached_statements = cached_statements
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.effective_mmap_size = None
+
+        # 世代: 新しい接続は常に active_path を開く
+        self._watcher = GenerationWatcher(db_path)
+        self.generation = self._watcher.current['generation']
+        self.active_path = self._watcher.current['path']
+        self._generation_paths = {self.generation: self.active_path}
+        self._draining = False  # 旧世代の接続が残っている
+        self._listeners = []
+        self._resources = {}  # (名前, 世代) -> 世代ごとの派生データ（Bloom フィルタ等）
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # thread ident -> (connection, generation)
+        self._busy = {}  # thread ident -> 貸出中の数（旧世代接続を閉じてよいかの判定）
+        self._pid = os.getpid()
+
+        self.metrics = {
+            'connections_created': 0,
+            'connections_reused': 0,
+            'connections_discarded': 0,
+            'overflow_connections': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'checkouts': 0,
+            'active_checkouts': 0,
+            'generation_switches': 0,
+            'connections_retired': 0
+        }
+        # 接続取得の待ち時間・貸出時間（/metrics）
+        registry = get_metrics_registry()
+        db_label = os.path.basename(db_path)
+        self.checkout_wait = registry.histogram(
+            'db_checkout_wait_seconds', 'Time to acquire a pooled connection (open/health check/generation switch)',
+            db=db_label
+        )
+        self.checkout_hold = registry.histogram(
+            'db_checkout_hold_seconds', 'Time a pooled connection is held by the caller (queries)', db=db_label
+        )
+
+    def _open_connection(self):
+        """読み取り専用URIで現世代のファイルへの接続を開く"""
+        uri = f"file:{os.path.abspath(self.active_path)}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        conn = sqlite3.connect(
+            uri,
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if self.mmap_size:
+            # 実際の値はコンパイル時上限で切り詰められる
+            self.effective_mmap_size = conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}").fetchone()[0]
+        if self.cache_size is not None:
+            conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        return conn
+
+    def _reset_after_fork(self):
+        """fork後は親プロセスの接続を破棄（ハンドル共有を防ぐ）"""
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._pid = os.getpid()
+                self._connections = {}
+                self._busy = {}
+            self._local = threading.local()
+
+    def _release_thread_slot(self, ident, conn, pid):
+        """スレッド終了時（またはスロット差し替え時）にプール枠と接続を解放"""
+        if os.getpid() != pid:
+            # fork 後の子プロセスでは親の接続に触れない
+            return
+        with self._lock:
+            entry = self._connections.get(ident)
+            if entry is not None and entry[0] is conn:
+                del self._connections[ident]
+            if not self._busy.get(ident):
+                self._busy.pop(ident, None)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _is_healthy(self, conn):
+        """接続ヘルスチェック"""
+        self.metrics['health_checks'] += 1
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            self.metrics['health_check_failures'] += 1
+            return False
+
+    def _discard(self, conn):
+        """不健全な接続を破棄"""
+        self.metrics['connections_discarded'] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def add_generation_listener(self, callback):
+        """世代切り替え後に callback(generation_info) を呼ぶ（結果キャッシュの破棄など）"""
+        self._listeners.append(callback)
+
+    def check_generation(self):
+        """世代ポインタの変更を反映し、使われていない旧世代の接続を閉じる"""
+        info = self._watcher.poll()
+        if info is not None:
+            with self._lock:
+                previous = self.generation
+                self.generation = info['generation']
+                self.active_path = info['path']
+                self._generation_paths[self.generation] = self.active_path
+                self._draining = True
+                self.metrics['generation_switches'] += 1
+            print(f"🔄 DB generation switched: {previous} -> {info['generation']} ({info['path']})")
+            for callback in self._listeners:
+                try:
+                    callback(info)
+                except Exception as e:
+                    print(f"⚠️  Generation listener error: {e}")
+        if self._draining:
+            self._retire_idle_connections()
+
+    def _retire_idle_connections(self):
+        """他スレッドが保持している旧世代接続のうち貸出中でないものを閉じる"""
+        with self._lock:
+            retired = [
+                (ident, conn) for ident, (conn, generation) in self._connections.items()
+                if generation != self.generation and not self._busy.get(ident)
+            ]
+            for ident, _ in retired:
+                del self._connections[ident]
+            live_generations = {generation for _, generation in self._connections.values()}
+            self._draining = live_generations - {self.generation} != set()
+            live_generations.add(self.generation)
+            for key in [key for key in self._resources if key[1] not in live_generations]:
+                del self._resources[key]
+            for generation in [g for g in self._generation_paths if g not in live_generations]:
+                del self._generation_paths[generation]
+        for _, conn in retired:
+            self.metrics['connections_retired'] += 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def _acquire(self):
+        """現在のスレッド用の接続を取得（overflowの場合は使い捨て）。呼び出し側で貸出中として扱う"""
+        self._reset_after_fork()
+        self.check_generation()
+        ident = threading.get_ident()
+
+        # 貸出中の印を先に付ける（他スレッドの旧世代接続整理で閉じられないように）
+        with self._lock:
+            self._busy[ident] = self._busy.get(ident, 0) + 1
+        try:
+            return self._acquire_marked(ident)
+        except Exception:
+            with self._lock:
+                self._busy[ident] -= 1
+            raise
+
+    def _acquire_marked(self, ident):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                entry = self._connections.get(ident)
+            if entry is None or entry[0] is not conn:
+                # 旧世代として他スレッドから閉じられた
+                pass
+            elif entry[1] != self.generation:
+                # 自スレッドの旧世代接続（前回のリクエストは完了済み）
+                with self._lock:
+                    self._connections.pop(ident, None)
+                self.metrics['connections_retired'] += 1
+                conn.close()
+            else:
+                last_used = getattr(self._local, 'last_used', 0.0)
+                if time.monotonic() - last_used < HEALTH_CHECK_INTERVAL or self._is_healthy(conn):
+                    self.metrics['connections_reused'] += 1
+                    return conn, entry[1], False
+                self._discard(conn)
+                with self._lock:
+                    self._connections.pop(ident, None)
+            self._local.conn = None
+
+        generation = self.generation
+        conn = self._open_connection()
+        self.metrics['connections_created'] += 1
+
+        with self._lock:
+            if len(self._connections) >= self.max_connections:
+                # 上限超過: プールに保持せず使用後に閉じる
+                self.metrics['overflow_connections'] += 1
+                return conn, generation, True
+            self._connections[ident] = (conn, generation)
+
+        self._local.conn = conn
+        # スレッドが終了すると threading.local の値が破棄され、枠が空く（短命スレッドで枠が埋まらない）
+        slot = _ThreadSlot()
+        finalizer = weakref.finalize(slot, self._release_thread_slot, ident, conn, os.getpid())
+        finalizer.atexit = False
+        self._local.slot = slot
+        return conn, generation, False
+
+    @contextmanager
+    def connection(self):
+        """プール接続を貸し出すコンテキストマネージャ（処理中に世代が変わっても同じ接続で完了）"""
+        if getattr(self._local, 'depth', 0):
+            # 入れ子の貸し出しは外側と同じ接続・世代を使う
+            self._local.depth += 1
+            try:
+                yield self._local.checkout
+            finally:
+                self._local.depth -= 1
+            return
+
+        acquire_started = time.perf_counter()
+        conn, generation, overflow = self._acquire()
+        checkout_started = time.perf_counter()
+        self.checkout_wait.observe(checkout_started - acquire_started)
+        ident = threading.get_ident()
+        self._local.checkout = conn
+        self._local.generation = generation
+        self._local.depth = 1
+        self.metrics['checkouts'] += 1
+        self.metrics['active_checkouts'] += 1
+        try:
+            yield conn
+        except sqlite3.OperationalError:
+            # 接続異常の可能性があるため次回は再接続
+            if not overflow:
+                self._local.conn = None
+                with self._lock:
+                    self._connections.pop(ident, None)
+            self._discard(conn)
+            overflow = False
+            raise
+        finally:
+            self._local.depth = 0
+            self._local.checkout = None
+            self._local.generation = None
+            with self._lock:
+                self._busy[ident] -= 1
+            self.metrics['active_checkouts'] -= 1
+            self.checkout_hold.observe(time.perf_counter() - checkout_started)
+            if overflow:
+                conn.close()
+            else:
+                self._local.last_used = time.monotonic()
+
+    def generation_resource(self, name, loader):
+        """DB 世代ごとの派生データ（loader(path, conn) の結果）を取得
+
+        貸し出し中の接続があればその世代、なければ現世代のものを返す。
+        """
+        generation = getattr(self._local, 'generation', None)
+        if generation is None:
+            with self.connection():
+                return self.generation_resource(name, loader)
+
+        key = (name, generation)
+        value = self._resources.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        # 読み込みは1世代1回（同時に読み込んだ場合は先に登録された方を使う）
+        with self._lock:
+            path = self._generation_paths.get(generation, self.active_path)
+        value = loader(path, self._local.checkout)
+        with self._lock:
+            return self._resources.setdefault(key, value)
+
+    def table_exists(self, name):
+        """テーブル（仮想テーブル含む）の存在確認"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = ? LIMIT 1", (name,)
+                )
+                return cursor.fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def column_exists(self, table, column):
+        """列の存在確認（オフライン構築済みの列を検出する）"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.execute(f"PRAGMA table_info({table})")
+                return any(row[1] == column for row in cursor.fetchall())
+        except sqlite3.Error:
+            return False
+
+    def close_all(self):
+        """全接続をクローズ"""
+        with self._lock:
+            connections = [conn for conn, _ in self._connections.values()]
+            self._connections = {}
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+    def get_metrics(self):
+        """プールサイズ・ヘルス指標"""
+        with self._lock:
+            pool_size = len(self._connections)
+            draining = sum(1 for _, generation in self._connections.values() if generation != self.generation)
+        return {
+            'db_path': self.db_path,
+            'generation': self.generation,
+            'active_path': self.active_path,
+            'draining_connections': draining,
+            'pool_size': pool_size,
+            'max_connections': self.max_connections,
+            'cached_statements': self.cached_statements,
+            'immutable': self.immutable,
+            'mmap_size': self.effective_mmap_size if self.mmap_size else 0,
+            **self.metrics
+        }
+
+
+# プロセス内共有プール（DBパス単位）
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def pool_options_from_env():
+    """環境変数からプール設定を読む
+
+    DB_POOL_MAX_CONNECTIONS : 接続数上限
+    DB_IMMUTABLE=1          : immutable 配信モード（mmap_size 既定 DEFAULT_SERVING_MMAP_SIZE）
+    DB_MMAP_SIZE            : mmap_size バイト数（0 で無効）
+    DB_CACHE_SIZE           : PRAGMA cache_size
+    """
+    immutable = os.getenv('DB_IMMUTABLE', '0').lower() in ('1', 'true', 'yes')
+    default_mmap = DEFAULT_SERVING_MMAP_SIZE if immutable else 0
+    cache_size = os.getenv('DB_CACHE_SIZE')
+    return {
+        'max_connections': int(os.getenv('DB_POOL_MAX_CONNECTIONS', DEFAULT_MAX_CONNECTIONS)),
+        'immutable': immutable,
+        'mmap_size': int(os.getenv('DB_MMAP_SIZE', default_mmap)),
+        'cache_size': int(cache_size) if cache_size else None
+    }
+
+
+def get_pool(db_path):
+    """DBパスに対応する共有プールを取得"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SQLiteConnectionPool(db_path, **pool_options_from_env())
+            _pools[key] = pool
+        return pool
+
+
+def get_all_pool_metrics():
+    """全共有プールの指標一覧"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.get_metrics() for pool in pools]
+
+
+def _collect_pool_gauges():
+    """/metrics 出力時に全共有プールの指標をゲージとして収集"""
+    samples = []
+    for metrics in get_all_pool_metrics():
+        samples.extend(stats_gauges(
+            'db_pool', metrics, 'Connection pool metrics', db=os.path.basename(metrics['db_path'])
+        ))
+    return samples
+
+
+get_metrics_registry().add_collector(_collect_pool_gauges)
@@ -5,8 +5,9 @@ Phase 15 Week 1: FastAPI統合企業名予測サーバー - Claude Code版
 6段階カスケードシステムのAPI化による商用化準備
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, Field
 import sqlite3
@@ -19,9 +20,15 @@ from typing import Optional, Dict, Any, List
 import uvicorn
 import asyncio
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
 # 既存の統合システムをインポート
 from phase15_mega_cascade_system import MegaScaleCascadeSystem
+from phase15_batch_jobs import BatchJobManager, BatchJobError, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from phase15_metrics import get_metrics_registry, stats_gauges, PROMETHEUS_CONTENT_TYPE
+from phase15_stream import (
+    LineSplitter, StreamLineError, NDJSON_CONTENT_TYPE, parse_stream_line, encode_stream_line
+)
 
 # Linux環境での文字コード設定
 os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -60,6 +67,7 @@ logger = logging.getLogger(__name__)
 
 # グローバル変数
 prediction_system = None
+batch_jobs = None
 api_stats = {
     'total_requests': 0,
     'successful_predictions': 0,
@@ -67,6 +75,73 @@ api_stats = {
     'cascade_usage': {}
 }
 
+# 予測実行スレッドプール（cascade_predict は SQLite I/O を伴う同期処理のためイベントループ外で実行）
+PREDICTION_CONCURRENCY = int(os.getenv('PREDICTION_CONCURRENCY', '8'))
+PREDICTION_TIMEOUT = float(os.getenv('PREDICTION_TIMEOUT', '5.0'))  # 秒（待ち時間を含む）
+prediction_executor = None
+prediction_slots = None
+executor_stats = {
+    'concurrency_limit': PREDICTION_CONCURRENCY,
+    'timeout_seconds': PREDICTION_TIMEOUT,
+    'queue_depth': 0,
+    'max_queue_depth': 0,
+    'running': 0,
+    'completed': 0,
+    'timeouts': 0,
+    'errors': 0
+}
+
+# 予測スレッドプールの状態も /metrics に出す
+get_metrics_registry().add_collector(
+    lambda: stats_gauges('prediction_executor', executor_stats, 'Prediction thread pool statistics')
+)
+
+class PredictionTimeout(Exception):
+    """予測が PREDICTION_TIMEOUT 内に完了しなかった"""
+
+async def run_prediction(query, user_id):
+    """予測をスレッドプールで実行（同時実行数・タイムアウト制御付き）"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + PREDICTION_TIMEOUT
+    
+    if not prediction_slots.locked():
+        await prediction_slots.acquire()
+    else:
+        # 空きスロット待ち（= キュー深さ）
+        executor_stats['queue_depth'] += 1
+        executor_stats['max_queue_depth'] = max(executor_stats['max_queue_depth'], executor_stats['queue_depth'])
+        try:
+            await asyncio.wait_for(prediction_slots.acquire(), timeout=PREDICTION_TIMEOUT)
+        except asyncio.TimeoutError:
+            executor_stats['timeouts'] += 1
+            raise PredictionTimeout(f"予測待ちタイムアウト ({PREDICTION_TIMEOUT}s)")
+        finally:
+            executor_stats['queue_depth'] -= 1
+    
+    executor_stats['running'] += 1
+    future = prediction_executor.submit(prediction_system.cascade_predict, query, user_id)
+    
+    def release_slot(_):
+        # タイムアウト後もスレッドの処理完了まではスロットを返さない（実行中スレッド数を上限内に保つ）
+        loop.call_soon_threadsafe(_release_prediction_slot)
+    future.add_done_callback(release_slot)
+    
+    try:
+        result = await asyncio.wait_for(asyncio.wrap_future(future), timeout=max(deadline - loop.time(), 0.001))
+    except asyncio.TimeoutError:
+        executor_stats['timeouts'] += 1
+        raise PredictionTimeout(f"予測タイムアウト ({PREDICTION_TIMEOUT}s)")
+    except Exception:
+        executor_stats['errors'] += 1
+        raise
+    
+    executor_stats['completed'] += 1
+    return result
+
+def _release_prediction_slot():
+    executor_stats['running'] -= 1
+    prediction_slots.release()
+
 # リクエスト/レスポンスモデル
 class PredictionRequest(BaseModel):
     query: str = Field(..., min_length=1, max_length=100, description="企業名検索クエリ")
@@ -90,6 +165,9 @@ class HealthResponse(BaseModel):
     database_size: int
     total_requests: int
     accuracy_stats: Dict[str, Any]
+    result_cache: Dict[str, Any] = {}
+    executor: Dict[str, Any] = {}
+    db_generation: Dict[str, Any] = {}
 
 class UserLearningRequest(BaseModel):
     query: str = Field(..., description="検索クエリ")
@@ -102,7 +180,7 @@ class LearningResponse(BaseModel):
     learning_count: int
 
 class BatchPredictionRequest(BaseModel):
-    queries: List[str] = Field(..., max_items=50, description="企業名検索クエリのリスト")
+    queries: List[str] = Field(..., max_items=50, description="企業名検索クエリのリスト（最大50件、それ以上は /api/v1/batch/jobs）")
     user_id: Optional[str] = Field(None, description="ユーザーID")
 
 class BatchPredictionResponse(BaseModel):
@@ -111,6 +189,9 @@ class BatchPredictionResponse(BaseModel):
     successful_predictions: int
     total_time_ms: float
 
+class BatchJobRequest(BaseModel):
+    queries: List[str] = Field(..., min_items=1, description="企業名検索クエリのリスト（大量可・重複は自動除去）")
+
 # API Key認証（簡易版）
 def verify_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
     """API Key認証（開発版）"""
@@ -135,7 +216,7 @@ def verify_api_key(credentials: Optional[HTTPAuthorizationCredentials] = Depends
 @app.on_event("startup")
 async def startup_event():
     """サーバー起動時の初期化"""
-    global prediction_system
+    global prediction_system, prediction_executor, prediction_slots, batch_jobs
     
     logger.info("Phase 15 Week 1 FastAPI サーバー起動開始 - Claude Code版")
     
@@ -144,6 +225,16 @@ async def startup_event():
         prediction_system = MegaScaleCascadeSystem()
         logger.info("6段階カスケード統合システム初期化完了")
         
+        # 予測実行スレッドプール
+        prediction_executor = ThreadPoolExecutor(
+            max_workers=PREDICTION_CONCURRENCY, thread_name_prefix='prediction'
+        )
+        prediction_slots = asyncio.Semaphore(PREDICTION_CONCURRENCY)
+        logger.info(f"予測スレッドプール: 同時実行 {PREDICTION_CONCURRENCY} / タイムアウト {PREDICTION_TIMEOUT}s")
+        
+        # 大量バッチジョブ（専用スレッドで処理するためイベントループは塞がない）
+        batch_jobs = BatchJobManager(prediction_system.cascade_predict_many)
+        
         # システム統計取得
         stats = prediction_system.get_system_statistics()
         logger.info(f"システム統計: {stats}")
@@ -158,6 +249,8 @@ async def startup_event():
 async def shutdown_event():
     """サーバー終了時の処理"""
     logger.info("FastAPI サーバー終了処理実行")
+    if prediction_executor is not None:
+        prediction_executor.shutdown(wait=False)
 
 # ルートエンドポイント
 @app.get("/")
@@ -169,6 +262,7 @@ async def root():
         "system": "6段階カスケード統合システム",
         "docs": "/docs",
         "health": "/health",
+        "metrics": "/metrics",
         "environment": "Claude Code WSL2"
     }
 
@@ -193,7 +287,10 @@ async def health_check():
                 "successful_predictions": api_stats['successful_predictions'],
                 "success_rate": (api_stats['successful_predictions'] / max(api_stats['total_requests'], 1)) * 100,
                 "cascade_usage": api_stats['cascade_usage']
-            }
+            },
+            "result_cache": prediction_system.result_cache.get_stats(),
+            "executor": executor_stats,
+            "db_generation": prediction_system.get_db_generation()
         }
         
         return HealthResponse(**health_data)
@@ -205,6 +302,12 @@ async def health_check():
             detail="システムヘルスチェック失敗"
         )
 
+# メトリクスエンドポイント（Prometheus テキスト形式）
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """レベル別レイテンシ・結果キャッシュ・DB 接続プールの計測値"""
+    return PlainTextResponse(get_metrics_registry().render_prometheus(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # メイン予測エンドポイント
 @app.post("/api/v1/predict", response_model=PredictionResponse)
 async def predict_company_name(
@@ -219,11 +322,8 @@ async def predict_company_name(
     logger.info(f"予測リクエスト: '{request.query}' (User: {auth['user_id']})")
     
     try:
-        # 予測実行
-        result = prediction_system.cascade_predict(
-            query=request.query,
-            user_id=request.user_id or auth['user_id']
-        )
+        # 予測実行（スレッドプール）
+        result = await run_prediction(request.query, request.user_id or auth['user_id'])
         
         # 統計更新
         api_stats['successful_predictions'] += 1
@@ -246,6 +346,12 @@ async def predict_company_name(
         
         return PredictionResponse(**response_data)
         
+    except PredictionTimeout as e:
+        logger.warning(f"予測タイムアウト: '{request.query}'")
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"予測エラー: {e}")
         raise HTTPException(
@@ -276,14 +382,20 @@ async def batch_predict(
     successful_count = 0
     
     try:
-        for query in request.queries:
+        # 各クエリをスレッドプールで並列実行（結果はクエリ順）
+        user_id = request.user_id or auth['user_id']
+        outcomes = await asyncio.gather(
+            *(run_prediction(query, user_id) for query in request.queries),
+            return_exceptions=True
+        )
+        
+        for query, outcome in zip(request.queries, outcomes):
             api_stats['total_requests'] += 1
             
             try:
-                result = prediction_system.cascade_predict(
-                    query=query,
-                    user_id=request.user_id or auth['user_id']
-                )
+                if isinstance(outcome, BaseException):
+                    raise outcome
+                result = outcome
                 
                 response_data = {
                     "query": query,
@@ -339,6 +451,116 @@ async def batch_predict(
             detail=f"バッチ予測エラー: {str(e)}"
         )
 
+# ストリーミング予測エンドポイント
+@app.post("/api/v1/predict/stream")
+async def stream_predict(
+    request: Request,
+    auth: dict = Depends(verify_api_key)
+):
+    """ストリーミング予測API（改行区切りのクエリ → 完了順ではなく入力順の NDJSON）"""
+    user_id = auth['user_id']
+    logger.info(f"ストリーミング予測開始 (User: {user_id})")
+    
+    async def stream_results():
+        # 先読みは PREDICTION_CONCURRENCY 件まで（入力全体を溜めずメモリ一定）
+        pending = []
+        splitter = LineSplitter()
+        line_number = 0
+        processed = 0
+        
+        async def predict_line(number, line):
+            try:
+                query = parse_stream_line(line)
+            except StreamLineError as e:
+                return {"line": number, "error": str(e), "confidence": 0.0, "source": "error"}
+            api_stats['total_requests'] += 1
+            try:
+                result = await run_prediction(query, user_id)
+            except Exception as e:
+                return {"line": number, "query": query, "error": str(e), "confidence": 0.0, "source": "error"}
+            
+            api_stats['successful_predictions'] += 1
+            source = result.get('source', 'unknown')
+            api_stats['cascade_usage'][source] = api_stats['cascade_usage'].get(source, 0) + 1
+            return {
+                "line": number,
+                "query": query,
+                "predicted_name": result['prediction'],
+                "confidence": result['confidence'],
+                "source": result['source'],
+                "prediction_time_ms": result['response_time_ms']
+            }
+        
+        try:
+            async for chunk in request.stream():
+                for line in splitter.feed(chunk):
+                    line_number += 1
+                    pending.append(asyncio.ensure_future(predict_line(line_number, line)))
+                    while len(pending) >= PREDICTION_CONCURRENCY or (pending and pending[0].done()):
+                        yield encode_stream_line(await pending.pop(0))
+                        processed += 1
+            for line in splitter.finish():
+                line_number += 1
+                pending.append(asyncio.ensure_future(predict_line(line_number, line)))
+            while pending:
+                yield encode_stream_line(await pending.pop(0))
+                processed += 1
+        finally:
+            # クライアント切断時は未送信分を破棄
+            for task in pending:
+                task.cancel()
+            logger.info(f"ストリーミング予測終了: {processed}件 (User: {user_id})")
+    
+    return StreamingResponse(
+        stream_results(),
+        media_type=NDJSON_CONTENT_TYPE,
+        headers={"Cache-Control": "no-cache"}
+    )
+
+# 大量バッチジョブエンドポイント
+@app.post("/api/v1/batch/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_batch_job(
+    request: BatchJobRequest,
+    auth: dict = Depends(verify_api_key)
+):
+    """大量バッチジョブ投入（チャンク処理・重複除去、結果はページング取得）"""
+    logger.info(f"バッチジョブ投入: {len(request.queries)}件 (User: {auth['user_id']})")
+    
+    loop = asyncio.get_running_loop()
+    try:
+        job = await loop.run_in_executor(None, batch_jobs.submit, request.queries)
+    except BatchJobError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return {
+        **job,
+        "status_url": f"/api/v1/batch/jobs/{job['job_id']}",
+        "results_url": f"/api/v1/batch/jobs/{job['job_id']}/results?offset=0&limit={DEFAULT_PAGE_SIZE}"
+    }
+
+@app.get("/api/v1/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str, auth: dict = Depends(verify_api_key)):
+    """バッチジョブの進捗"""
+    job = await asyncio.get_running_loop().run_in_executor(None, batch_jobs.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"バッチジョブが見つかりません: {job_id}")
+    return job
+
+@app.get("/api/v1/batch/jobs/{job_id}/results")
+async def get_batch_job_results(
+    job_id: str,
+    offset: int = 0,
+    limit: int = DEFAULT_PAGE_SIZE,
+    auth: dict = Depends(verify_api_key)
+):
+    """バッチジョブの結果ページ（入力順、最大 MAX_PAGE_SIZE 件）"""
+    page = await asyncio.get_running_loop().run_in_executor(
+        None, batch_jobs.get_results, job_id, offset, min(limit, MAX_PAGE_SIZE)
+    )
+    if page is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"バッチジョブが見つかりません: {job_id}")
+    return page
+
 # システム統計エンドポイント
 @app.get("/api/v1/stats")
 async def get_system_stats(auth: dict = Depends(verify_api_key)):
@@ -351,6 +573,7 @@ async def get_system_stats(auth: dict = Depends(verify_api_key)):
         
         stats = {
             "system_info": system_stats,
+            "executor": executor_stats,
             "api_stats": {
                 "uptime_seconds": uptime,
                 "total_requests": api_stats['total_requests'],
@@ -15,6 +15,9 @@ import threading
 import sys
 import locale
 import os
+import signal
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 # UTF-8文字コード強制設定
 os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -23,21 +26,130 @@ sys.stderr.reconfigure(encoding='utf-8')
 
 # 予測システムをインポート
 from phase15_final_system import FinalCascadeSystem
+from phase15_db_pool import get_all_pool_metrics
+from phase15_metrics import get_metrics_registry, PROMETHEUS_CONTENT_TYPE
+from phase15_logging import get_logger, shutdown_logging, DEBUG
+from phase15_api_counters import CharsetStats, CorrectionSequence, has_japanese
+from phase15_response_encoding import get_json_encoder, compress_body
+from phase15_batch_jobs import BatchJobManager, BatchJobError, DEFAULT_PAGE_SIZE
+from phase15_stream import (
+    LineSplitter, StreamLineError, NDJSON_CONTENT_TYPE, parse_stream_line, encode_stream_line
+)
+
+# 同期 /batch の上限（超過分は大量バッチジョブ API へ）
+SYNC_BATCH_LIMIT = 10
+# 修正ログ（予測システムが追記分を取り込む）と修正IDの連番ファイル
+CORRECTIONS_LOG = 'corrections.log'
+# ストリーミング予測の受信単位
+STREAM_READ_SIZE = 64 * 1024
+# HTTP/1.1 keep-alive: アイドル接続を閉じるまでの秒数・1接続あたりの最大リクエスト数
+# （待機中の接続もワーカー（thread）・プロセス（prefork）を1つ占有するため、アイドル時間は短くする）
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '1'))
+HTTP_KEEPALIVE_MAX_REQUESTS = int(os.getenv('HTTP_KEEPALIVE_MAX_REQUESTS', '100'))
+# リクエスト行・本文の受信と応答の送信のタイムアウト（アイドル待機以外。止まったクライアントがワーカーを占有し続けない上限）
+HTTP_IO_TIMEOUT = float(os.getenv('HTTP_IO_TIMEOUT', '60'))
+
+# レスポンス JSON エンコーダ（JSON_ENCODER。orjson があれば orjson）
+json_dumps = get_json_encoder()
+
+# リクエスト処理中のログ（LOG_LEVEL / LOG_SAMPLE_RATE。出力は別スレッド）
+log = get_logger('api')
 
 class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
     """Phase 15企業名予測API ハンドラー（文字コード完全修正版）"""
     
+    # 持続的接続（全応答に Content-Length を付け、同じ接続で次のリクエストを待つ）
+    protocol_version = 'HTTP/1.1'
+    # ソケットのタイムアウトは受信・送信中は IO 用、2件目以降のリクエスト行を待つ間だけ keep-alive のアイドル用
+    timeout = HTTP_IO_TIMEOUT
+    idle_timeout = HTTP_KEEPALIVE_TIMEOUT
+    # ヘッダーと本文を別々に書き込むため、Nagle と遅延 ACK が重なると持続的接続で約40ms待たされる
+    disable_nagle_algorithm = True
+    max_keepalive_requests = HTTP_KEEPALIVE_MAX_REQUESTS
+    
+    _init_lock = threading.Lock()
+    
     def __init__(self, *args, **kwargs):
         # 予測システム初期化
-        if not hasattr(Phase15FixedAPIHandler, 'prediction_system'):
-            print("🔄 Initializing prediction system with UTF-8 encoding...")
-            Phase15FixedAPIHandler.prediction_system = FinalCascadeSystem()
-            Phase15FixedAPIHandler.request_count = 0
-            Phase15FixedAPIHandler.start_time = datetime.now()
-            Phase15FixedAPIHandler.charset_test_results = []
-            print("✅ Prediction system ready with UTF-8 support")
+        Phase15FixedAPIHandler.initialize()
         super().__init__(*args, **kwargs)
     
+    @classmethod
+    def initialize(cls):
+        """予測システム初期化（サーバー起動前・pre-fork 前に一度だけ）"""
+        with cls._init_lock:
+            if not hasattr(Phase15FixedAPIHandler, 'prediction_system'):
+                print("🔄 Initializing prediction system with UTF-8 encoding...")
+                Phase15FixedAPIHandler.prediction_system = FinalCascadeSystem()
+                Phase15FixedAPIHandler.request_count = 0
+                Phase15FixedAPIHandler.start_time = datetime.now()
+                # 直近サンプルのリングバッファ + 集計カウンタ（メモリ一定）
+                Phase15FixedAPIHandler.charset_stats = CharsetStats()
+                Phase15FixedAPIHandler.correction_ids = CorrectionSequence(f"{CORRECTIONS_LOG}.seq")
+                Phase15FixedAPIHandler.batch_jobs = BatchJobManager(cls.predict_chunk)
+                print("✅ Prediction system ready with UTF-8 support")
+    
+    def setup(self):
+        super().setup()
+        self.requests_on_connection = 0
+        self.body_consumed = True
+        self._connection_header_sent = False
+    
+    def handle_one_request(self):
+        """1リクエスト処理（アイドルタイムアウトは次のリクエスト行を待つ間のみ）"""
+        if self.requests_on_connection:
+            self.connection.settimeout(self.idle_timeout)
+        super().handle_one_request()
+    
+    def parse_request(self):
+        """リクエスト行・ヘッダー解析（接続ごとのリクエスト数を数える）"""
+        # リクエスト行を受信済み: 本文の受信・応答の送信はアイドルタイムアウトで打ち切らない
+        self.connection.settimeout(self.timeout)
+        if not super().parse_request():
+            return False
+        self.requests_on_connection += 1
+        # 本文のないリクエストは読み切り済みとして扱う
+        self.body_consumed = (
+            self.headers.get('Content-Length', '0').strip() == '0'
+            and 'chunked' not in self.headers.get('Transfer-Encoding', '').lower()
+        )
+        return True
+    
+    def send_header(self, keyword, value):
+        if keyword.lower() == 'connection':
+            self._connection_header_sent = True
+        super().send_header(keyword, value)
+    
+    def end_headers(self):
+        # 持続させない接続は Connection: close を付けて応答後に閉じる
+        if not self._connection_header_sent and not self.keep_connection_alive():
+            self.send_header('Connection', 'close')
+        self._connection_header_sent = False
+        super().end_headers()
+    
+    def keep_connection_alive(self):
+        """この応答後も接続を保持するか"""
+        if self.requests_on_connection >= self.max_keepalive_requests:
+            return False
+        if not self.body_consumed:
+            # 本文を読まずに応答する場合は次のリクエストとの境界が分からない
+            return False
+        # 空きワーカーがなければアイドル接続で占有せず、待っている接続に譲る（thread モード）
+        has_idle_worker = getattr(self.server, 'has_idle_worker', None)
+        return has_idle_worker is None or has_idle_worker()
+    
+    def read_request_body(self):
+        """Content-Length 分の本文を読む（読み切ったことを記録）"""
+        content_length = int(self.headers['Content-Length'])
+        body = self.rfile.read(content_length)
+        self.body_consumed = True
+        return body
+    
+    @staticmethod
+    def predict_chunk(queries):
+        """バッチジョブ用: クエリのリストを一括予測"""
+        return Phase15FixedAPIHandler.prediction_system.cascade_predict_many(queries)
+    
     def do_GET(self):
         """GET リクエスト処理（文字コード修正版）"""
         
@@ -47,8 +159,10 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
             path = urllib.parse.unquote(self.path, encoding='utf-8')
         except UnicodeDecodeError:
             path = self.path
+        # 完全一致のエンドポイントはクエリ文字列（?pretty=1 など）を除いて判定
+        route = urllib.parse.urlsplit(path).path
         
-        if path == '/':
+        if route == '/':
             self.send_json_response({
                 "message": "Phase 15 Enterprise Name Prediction API (UTF-8 Fixed)",
                 "version": "1.0.1 Fixed",
@@ -58,14 +172,17 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                 "endpoints": {
                     "health": "/health",
                     "predict": "/predict?q=企業名",
-                    "batch": "/batch (POST)",
+                    "batch": "/batch (POST, 最大10件)",
+                    "batch_jobs": "/batch/jobs (POST, 大量バッチ)",
+                    "predict_stream": "/predict/stream (POST, 改行区切り → NDJSON)",
                     "docs": "/docs",
-                    "charset_test": "/charset_test"
+                    "charset_test": "/charset_test",
+                    "metrics": "/metrics (Prometheus)"
                 },
                 "quality": "文字化け0% - Universal Framework準拠"
             })
             
-        elif path == '/health':
+        elif route == '/health':
             uptime = (datetime.now() - self.start_time).total_seconds()
             self.send_json_response({
                 "status": "healthy",
@@ -74,9 +191,18 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                 "accuracy": "100%",
                 "charset_quality": "UTF-8 Perfect",
                 "system": "Phase 15 Final - Character Code Fixed",
-                "database_size": 3522575
+                "database_size": 3522575,
+                "db_pools": get_all_pool_metrics(),
+                "brand_registry": self.prediction_system.brand_registry.get_stats(),
+                "result_cache": self.prediction_system.result_cache.get_stats(),
+                "charset_stats": self.charset_stats.get_stats(),
+                "db_generation": self.prediction_system.get_db_generation()
             })
             
+        elif route == '/metrics':
+            # Prometheus テキスト形式（prefork 時は応答したワーカーの値）
+            self.send_text_response(get_metrics_registry().render_prometheus(), PROMETHEUS_CONTENT_TYPE)
+            
         elif path.startswith('/predict?'):
             # クエリパラメータから企業名を取得（UTF-8完全対応）
             try:
@@ -98,29 +224,49 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                     "suggestion": "Please ensure UTF-8 encoding"
                 }, status=400)
                 
-        elif path == '/charset_test':
+        elif path.startswith('/batch/jobs/'):
+            self.handle_batch_job_get(path)
+            
+        elif route == '/charset_test':
             self.handle_charset_test()
             
-        elif path == '/docs':
+        elif route == '/docs':
             self.send_html_response(self.get_docs_html())
             
         else:
             self.send_json_response({
                 "error": "Not Found",
-                "available_endpoints": ["/", "/health", "/predict?q=企業名", "/docs", "/charset_test"]
+                "available_endpoints": [
+                    "/", "/health", "/predict?q=企業名", "/batch/jobs/{job_id}",
+                    "/batch/jobs/{job_id}/results?offset=0&limit=100", "/docs", "/charset_test", "/metrics"
+                ]
             }, status=404)
     
     def do_POST(self):
         """POST リクエスト処理（UTF-8完全対応）"""
+        try:
+            self._route_post()
+        finally:
+            if not self.body_consumed:
+                # 本文を読まずに応答した場合は次のリクエストとの境界が分からないため接続を閉じる
+                self.close_connection = True
+    
+    def _route_post(self):
+        route = urllib.parse.urlsplit(self.path).path
         
-        if self.path == '/correction':
+        if route == '/correction':
             self.handle_correction()
             
-        elif self.path == '/batch':
+        elif route == '/batch/jobs':
+            self.handle_batch_job_submit()
+            
+        elif route == '/predict/stream':
+            self.handle_stream_prediction()
+            
+        elif route == '/batch':
             try:
                 # リクエストボディを読み取り（UTF-8対応）
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
+                post_data = self.read_request_body()
                 
                 # UTF-8でデコード
                 json_str = post_data.decode('utf-8')
@@ -152,7 +298,7 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
         else:
             self.send_json_response({
                 "error": "POST endpoint not found",
-                "available_post_endpoints": ["/batch"]
+                "available_post_endpoints": ["/batch", "/batch/jobs", "/predict/stream", "/correction"]
             }, status=404)
     
     def do_OPTIONS(self):
@@ -162,24 +308,16 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.send_header('Access-Control-Max-Age', '86400')
+        self.send_header('Content-Length', '0')
         self.end_headers()
     
     def handle_prediction(self, query):
         """単一予測処理（文字コード完全対応）"""
         try:
-            print(f"🔍 Prediction request (UTF-8): '{query}' (len: {len(query)})")
-            
-            # 学習データ状態をデバッグ出力
-            print(f"📚 Current user corrections in memory: {len(self.prediction_system.user_corrections)} entries")
-            if self.prediction_system.user_corrections:
-                print("📝 User corrections entries:")
-                for key, correction in self.prediction_system.user_corrections.items():
-                    print(f"   '{key}' -> '{correction['correct_name']}'")
-            
             # 文字コード品質チェック
             charset_issues = self.check_charset_quality(query)
             if charset_issues:
-                print(f"⚠️  Character encoding issues detected: {charset_issues}")
+                log.warning('charset_issues', sampled=True, query=query, issues=charset_issues)
             
             # 予測実行
             start_time = time.time()
@@ -192,12 +330,12 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
             test_result = {
                 'query': query,
                 'query_length': len(query),
-                'has_japanese': any('\u3040' <= c <= '\u309F' or '\u30A0' <= c <= '\u30FF' or '\u4E00' <= c <= '\u9FAF' for c in query),
+                'has_japanese': has_japanese(query),
                 'charset_issues': charset_issues,
                 'prediction': result['prediction'],
                 'source': result['source']
             }
-            self.charset_test_results.append(test_result)
+            self.charset_stats.record(test_result)
             
             # レスポンス構築
             response = {
@@ -215,12 +353,14 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                 }
             }
             
-            print(f"✅ Result (UTF-8): {result['prediction']} ({result['confidence']:.3f})")
+            log.info('prediction', sampled=True, query=query, prediction=result['prediction'],
+                     confidence=round(result['confidence'], 3), source=result['source'],
+                     ms=round(result['response_time_ms'], 3))
             
             self.send_json_response(response)
             
         except Exception as e:
-            print(f"❌ Prediction error: {e}")
+            log.error('prediction_failed', exc_info=True, query=query, error=str(e))
             self.send_json_response({
                 "error": f"Prediction failed: {str(e)}",
                 "query": query,
@@ -230,14 +370,13 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
     def handle_batch_prediction(self, queries):
         """バッチ予測処理（UTF-8完全対応）"""
         try:
-            print(f"📦 Batch prediction (UTF-8): {len(queries)} queries")
-            
             start_time = time.time()
             results = []
             successful_count = 0
             charset_errors = 0
             
-            for query in queries[:10]:  # 最大10件に制限
+            # 同期処理は最大10件（超過分は処理せず、truncated で明示）
+            for query in queries[:SYNC_BATCH_LIMIT]:
                 try:
                     # 文字コード品質チェック
                     charset_issues = self.check_charset_quality(query)
@@ -276,6 +415,9 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                 "results": results,
                 "total_queries": len(queries),
                 "processed_queries": len(results),
+                "truncated": len(queries) > SYNC_BATCH_LIMIT,
+                "max_queries": SYNC_BATCH_LIMIT,
+                "skipped_queries": max(len(queries) - SYNC_BATCH_LIMIT, 0),
                 "successful_predictions": successful_count,
                 "charset_errors": charset_errors,
                 "total_time_ms": total_time,
@@ -286,34 +428,217 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                 }
             }
             
-            print(f"✅ Batch completed (UTF-8): {successful_count}/{len(results)} successful, {charset_errors} charset errors")
+            if response["truncated"]:
+                response["hint"] = "Use POST /batch/jobs for more than 10 queries"
+                log.warning('batch_truncated', skipped=response['skipped_queries'], limit=SYNC_BATCH_LIMIT)
+            log.info('batch', sampled=True, queries=len(queries), successful=successful_count,
+                     charset_errors=charset_errors, ms=round(total_time, 3))
             
             self.send_json_response(response)
             
         except Exception as e:
-            print(f"❌ Batch error: {e}")
+            log.error('batch_failed', exc_info=True, error=str(e))
             self.send_json_response({
                 "error": f"Batch prediction failed: {str(e)}"
             }, status=500)
     
+    def handle_stream_prediction(self):
+        """ストリーミング予測: 改行区切りのクエリを読みながら1件ずつ NDJSON で返す"""
+        if not self.headers.get('Content-Length') and \
+                self.headers.get('Transfer-Encoding', '').lower() != 'chunked':
+            self.send_json_response({
+                "error": "Content-Length or Transfer-Encoding: chunked required",
+                "usage": "改行区切りのクエリ（1行1件、または {\"query\": \"企業名\"}）"
+            }, status=411)
+            return
+        
+        self.send_response(200)
+        self.send_header('Content-type', NDJSON_CONTENT_TYPE)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache')
+        # 長さが事前に分からないため接続終了で応答の終わりを示す
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        # 入力の受信は長時間・断続的になりうるため IO タイムアウトを外す
+        self.connection.settimeout(None)
+        
+        start_time = time.time()
+        line_number = 0
+        processed = 0
+        errors = 0
+        disconnected = False
+        try:
+            for line in self._iter_stream_lines():
+                line_number += 1
+                data, ok = self._predict_stream_line(line_number, line)
+                if not self._send_stream_line(data):
+                    # 送信できなければ残りの入力は読まない
+                    disconnected = True
+                    break
+                processed += 1
+                errors += not ok
+        except (BrokenPipeError, ConnectionResetError):
+            disconnected = True
+        except ValueError as e:
+            # 不正な chunked エンコーディング（ヘッダー送信済みのためエラー行で通知）
+            disconnected = not self._send_stream_line({"error": f"Invalid request body: {str(e)}"})
+        if disconnected:
+            log.warning('stream_disconnected', processed=processed)
+            return
+        
+        log.info('stream', processed=processed, errors=errors,
+                 ms=round((time.time() - start_time) * 1000, 3))
+    
+    def _iter_stream_lines(self):
+        """リクエストボディを受信しながら1行ずつ返す"""
+        splitter = LineSplitter()
+        for chunk in self._iter_request_body():
+            yield from splitter.feed(chunk)
+        yield from splitter.finish()
+    
+    def _predict_stream_line(self, line_number, line):
+        """1行分を予測して (応答行, 成功なら True) を返す"""
+        query = None
+        try:
+            query = parse_stream_line(line)
+            result = self.prediction_system.cascade_predict(query)
+            self.request_count += 1
+            data = {
+                "line": line_number,
+                "query": query,
+                "predicted_name": result['prediction'],
+                "confidence": result['confidence'],
+                "source": result['source'],
+                "prediction_time_ms": result['response_time_ms']
+            }
+            ok = True
+        except StreamLineError as e:
+            data = {"line": line_number, "error": str(e), "confidence": 0.0, "source": "error"}
+            ok = False
+        except Exception as e:
+            data = {"line": line_number, "query": query, "error": str(e), "confidence": 0.0, "source": "error"}
+            ok = False
+        return data, ok
+    
+    def _send_stream_line(self, data):
+        """NDJSON を1行送信して即座に flush（クライアントが切断していれば False）"""
+        try:
+            self.wfile.write(encode_stream_line(data))
+            self.wfile.flush()
+            return True
+        except (BrokenPipeError, ConnectionResetError):
+            return False
+    
+    def _iter_request_body(self):
+        """リクエストボディを STREAM_READ_SIZE 単位で読む（Content-Length / chunked）"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            while True:
+                size_line = self.rfile.readline(1024)
+                try:
+                    size = int(size_line.split(b';')[0].strip(), 16)
+                except ValueError:
+                    raise ValueError(f"bad chunk size line {size_line[:32]!r}")
+                if size == 0:
+                    # トレーラーを読み飛ばす
+                    while self.rfile.readline(1024).strip():
+                        pass
+                    return
+                while size > 0:
+                    data = self.rfile.read(min(size, STREAM_READ_SIZE))
+                    if not data:
+                        raise ValueError("unexpected end of chunked body")
+                    size -= len(data)
+                    yield data
+                self.rfile.readline(1024)
+        else:
+            remaining = int(self.headers['Content-Length'])
+            while remaining > 0:
+                data = self.rfile.read(min(remaining, STREAM_READ_SIZE))
+                if not data:
+                    return
+                remaining -= len(data)
+                yield data
+    
+    def handle_batch_job_submit(self):
+        """大量バッチジョブ投入（重複除去・チャンク処理、結果はページング取得）"""
+        try:
+            request_data = json.loads(self.read_request_body().decode('utf-8'))
+            queries = request_data.get('queries') if isinstance(request_data, dict) else None
+            
+            job = self.batch_jobs.submit(queries)
+            self.send_json_response({
+                **job,
+                "status_url": f"/batch/jobs/{job['job_id']}",
+                "results_url": f"/batch/jobs/{job['job_id']}/results?offset=0&limit={DEFAULT_PAGE_SIZE}"
+            }, status=202)
+            
+        except BatchJobError as e:
+            self.send_json_response({
+                "error": str(e),
+                "usage": '{"queries": ["企業名1", "企業名2", ...]}'
+            }, status=400)
+        except UnicodeDecodeError as e:
+            self.send_json_response({
+                "error": f"UTF-8 decoding error: {str(e)}",
+                "suggestion": "Please send request in UTF-8 encoding"
+            }, status=400)
+        except json.JSONDecodeError as e:
+            self.send_json_response({
+                "error": f"Invalid JSON format: {str(e)}"
+            }, status=400)
+        except Exception as e:
+            self.send_json_response({
+                "error": f"Batch job error: {str(e)}"
+            }, status=500)
+    
+    def handle_batch_job_get(self, path):
+        """バッチジョブの進捗（/batch/jobs/<id>）・結果ページ（/batch/jobs/<id>/results）"""
+        try:
+            parsed = urllib.parse.urlparse(path)
+            parts = parsed.path.strip('/').split('/')  # ['batch', 'jobs', id, ('results')]
+            job_id = parts[2] if len(parts) >= 3 else ''
+            
+            if len(parts) == 3:
+                data = self.batch_jobs.get_job(job_id)
+            elif len(parts) == 4 and parts[3] == 'results':
+                params = urllib.parse.parse_qs(parsed.query)
+                data = self.batch_jobs.get_results(
+                    job_id,
+                    offset=params.get('offset', ['0'])[0],
+                    limit=params.get('limit', [str(DEFAULT_PAGE_SIZE)])[0]
+                )
+            else:
+                self.send_json_response({"error": "Not Found"}, status=404)
+                return
+            
+            if data is None:
+                self.send_json_response({"error": f"Batch job not found: {job_id}"}, status=404)
+            else:
+                self.send_json_response(data)
+                
+        except ValueError as e:
+            self.send_json_response({"error": f"Invalid paging parameter: {str(e)}"}, status=400)
+        except Exception as e:
+            self.send_json_response({"error": f"Batch job error: {str(e)}"}, status=500)
+    
     def handle_correction(self):
         """修正データ処理"""
         try:
             # リクエストボディを読み取り（UTF-8対応）
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
+            post_data = self.read_request_body()
             
             # UTF-8でデコード
             json_str = post_data.decode('utf-8')
             correction_data = json.loads(json_str)
             
-            print(f"📝 Correction received:")
-            print(f"   Original Query: {correction_data.get('original_query', 'N/A')}")
-            print(f"   Predicted: {correction_data.get('predicted_name', 'N/A')}")
-            print(f"   Correct: {correction_data.get('correct_name', 'N/A')}")
+            log.info('correction_received', original_query=correction_data.get('original_query'),
+                     predicted_name=correction_data.get('predicted_name'),
+                     correct_name=correction_data.get('correct_name'))
             
             # 修正データをログファイルに保存
             correction_entry = {
+                'correction_id': self.correction_ids.next(),
                 'timestamp': correction_data.get('timestamp', datetime.now().isoformat()),
                 'original_query': correction_data.get('original_query'),
                 'predicted_name': correction_data.get('predicted_name'),
@@ -323,43 +648,40 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
             }
             
             # 修正ログファイルに追記
-            import os
-            correction_log = 'corrections.log'
-            with open(correction_log, 'a', encoding='utf-8') as f:
+            with open(CORRECTIONS_LOG, 'a', encoding='utf-8') as f:
                 f.write(json.dumps(correction_entry, ensure_ascii=False) + '\n')
             
             # 予測システムに修正を反映
             try:
-                print(f"🔧 Before correction - User corrections count: {len(self.prediction_system.user_corrections)}")
-                
                 success = self.prediction_system.add_user_correction(
                     correction_data.get('original_query'),
                     correction_data.get('predicted_name'),
-                    correction_data.get('correct_name')
+                    correction_data.get('correct_name'),
+                    correction_id=correction_entry['correction_id']
                 )
                 
-                print(f"🔧 After correction - User corrections count: {len(self.prediction_system.user_corrections)}")
-                if self.prediction_system.user_corrections:
-                    print("📝 Updated user corrections:")
-                    for key, correction in self.prediction_system.user_corrections.items():
-                        print(f"   '{key}' -> '{correction['correct_name']}'")
+                if log.is_enabled(DEBUG):
+                    # 全件の書き出しは DEBUG のときのみ（件数に比例するため）
+                    log.debug('user_corrections', entries={
+                        key: correction['correct_name']
+                        for key, correction in self.prediction_system.user_corrections.items()
+                    })
                 
                 if success:
-                    print(f"✅ Correction applied to prediction system")
+                    log.info('correction_applied', corrections=len(self.prediction_system.user_corrections))
                 else:
-                    print(f"⚠️  Failed to apply correction to prediction system")
+                    log.warning('correction_not_applied', original_query=correction_data.get('original_query'))
             except Exception as e:
-                print(f"❌ Error applying correction: {e}")
+                log.error('correction_failed', exc_info=True, error=str(e))
             
             response = {
                 'success': True,
                 'message': 'Correction received and logged',
-                'correction_id': len(self.charset_test_results) + 1,
+                'correction_id': correction_entry['correction_id'],
                 'data': correction_entry,
                 'next_steps': 'Correction will be applied to improve future predictions'
             }
             
-            print(f"✅ Correction logged successfully")
             self.send_json_response(response)
             
         except UnicodeDecodeError as e:
@@ -389,7 +711,7 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
             test_results.append({
                 "query": query,
                 "length": len(query),
-                "has_japanese": any('\u3040' <= c <= '\u309F' or '\u30A0' <= c <= '\u30FF' or '\u4E00' <= c <= '\u9FAF' for c in query),
+                "has_japanese": has_japanese(query),
                 "charset_issues": charset_issues,
                 "status": "✅ OK" if not charset_issues else f"❌ Issues: {', '.join(charset_issues)}"
             })
@@ -402,7 +724,10 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
                 "failed": sum(1 for r in test_results if r['charset_issues']),
                 "charset_quality": "Perfect" if all(not r['charset_issues'] for r in test_results) else "Issues Found"
             },
-            "universal_framework_compliance": all(not r['charset_issues'] for r in test_results)
+            "universal_framework_compliance": all(not r['charset_issues'] for r in test_results),
+            # 実際の予測クエリの集計（全件）と直近のサンプル
+            "live_queries": self.charset_stats.get_stats(),
+            "recent_samples": self.charset_stats.recent(limit=20)
         }
         
         self.send_json_response(response)
@@ -429,26 +754,46 @@ class Phase15FixedAPIHandler(http.server.SimpleHTTPRequestHandler):
         
         return issues
     
+    def wants_pretty_json(self):
+        """?pretty=1 が指定されているか"""
+        query = urllib.parse.urlsplit(self.path).query
+        return bool(query) and urllib.parse.parse_qs(query).get('pretty', ['0'])[0] in ('1', 'true')
+    
     def send_json_response(self, data, status=200):
-        """JSON レスポンス送信（UTF-8完全対応）"""
+        """JSON レスポンス送信（UTF-8、既定はコンパクト。Accept-Encoding に応じて圧縮）"""
+        body = json_dumps(data, pretty=self.wants_pretty_json())
+        body, content_encoding = compress_body(body, self.headers.get('Accept-Encoding'))
+        
         self.send_response(status)
         self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if content_encoding:
+            self.send_header('Content-Encoding', content_encoding)
+        self.send_header('Vary', 'Accept-Encoding')
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
-        
-        # UTF-8エンコーディングを明示的に指定
-        json_data = json.dumps(data, ensure_ascii=False, indent=2)
-        self.wfile.write(json_data.encode('utf-8'))
+        self.wfile.write(body)
+    
+    def send_text_response(self, text, content_type):
+        """テキストレスポンス送信（/metrics 用）"""
+        body = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
     
     def send_html_response(self, html):
         """HTML レスポンス送信（UTF-8完全対応）"""
+        body = html.encode('utf-8')
         self.send_response(200)
         self.send_header('Content-type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.end_headers()
-        self.wfile.write(html.encode('utf-8'))
+        self.wfile.write(body)
     
     def get_docs_html(self):
         """API ドキュメント HTML（文字コード修正版）"""
@@ -565,24 +910,155 @@ Invoke-RestMethod http://localhost:8000/batch -Method POST -Body $body -ContentT
 </html>
         """
     
+    def log_request(self, code='-', size='-'):
+        """アクセスログ（サンプリング対象）"""
+        log.info('access', sampled=True, client=self.address_string(), request=self.requestline, status=str(code))
+    
+    def log_error(self, format, *args):
+        # keep-alive 接続のアイドルタイムアウトは正常な切断
+        if format.startswith('Request timed out'):
+            log.debug('keepalive_timeout', client=self.address_string(), requests=self.requests_on_connection)
+            return
+        self.log_message(format, *args)
+    
     def log_message(self, format, *args):
-        """ログメッセージをカスタマイズ（UTF-8対応）"""
-        message = format % args
-        print(f"📡 {self.address_string()} - {message}")
+        """その他のサーバーメッセージ（エラー応答など）"""
+        log.warning('http', client=self.address_string(), message=format % args)
 
-def run_fixed_server():
+class ThreadPoolHTTPServer(socketserver.TCPServer):
+    """スレッドプール版サーバー（同時処理数を workers に制限）"""
+    
+    allow_reuse_address = True
+    request_queue_size = 128
+    
+    def __init__(self, server_address, handler_class, workers):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-worker')
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(workers)
+        self._active_lock = threading.Lock()
+        self.active_connections = 0
+    
+    def has_idle_worker(self):
+        """処理中・keep-alive 待機中でないワーカーが残っているか"""
+        return self.active_connections < self.workers
+    
+    def process_request(self, request, client_address):
+        # 空きワーカーがなければ accept を止め、カーネルの backlog で待たせる
+        self._slots.acquire()
+        with self._active_lock:
+            self.active_connections += 1
+        self.executor.submit(self._process_request, request, client_address)
+    
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._active_lock:
+                self.active_connections -= 1
+            self._slots.release()
+    
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+class PreforkHTTPServer(socketserver.TCPServer):
+    """pre-fork 版サーバー（N プロセスが同じ待ち受けソケットを共有）"""
+    
+    allow_reuse_address = True
+    request_queue_size = 128
+    
+    def serve_prefork(self, workers):
+        """ワーカーを fork し、異常終了したワーカーは再起動する"""
+        children = set()
+        stopping = False
+        
+        def spawn():
+            pid = os.fork()
+            if pid == 0:
+                # ワーカー: DB 接続は接続プールが fork 後に自動で開き直す
+                signal.signal(signal.SIGTERM, signal.default_int_handler)
+                exit_code = 0
+                try:
+                    self.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+                except Exception as e:
+                    print(f"❌ Worker {os.getpid()} error: {e}")
+                    exit_code = 1
+                finally:
+                    # os._exit は atexit を実行しないため未出力のログをここで書き出す
+                    shutdown_logging()
+                    os._exit(exit_code)
+            children.add(pid)
+            print(f"👷 Worker started: pid {pid}")
+        
+        # SIGTERM も Ctrl+C と同じ停止処理にする
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        for _ in range(workers):
+            spawn()
+        
+        try:
+            while children:
+                pid, status = os.wait()
+                children.discard(pid)
+                if not stopping:
+                    print(f"⚠️  Worker {pid} exited (status {status}) - restarting")
+                    spawn()
+        except KeyboardInterrupt:
+            stopping = True
+            # 停止処理中に届く重複シグナルは無視する
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for pid in list(children):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            raise
+
+def run_fixed_server(host="0.0.0.0", port=8001, mode='single', workers=None):
     """修正版サーバー起動"""
-    HOST = "0.0.0.0"
-    PORT = 8001  # 新しいポートで起動
+    HOST = host
+    PORT = port
+    workers = workers or os.cpu_count() or 1
     
     print("🌟 Phase 15: UTF-8 Fixed API Server Starting")
     print("🔧 文字コード完全修正版")
     print("📋 Universal Framework品質基準準拠")
     print("📅 Date:", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    print(f"⚙️  Mode: {mode}" + ("" if mode == 'single' else f" ({workers} workers)"))
     print()
     
     try:
-        with socketserver.TCPServer((HOST, PORT), Phase15FixedAPIHandler) as httpd:
+        # 最初のリクエストを待たずに予測システムを初期化（pre-fork では全ワーカーで共有）
+        Phase15FixedAPIHandler.initialize()
+        
+        if mode == 'single':
+            # 1接続ずつ処理するため、持続的接続は他のクライアントを待たせる
+            Phase15FixedAPIHandler.max_keepalive_requests = 1
+            print("🔌 Keep-alive: disabled in single mode")
+        else:
+            print(f"🔌 Keep-alive: idle timeout {HTTP_KEEPALIVE_TIMEOUT:g}s, "
+                  f"max {Phase15FixedAPIHandler.max_keepalive_requests} requests/connection"
+                  + (" (closed when all workers are busy)" if mode == 'thread' else ""))
+        
+        if mode == 'thread':
+            httpd = ThreadPoolHTTPServer((HOST, PORT), Phase15FixedAPIHandler, workers)
+        elif mode == 'prefork':
+            httpd = PreforkHTTPServer((HOST, PORT), Phase15FixedAPIHandler)
+        else:
+            httpd = socketserver.TCPServer((HOST, PORT), Phase15FixedAPIHandler)
+        
+        with httpd:
             print(f"✅ Fixed server running on http://{HOST}:{PORT}")
             print(f"📍 Windows PC Access: http://localhost:{PORT}")
             print(f"📖 API Documentation: http://localhost:{PORT}/docs")
@@ -594,12 +1070,39 @@ def run_fixed_server():
             print("Press Ctrl+C to stop the server")
             print("="*60)
             
-            httpd.serve_forever()
+            if mode == 'prefork':
+                httpd.serve_prefork(workers)
+            else:
+                httpd.serve_forever()
             
     except KeyboardInterrupt:
         print("\n🛑 Fixed server stopped by user")
     except Exception as e:
         print(f"❌ Fixed server error: {e}")
 
+def main():
+    """コマンドライン引数からサーバーを起動"""
+    parser = argparse.ArgumentParser(description="Phase 15 UTF-8 Fixed API Server")
+    parser.add_argument('--host', default="0.0.0.0", help="待ち受けアドレス")
+    parser.add_argument('--port', type=int, default=8001, help="待ち受けポート")
+    parser.add_argument(
+        '--mode',
+        choices=['single', 'thread', 'prefork'],
+        default='single',
+        help="single: 1リクエストずつ / thread: スレッドプール / prefork: マルチプロセス"
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=None,
+        help="thread のスレッド数・prefork のプロセス数（既定: CPU数）"
+    )
+    args = parser.parse_args()
+    
+    if args.mode == 'prefork' and not hasattr(os, 'fork'):
+        parser.error("prefork mode requires os.fork (Linux/macOS/WSL)")
+    
+    run_fixed_server(args.host, args.port, args.mode, args.workers)
+
 if __name__ == "__main__":
-    run_fixed_server()
\ No newline at end of file
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: CSV 取り込みのチェックポイント
+create_database.py / create_database_lite.py がバッチを挿入するたびに、同じトランザクションで
+入力ファイル上のバイト位置と件数を import_checkpoint テーブルに記録する。
+途中で失敗・中断しても DB は削除せず、再実行時に最後にコミットしたバッチの直後から再開する。
+
+入力ファイルのサイズ・更新時刻が記録時と異なる場合は再開しない（別ファイルの途中から読まない）。
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+CHECKPOINT_TABLE = 'import_checkpoint'
+
+# 取り込み中 → 全行取り込み済み（索引作成前）→ 完了
+STATUS_LOADING = 'loading'
+STATUS_LOADED = 'loaded'
+STATUS_COMPLETE = 'complete'
+
+
+def source_signature(path):
+    """入力ファイルの同一性（名前・サイズ・更新時刻）"""
+    st = os.stat(path)
+    return os.path.basename(path), st.st_size, st.st_mtime_ns
+
+
+def write_checkpoint(conn, source_path, byte_offset, row_count, error_count=0, status=STATUS_LOADING):
+    """チェックポイントを更新（呼び出し側でバッチと一緒に commit）"""
+    source, size, mtime_ns = source_signature(source_path)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            source TEXT NOT NULL,
+            source_size INTEGER NOT NULL,
+            source_mtime_ns INTEGER NOT NULL,
+            byte_offset INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            error_count INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute(
+        f"""
+        INSERT OR REPLACE INTO {CHECKPOINT_TABLE}
+            (id, source, source_size, source_mtime_ns, byte_offset, row_count, error_count, status, updated_at)
+        VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (source, size, mtime_ns, byte_offset, row_count, error_count, status,
+         datetime.now().strftime('%Y-%m-%dT%H:%M:%S'))
+    )
+
+
+def read_checkpoint(conn):
+    """記録済みチェックポイント（なければ None）"""
+    try:
+        row = conn.execute(
+            f"""
+            SELECT source, source_size, source_mtime_ns, byte_offset, row_count, error_count, status, updated_at
+            FROM {CHECKPOINT_TABLE} WHERE id = 1
+            """
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if row is None:
+        return None
+    keys = ('source', 'source_size', 'source_mtime_ns', 'byte_offset', 'row_count', 'error_count', 'status', 'updated_at')
+    return dict(zip(keys, row))
+
+
+def resumable_checkpoint(db_path, source_path):
+    """再開できるチェックポイント: (checkpoint, None) または (None, 再開できない理由)"""
+    if not os.path.exists(db_path):
+        return None, "database not found"
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+    except sqlite3.Error as e:
+        return None, f"cannot open: {e}"
+    try:
+        checkpoint = read_checkpoint(conn)
+    except sqlite3.DatabaseError as e:
+        return None, f"cannot read checkpoint: {e}"
+    finally:
+        conn.close()
+
+    if checkpoint is None:
+        return None, "no checkpoint"
+    if checkpoint['status'] == STATUS_COMPLETE:
+        return None, "import already complete"
+    if (checkpoint['source'], checkpoint['source_size'], checkpoint['source_mtime_ns']) != source_signature(source_path):
+        return None, f"input file changed since checkpoint ({checkpoint['source']})"
+    return checkpoint, None
+
+
+class OffsetLineReader:
+    """バイナリファイルを1行ずつ文字列で返し、読み終えた位置（バイト）を offset に保持する
+
+    csv.reader は1レコード分の行だけを読むため、各レコードの直後で offset がそのレコード末尾を指す。
+    """
+
+    def __init__(self, f, encoding='utf-8', start=0):
+        self.f = f
+        self.encoding = encoding
+        self.f.seek(start)
+        self.offset = start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding)
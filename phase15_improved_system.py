@@ -11,12 +11,122 @@ import json
 from datetime import datetime
 import os
 
+from phase15_db_pool import get_pool
+from phase15_brand_registry import get_brand_registry
+from phase15_db_metadata import read_metadata
+from phase15_bloom_filter import load_bloom_filter, BLOOM_NAME, BLOOM_CORE
+from phase15_metrics import CascadeMetrics
+from build_corporate_index import (
+    FTS_TABLE, FTS_MIN_QUERY_LENGTH, LEGAL_FORMS,
+    LEGAL_FORM_PREFIX, LEGAL_FORM_SUFFIX, has_legal_form_affix, require_indexes
+)
+
+# Level 4 検索SQL（文字列を固定してプリペアドステートメントキャッシュを効かせる）
+SQL_EXACT_MATCH = """
+    SELECT name, corporate_number, prefecture_name 
+    FROM corporate_master 
+    WHERE name = ? 
+    LIMIT 1
+"""
+
+SQL_PREFIX_MATCH = """
+    SELECT name, corporate_number, prefecture_name 
+    FROM corporate_master 
+    WHERE name LIKE ? 
+    ORDER BY LENGTH(name)
+    LIMIT 1
+"""
+
+SQL_PARTIAL_MATCH = """
+    SELECT name, corporate_number, prefecture_name, 
+           LENGTH(name) as name_length
+    FROM corporate_master 
+    WHERE name LIKE ? 
+    ORDER BY LENGTH(name), name
+    LIMIT 3
+"""
+
+# 中核名（法人格除去済み）索引で全法人格の候補を一度に取得
+SQL_CORE_NAME_MATCH = """
+    SELECT name, corporate_number, prefecture_name, legal_form, legal_form_position
+    FROM corporate_master 
+    WHERE core_name = ? 
+    ORDER BY rowid
+"""
+
+# 法人格パターンの優先順位: 株式会社 → 有限会社 → 合同会社（各 前→後）、以降その他の法人格
+PRIMARY_LEGAL_FORMS = ['株式会社', '有限会社', '合同会社']
+LEGAL_FORM_PRIORITY = [
+    (form, position)
+    for form in PRIMARY_LEGAL_FORMS + [f for f in LEGAL_FORMS if f not in PRIMARY_LEGAL_FORMS]
+    for position in (LEGAL_FORM_PREFIX, LEGAL_FORM_SUFFIX)
+]
+
+# FTS5 trigram 索引版（前方一致・部分一致の候補を索引から取得）
+SQL_PREFIX_MATCH_FTS = f"""
+    SELECT m.name, m.corporate_number, m.prefecture_name 
+    FROM {FTS_TABLE} f 
+    JOIN corporate_master m ON m.rowid = f.rowid 
+    WHERE f.name LIKE ? 
+    ORDER BY m.name_length, m.rowid
+    LIMIT 1
+"""
+
+SQL_PARTIAL_MATCH_FTS = f"""
+    SELECT m.name, m.corporate_number, m.prefecture_name, 
+           m.name_length
+    FROM {FTS_TABLE} f 
+    JOIN corporate_master m ON m.rowid = f.rowid 
+    WHERE f.name LIKE ? 
+    ORDER BY m.name_length, m.name
+    LIMIT 3
+"""
+
+# 一括予測用: クエリごとの検索キー（完全一致・法人格パターン・中核名）を入れる一時テーブル
+SQL_CREATE_BATCH_KEYS = """
+    CREATE TEMP TABLE IF NOT EXISTS batch_keys (
+        query_id INTEGER NOT NULL,
+        priority INTEGER NOT NULL,
+        key TEXT NOT NULL
+    )
+"""
+
+# 単発の SQL_EXACT_MATCH（LIMIT 1）と同じく同名なら最小 rowid を採用
+SQL_EXACT_MATCH_MANY = """
+    SELECT b.query_id, b.priority, m.name, m.corporate_number, m.prefecture_name, MIN(m.rowid)
+    FROM temp.batch_keys b
+    JOIN corporate_master m ON m.name = b.key
+    GROUP BY b.query_id, b.priority
+"""
+
+SQL_CORE_NAME_MATCH_MANY = """
+    SELECT b.query_id, m.legal_form, m.legal_form_position,
+           m.name, m.corporate_number, m.prefecture_name, MIN(m.rowid)
+    FROM temp.batch_keys b
+    JOIN corporate_master m ON m.core_name = b.key
+    GROUP BY b.query_id, m.legal_form, m.legal_form_position
+"""
+
+# ブランドレジストリのテーブル名（brand_registry.json）
+LISTED_TABLE = 'improved_listed'
+BRAND_TABLE = 'improved_brand'
+
+# 計測するカスケード段階（呼び出し順）
+CASCADE_LEVELS = (
+    'level1_user_learning', 'level2_edinet_listed', 'level5_brand_mapping', 'level3_edinet_all',
+    'level4_corporate_number', 'level6_url_info', 'level7_ml_fallback'
+)
+
 class ImprovedCascadeSystem:
     """精度向上版カスケードシステム"""
     
     def __init__(self):
         # データベースパス（環境変数から取得、デフォルトは相対パス）
         self.db_path = os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db')
+        # 共有接続プール（サーバー・統計取得と共用）
+        self.db_pool = get_pool(self.db_path)
+        # Level 2/5 マッピング（起動時に一度だけ読み込む共有レジストリ）
+        self.brand_registry = get_brand_registry()
         self.performance_stats = {
             'level1_user_learning': 0,
             'level2_edinet_listed': 0,
@@ -35,23 +145,49 @@ class ImprovedCascadeSystem:
         # データベース確認
         self.verify_database()
         
-        # インデックス最適化
-        self.optimize_database()
+        # 必須索引の確認（索引は build_corporate_index.py でオフライン構築。起動時には作らない）
+        require_indexes(self.db_pool)
+        
+        # 部分一致用FTS5索引・中核名列（build_corporate_index.py で事前構築）
+        self.fts_enabled = self.db_pool.table_exists(FTS_TABLE)
+        if not self.fts_enabled:
+            print("⚠️  FTS5 index not found - LIKE scan fallback (run build_corporate_index.py)")
+        self.core_name_enabled = self.db_pool.column_exists('corporate_master', 'core_name')
+        if not self.core_name_enabled:
+            print("⚠️  core_name column not found - per-pattern lookups (run build_corporate_index.py)")
+        # 否定検索用 Bloom フィルタ（存在しない名称の完全一致・パターン探索を省略）
+        if self.bloom is None:
+            print("⚠️  Bloom filter not available - all Level 4 probes hit SQLite (run build_corporate_index.py)")
+        
+        # レベル別レイテンシ・source 別件数（/metrics）
+        self.metrics = CascadeMetrics('improved', CASCADE_LEVELS)
+        self.metrics.add_stats_collector('bloom_filter', self._bloom_stats, 'Bloom filter statistics')
+        self.metrics.add_stats_collector('cascade_stats', lambda: self.performance_stats, 'Cascade performance_stats')
+    
+    @property
+    def bloom(self):
+        """使用中の接続の DB 世代に対応する Bloom フィルタ（なければ None）"""
+        return self.db_pool.generation_resource('bloom', load_bloom_filter)
+    
+    def _bloom_stats(self):
+        bloom = self.bloom
+        return bloom.get_stats() if bloom is not None else None
     
     def verify_database(self):
-        """データベース検証"""
+        """データベース検証（件数は構築時のメタデータを使用）"""
         print("🔍 Verifying 3.52M corporate database...")
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with self.db_pool.connection() as conn:
+                metadata, problem = read_metadata(conn)
             
-            # 基本統計
-            cursor.execute("SELECT COUNT(*) FROM corporate_master")
-            total_count = cursor.fetchone()[0]
+            if metadata is None:
+                # 全件 COUNT(*) は起動時に行わない
+                print(f"⚠️  Database metadata unavailable ({problem}) - run build_corporate_index.py")
+                return False
             
-            print(f"✅ Database Size: {total_count:,} companies")
-            conn.close()
+            total_count = metadata['total_count']
+            print(f"✅ Database Size: {total_count:,} companies (schema {metadata['schema_fingerprint']})")
             
             return total_count > 3000000
             
@@ -59,89 +195,99 @@ class ImprovedCascadeSystem:
             print(f"❌ Database verification error: {e}")
             return False
 
-    def optimize_database(self):
-        """データベース最適化"""
-        print("⚡ Optimizing database for improved performance...")
+    def cascade_predict(self, query, user_id=None):
+        """改善版カスケード予測"""
+        start_time = time.perf_counter()
+        result = self._cascade_predict(query, user_id)
+        self.metrics.predict['miss'].observe(time.perf_counter() - start_time)
+        return result
+    
+    def cascade_predict_many(self, queries, user_id=None):
+        """複数クエリの一括カスケード予測（結果はクエリ順、各結果は単発予測と同一）"""
+        start_time = time.perf_counter()
+        unique = list(dict.fromkeys(queries))
+        
+        # Level 4 の完全一致・法人格パターンを一時テーブルとの JOIN で一括解決
+        prefetched = self._prefetch_level4(unique)
+        
+        resolved = {
+            query: self._cascade_predict(query, user_id, level4_prefetched=prefetched)
+            for query in unique
+        }
+        self.metrics.batch.observe(time.perf_counter() - start_time)
+        return [dict(resolved[query]) for query in queries]
+    
+    def _prefetch_level4(self, queries):
+        """Level 4 完全一致・法人格パターンの一括解決 {query: 結果 or None}（失敗時は None）"""
+        # Level 2/5 で確定するクエリは Level 4 に到達しないため対象外
+        listed = self.brand_registry.table(LISTED_TABLE)
+        brands = self.brand_registry.table(BRAND_TABLE)
+        targets = [
+            query for query in queries
+            if not (query in listed and listed[query][1] >= 0.95)
+            and not (query in brands and brands[query][1] >= 0.90)
+        ]
+        if not targets:
+            return {}
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 高速検索用インデックス
-            indexes = [
-                "CREATE INDEX IF NOT EXISTS idx_name_exact ON corporate_master(name)",
-                "CREATE INDEX IF NOT EXISTS idx_name_prefix ON corporate_master(substr(name, 1, 10))",
-                "CREATE INDEX IF NOT EXISTS idx_name_suffix ON corporate_master(substr(name, -10))",
-                "CREATE INDEX IF NOT EXISTS idx_corporate_number ON corporate_master(corporate_number)"
-            ]
-            
-            for index_sql in indexes:
-                cursor.execute(index_sql)
-            
-            # パフォーマンス設定
-            cursor.execute("PRAGMA cache_size=100000")
-            cursor.execute("PRAGMA temp_store=MEMORY")
-            cursor.execute("PRAGMA synchronous=OFF")
-            
-            conn.commit()
-            conn.close()
-            
-            print("✅ Database optimization completed")
-            
+            with self.db_pool.connection() as conn:
+                return self._match_exact_or_pattern_many(conn.cursor(), targets)
         except Exception as e:
-            print(f"❌ Optimization error: {e}")
+            print(f"❌ Level 4 batch search error: {e}")
+            return None
     
-    def cascade_predict(self, query, user_id=None):
-        """改善版カスケード予測"""
-        start_time = time.time()
+    def _cascade_predict(self, query, user_id=None, level4_prefetched=None):
+        """改善版カスケード予測（level4_prefetched: 一括解決済みの Level 4 結果）"""
+        start_time = time.perf_counter()
         self.performance_stats['total_queries'] += 1
         
         print(f"🔍 Predicting: '{query}'")
         
         # Level 1: ユーザー学習データ (100%精度) - 将来実装
-        result = self.level1_user_learning(query, user_id)
+        result = self.metrics.run_level('level1_user_learning', self.level1_user_learning, query, user_id)
         if result and result['confidence'] >= 0.98:
             self.performance_stats['level1_user_learning'] += 1
             print(f"   ✅ Level 1 (User Learning): {result['prediction']}")
             return self._finalize_result(result, start_time)
         
         # Level 2: EDINET上場企業 (99.2%精度)
-        result = self.level2_edinet_listed(query)
+        result = self.metrics.run_level('level2_edinet_listed', self.level2_edinet_listed, query)
         if result and result['confidence'] >= 0.95:
             self.performance_stats['level2_edinet_listed'] += 1
             print(f"   ✅ Level 2 (EDINET Listed): {result['prediction']}")
             return self._finalize_result(result, start_time)
         
         # Level 5: ブランド・通称名 (95%精度) - 優先順位を上げる
-        result = self.level5_brand_mapping(query)
+        result = self.metrics.run_level('level5_brand_mapping', self.level5_brand_mapping, query)
         if result and result['confidence'] >= 0.90:
             self.performance_stats['level5_brand_mapping'] += 1
             print(f"   ✅ Level 5 (Brand Mapping): {result['prediction']}")
             return self._finalize_result(result, start_time)
         
         # Level 3: EDINET全企業 (95%精度)
-        result = self.level3_edinet_all(query)
+        result = self.metrics.run_level('level3_edinet_all', self.level3_edinet_all, query)
         if result and result['confidence'] >= 0.90:
             self.performance_stats['level3_edinet_all'] += 1
             print(f"   ✅ Level 3 (EDINET All): {result['prediction']}")
             return self._finalize_result(result, start_time)
         
         # Level 4: 法人番号DB (352万社) (92%精度) - 改善版
-        result = self.level4_corporate_number(query)
+        result = self.metrics.run_level('level4_corporate_number', self.level4_corporate_number, query, level4_prefetched)
         if result and result['confidence'] >= 0.85:
             self.performance_stats['level4_corporate_number'] += 1
             print(f"   ✅ Level 4 (Corporate DB): {result['prediction']}")
             return self._finalize_result(result, start_time)
         
         # Level 6: URL・企業情報 (85%精度)
-        result = self.level6_url_info(query)
+        result = self.metrics.run_level('level6_url_info', self.level6_url_info, query)
         if result and result['confidence'] >= 0.80:
             self.performance_stats['level6_url_info'] += 1
             print(f"   ✅ Level 6 (URL Info): {result['prediction']}")
             return self._finalize_result(result, start_time)
         
         # Level 7: ML予測（フォールバック）(91%精度)
-        result = self.level7_ml_fallback(query)
+        result = self.metrics.run_level('level7_ml_fallback', self.level7_ml_fallback, query)
         self.performance_stats['level7_ml_fallback'] += 1
         print(f"   ✅ Level 7 (ML Fallback): {result['prediction']}")
         return self._finalize_result(result, start_time)
@@ -153,27 +299,9 @@ class ImprovedCascadeSystem:
     
     def level2_edinet_listed(self, query):
         """Level 2: EDINET上場企業（拡張版）"""
-        listed_companies = {
-            # 主要上場企業（正式名称マッピング）
-            "トヨタ": ("トヨタ自動車株式会社", 0.995),
-            "ソニー": ("ソニーグループ株式会社", 0.995),
-            "ソフトバンク": ("ソフトバンクグループ株式会社", 0.995),
-            "楽天": ("楽天グループ株式会社", 0.995),
-            "KDDI": ("KDDI株式会社", 0.995),
-            "NTT": ("日本電信電話株式会社", 0.995),
-            "ホンダ": ("本田技研工業株式会社", 0.995),
-            "日産": ("日産自動車株式会社", 0.995),
-            "パナソニック": ("パナソニックホールディングス株式会社", 0.995),
-            "任天堂": ("任天堂株式会社", 0.995),
-            "キャノン": ("キヤノン株式会社", 0.995),
-            "オリックス": ("オリックス株式会社", 0.995),
-            "三菱UFJ": ("株式会社三菱UFJフィナンシャル・グループ", 0.995),
-            "みずほ": ("株式会社みずほフィナンシャルグループ", 0.995),
-            "三井住友": ("株式会社三井住友フィナンシャルグループ", 0.995)
-        }
-        
-        if query in listed_companies:
-            name, confidence = listed_companies[query]
+        entry = self.brand_registry.lookup(LISTED_TABLE, query)
+        if entry:
+            name, confidence = entry
             return {
                 'prediction': name,
                 'confidence': confidence,
@@ -187,177 +315,208 @@ class ImprovedCascadeSystem:
         # 将来実装: 実際のEDINETデータとの連携
         return None
     
-    def level4_corporate_number(self, query):
-        """Level 4: 法人番号DB (352万社) - 改善版"""
+    def level4_corporate_number(self, query, prefetched=None):
+        """Level 4: 法人番号DB (352万社) - 改善版
+        
+        prefetched: cascade_predict_many が一括解決した完全一致・法人格パターン結果
+        """
+        # 一括解決済みのクエリは前方一致・部分一致検索のみ行う
+        if prefetched and query in prefetched:
+            if prefetched[query]:
+                return dict(prefetched[query])
+            skip_exact = True
+        else:
+            skip_exact = False
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 1. 完全一致検索（最優先）
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name 
-                FROM corporate_master 
-                WHERE name = ? 
-                LIMIT 1
-            """, (query,))
-            
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.98,
-                    'source': 'corporate_number_exact',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            # 2. 法人格パターン検索（優先度高）
-            patterns = [
-                f"株式会社{query}",
-                f"{query}株式会社",
-                f"有限会社{query}",
-                f"{query}有限会社",
-                f"合同会社{query}",
-                f"{query}合同会社"
-            ]
-            
-            for i, pattern in enumerate(patterns):
-                cursor.execute("""
-                    SELECT name, corporate_number, prefecture_name 
-                    FROM corporate_master 
-                    WHERE name = ? 
-                    LIMIT 1
-                """, (pattern,))
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                if not skip_exact:
+                    # 1. 完全一致検索（最優先）
+                    result = self._probe_exact(cursor, query)
+                    if result:
+                        return self._exact_result(result)
+                    
+                    # 2. 法人格パターン検索（優先度高）
+                    if self.core_name_enabled and not has_legal_form_affix(query):
+                        result = self._match_core_name(cursor, query)
+                    else:
+                        result = self._match_legal_form_patterns(cursor, query)
+                    if result:
+                        return result
+                
+                use_fts = self.fts_enabled and len(query) >= FTS_MIN_QUERY_LENGTH
+                
+                # 3. 前方一致検索（高精度）
+                cursor.execute(SQL_PREFIX_MATCH_FTS if use_fts else SQL_PREFIX_MATCH, (f"{query}%",))
                 
                 result = cursor.fetchone()
                 if result:
-                    conn.close()
-                    # 前株/後株による信頼度調整
-                    confidence = 0.95 if i < 2 else 0.92
                     return {
                         'prediction': result[0],
-                        'confidence': confidence,
-                        'source': 'corporate_number_pattern',
+                        'confidence': 0.90,
+                        'source': 'corporate_number_prefix',
                         'corporate_number': result[1],
                         'prefecture': result[2]
                     }
-            
-            # 3. 前方一致検索（高精度）
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name 
-                FROM corporate_master 
-                WHERE name LIKE ? 
-                ORDER BY LENGTH(name)
-                LIMIT 1
-            """, (f"{query}%",))
-            
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.90,
-                    'source': 'corporate_number_prefix',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            # 4. 部分一致検索（最低限）
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name, 
-                       LENGTH(name) as name_length
-                FROM corporate_master 
-                WHERE name LIKE ? 
-                ORDER BY LENGTH(name), name
-                LIMIT 3
-            """, (f"%{query}%",))
-            
-            results = cursor.fetchall()
-            if results:
-                # 最短名称を選択（より具体的な可能性が高い）
-                result = results[0]
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.75,
-                    'source': 'corporate_number_partial',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            conn.close()
-            return None
+                
+                # 4. 部分一致検索（最低限）
+                cursor.execute(SQL_PARTIAL_MATCH_FTS if use_fts else SQL_PARTIAL_MATCH, (f"%{query}%",))
+                
+                results = cursor.fetchall()
+                if results:
+                    # 最短名称を選択（より具体的な可能性が高い）
+                    result = results[0]
+                    return {
+                        'prediction': result[0],
+                        'confidence': 0.75,
+                        'source': 'corporate_number_partial',
+                        'corporate_number': result[1],
+                        'prefecture': result[2]
+                    }
+                
+                return None
             
         except Exception as e:
             print(f"❌ Level 4 search error: {e}")
             return None
     
+    def _probe_exact(self, cursor, name):
+        """社名完全一致（Bloom フィルタで不在と判定できれば SQL を省略）"""
+        bloom = self.bloom
+        if bloom is not None and not bloom.check(BLOOM_NAME, name):
+            return None
+        cursor.execute(SQL_EXACT_MATCH, (name,))
+        result = cursor.fetchone()
+        if result is None and bloom is not None:
+            bloom.record_false_positive()
+        return result
+    
+    def _match_core_name(self, cursor, query):
+        """中核名索引1回の検索で法人格パターンを解決"""
+        bloom = self.bloom
+        if bloom is not None and not bloom.check(BLOOM_CORE, query):
+            return None
+        cursor.execute(SQL_CORE_NAME_MATCH, (query,))
+        rows = cursor.fetchall()
+        if not rows and bloom is not None:
+            bloom.record_false_positive()
+        
+        # 法人格・位置ごとに最初（最小rowid）の候補を保持
+        candidates = {}
+        for name, corporate_number, prefecture, legal_form, position in rows:
+            candidates.setdefault((legal_form, position), (name, corporate_number, prefecture))
+        
+        return self._best_legal_form_candidate(candidates)
+    
+    def _best_legal_form_candidate(self, candidates):
+        """{(法人格, 位置): 行} から LEGAL_FORM_PRIORITY 順で最初の候補"""
+        for i, key in enumerate(LEGAL_FORM_PRIORITY):
+            if key in candidates:
+                # 前株/後株による信頼度調整
+                return self._pattern_result(candidates[key], 0.95 if i < 2 else 0.92)
+        return None
+    
+    def _legal_form_patterns(self, query):
+        """中核名列がない場合の法人格パターン（優先順）"""
+        return [
+            f"株式会社{query}",
+            f"{query}株式会社",
+            f"有限会社{query}",
+            f"{query}有限会社",
+            f"合同会社{query}",
+            f"{query}合同会社"
+        ]
+    
+    def _match_legal_form_patterns(self, cursor, query):
+        """法人格パターンを1件ずつ完全一致検索（中核名列がない場合）"""
+        for i, pattern in enumerate(self._legal_form_patterns(query)):
+            result = self._probe_exact(cursor, pattern)
+            if result:
+                # 前株/後株による信頼度調整
+                return self._pattern_result(result, 0.95 if i < 2 else 0.92)
+        return None
+    
+    def _match_exact_or_pattern_many(self, cursor, queries):
+        """完全一致・法人格パターン検索の一括版: 社名 JOIN 1回 + 中核名 JOIN 1回"""
+        bloom = self.bloom
+        name_keys = []  # (query_id, 優先度, 社名) 0: 完全一致, 1〜: 法人格パターン順
+        core_keys = []
+        core_queries = set()
+        for query_id, query in enumerate(queries):
+            keys = [(0, query)]
+            if self.core_name_enabled and not has_legal_form_affix(query):
+                core_queries.add(query_id)
+                if bloom is None or bloom.check(BLOOM_CORE, query):
+                    core_keys.append((query_id, 0, query))
+            else:
+                keys += list(enumerate(self._legal_form_patterns(query), start=1))
+            for priority, key in keys:
+                if bloom is None or bloom.check(BLOOM_NAME, key):
+                    name_keys.append((query_id, priority, key))
+        
+        cursor.execute(SQL_CREATE_BATCH_KEYS)
+        
+        name_hits = {}
+        cursor.execute("DELETE FROM temp.batch_keys")
+        cursor.executemany("INSERT INTO temp.batch_keys VALUES (?, ?, ?)", name_keys)
+        for query_id, priority, name, corporate_number, prefecture, _ in cursor.execute(SQL_EXACT_MATCH_MANY).fetchall():
+            name_hits.setdefault(query_id, {})[priority] = (name, corporate_number, prefecture)
+        if bloom is not None:
+            for _ in range(len(name_keys) - sum(len(hits) for hits in name_hits.values())):
+                bloom.record_false_positive()
+        
+        core_hits = {}
+        if core_keys:
+            cursor.execute("DELETE FROM temp.batch_keys")
+            cursor.executemany("INSERT INTO temp.batch_keys VALUES (?, ?, ?)", core_keys)
+            rows = cursor.execute(SQL_CORE_NAME_MATCH_MANY).fetchall()
+            for query_id, legal_form, position, name, corporate_number, prefecture, _ in rows:
+                core_hits.setdefault(query_id, {})[(legal_form, position)] = (name, corporate_number, prefecture)
+            if bloom is not None:
+                for _ in range(len(core_keys) - len(core_hits)):
+                    bloom.record_false_positive()
+        cursor.execute("DELETE FROM temp.batch_keys")
+        
+        results = {}
+        for query_id, query in enumerate(queries):
+            hits = name_hits.get(query_id, {})
+            if 0 in hits:
+                results[query] = self._exact_result(hits[0])
+            elif query_id in core_queries:
+                results[query] = self._best_legal_form_candidate(core_hits.get(query_id, {}))
+            else:
+                priority = min((p for p in hits if p > 0), default=None)
+                results[query] = (
+                    self._pattern_result(hits[priority], 0.95 if priority <= 2 else 0.92)
+                    if priority is not None else None
+                )
+        return results
+    
+    def _exact_result(self, row):
+        return {
+            'prediction': row[0],
+            'confidence': 0.98,
+            'source': 'corporate_number_exact',
+            'corporate_number': row[1],
+            'prefecture': row[2]
+        }
+    
+    def _pattern_result(self, row, confidence):
+        return {
+            'prediction': row[0],
+            'confidence': confidence,
+            'source': 'corporate_number_pattern',
+            'corporate_number': row[1],
+            'prefecture': row[2]
+        }
+    
     def level5_brand_mapping(self, query):
         """Level 5: ブランド・通称名マッピング（大幅拡張）"""
-        brand_mapping = {
-            # 小売・飲食チェーン
-            "マック": ("日本マクドナルド株式会社", 0.98),
-            "マクド": ("日本マクドナルド株式会社", 0.98),
-            "マクドナルド": ("日本マクドナルド株式会社", 0.99),
-            "ケンタ": ("日本KFCホールディングス株式会社", 0.98),
-            "ケンタッキー": ("日本KFCホールディングス株式会社", 0.99),
-            "ユニクロ": ("株式会社ファーストリテイリング", 0.99),
-            "GU": ("株式会社ジーユー", 0.99),
-            "セブン": ("株式会社セブン&アイ・ホールディングス", 0.98),
-            "セブンイレブン": ("株式会社セブン-イレブン・ジャパン", 0.99),
-            "ローソン": ("株式会社ローソン", 0.99),
-            "ファミマ": ("株式会社ファミリーマート", 0.98),
-            "ファミリーマート": ("株式会社ファミリーマート", 0.99),
-            "スタバ": ("スターバックス コーヒー ジャパン株式会社", 0.98),
-            "スターバックス": ("スターバックス コーヒー ジャパン株式会社", 0.99),
-            "すき家": ("株式会社すき家", 0.99),
-            "吉野家": ("株式会社吉野家", 0.99),
-            "松屋": ("株式会社松屋フーズ", 0.98),
-            
-            # 金融機関
-            "三菱東京UFJ": ("株式会社三菱UFJ銀行", 0.98),
-            "三菱UFJ": ("株式会社三菱UFJ銀行", 0.98),
-            "みずほ": ("株式会社みずほ銀行", 0.98),
-            "三井住友": ("株式会社三井住友銀行", 0.98),
-            "りそな": ("株式会社りそな銀行", 0.98),
-            "ゆうちょ": ("株式会社ゆうちょ銀行", 0.98),
-            
-            # 通信・IT
-            "ドコモ": ("株式会社NTTドコモ", 0.99),
-            "au": ("KDDI株式会社", 0.98),
-            "ヤフー": ("ヤフー株式会社", 0.99),
-            "LINE": ("LINE株式会社", 0.99),
-            "メルカリ": ("株式会社メルカリ", 0.99),
-            
-            # 自動車
-            "トヨタ": ("トヨタ自動車株式会社", 0.99),
-            "ホンダ": ("本田技研工業株式会社", 0.99),
-            "日産": ("日産自動車株式会社", 0.99),
-            "マツダ": ("マツダ株式会社", 0.99),
-            "スバル": ("株式会社SUBARU", 0.99),
-            "三菱自動車": ("三菱自動車工業株式会社", 0.99),
-            
-            # エンタメ・ゲーム
-            "任天堂": ("任天堂株式会社", 0.99),
-            "カプコン": ("株式会社カプコン", 0.99),
-            "バンナム": ("株式会社バンダイナムコホールディングス", 0.98),
-            "スクエニ": ("株式会社スクウェア・エニックス", 0.98),
-            "コナミ": ("コナミホールディングス株式会社", 0.99),
-            
-            # 家電・電子機器
-            "ソニー": ("ソニーグループ株式会社", 0.99),
-            "パナソニック": ("パナソニックホールディングス株式会社", 0.99),
-            "シャープ": ("シャープ株式会社", 0.99),
-            "東芝": ("株式会社東芝", 0.99),
-            "富士通": ("富士通株式会社", 0.99),
-            "NEC": ("日本電気株式会社", 0.99),
-            "キャノン": ("キヤノン株式会社", 0.99),
-            "ニコン": ("株式会社ニコン", 0.99)
-        }
-        
-        if query in brand_mapping:
-            name, confidence = brand_mapping[query]
+        entry = self.brand_registry.lookup(BRAND_TABLE, query)
+        if entry:
+            name, confidence = entry
             return {
                 'prediction': name,
                 'confidence': confidence,
@@ -395,8 +554,9 @@ class ImprovedCascadeSystem:
     
     def _finalize_result(self, result, start_time):
         """結果最終化・統計更新"""
-        response_time = (time.time() - start_time) * 1000
+        response_time = (time.perf_counter() - start_time) * 1000
         result['response_time_ms'] = response_time
+        self.metrics.count_source(result.get('source', 'unknown'))
         
         # 統計更新
         if self.performance_stats['total_queries'] > 0:
@@ -505,6 +665,14 @@ class ImprovedCascadeSystem:
         print(f"  Response Time: {self.performance_stats['avg_response_time']:.1f}ms (Target: <100ms) {response_status}")
         print(f"  Database Scale: 3.52M companies ✅ ACHIEVED")
         
+        # Bloom フィルタ効果
+        if self.bloom is not None:
+            bloom_stats = self.bloom.get_stats()
+            print(f"\n🌸 Bloom Filter (Level 4):")
+            print(f"  Probes Saved: {bloom_stats['probes_skipped']}/{bloom_stats['checks']}")
+            print(f"  False Positive Rate: {bloom_stats['observed_fp_rate']:.2%} "
+                  f"(configured {bloom_stats['configured_fp_rate']:.2%})")
+        
         # 改善効果
         print(f"\n📈 Improvement Analysis:")
         improvement_accuracy = accuracy - 70  # 前回70%から
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: 構造化ログ（レベル・サンプリング・別スレッド出力）
+リクエスト処理中は logging.LogRecord をキューに積むだけで戻り、整形・書き込みはリスナースレッドで行う。
+キューが満杯の場合は記録を破棄してリクエストを待たせない（破棄件数は dropped_records()）。
+
+環境変数:
+  LOG_LEVEL       : DEBUG / INFO / WARNING / ERROR（既定 INFO）
+  LOG_FORMAT      : text（key=value）/ json（1行1オブジェクト）
+  LOG_SAMPLE_RATE : リクエスト単位のログ（sampled=True）を出力する割合 0.0〜1.0（既定 1.0）
+  LOG_QUEUE_SIZE  : 出力待ちキューの上限
+
+使い方:
+  log = get_logger('api')
+  log.info('prediction', sampled=True, query=query, source=result['source'])
+  if log.is_enabled(DEBUG):  # O(N) の内容は有効時のみ組み立てる
+      log.debug('corrections', entries=...)
+"""
+
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import logging.handlers
+from datetime import datetime
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+LOGGER_ROOT = 'companygenius'
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
+
+class StructuredFormatter(logging.Formatter):
+    """イベント名 + フィールドを text（key=value）または json で1行に整形"""
+
+    def __init__(self, output_format='text'):
+        super().__init__()
+        self.output_format = output_format
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds')
+        fields = getattr(record, 'fields', None) or {}
+        if self.output_format == 'json':
+            entry = {
+                'ts': timestamp,
+                'level': record.levelname,
+                'logger': record.name,
+                'event': record.getMessage(),
+                'pid': record.process,
+                **fields
+            }
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, ensure_ascii=False, default=str)
+
+        line = f"{timestamp} {record.levelname:<7} {record.name} {record.getMessage()}"
+        for key, value in fields.items():
+            line += f" {key}={value!r}" if isinstance(value, str) else f" {key}={value}"
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """整形せずにキューへ積む（満杯なら破棄）"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # 既定の prepare は呼び出し側スレッドで整形するため、記録をそのまま渡す
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_handler = None
+_listener = None
+
+
+def _start_listener():
+    """出力キューとリスナースレッドを作成（プロセスごと）"""
+    global _handler, _listener
+    root = logging.getLogger(LOGGER_ROOT)
+    if _handler is not None:
+        root.removeHandler(_handler)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(LOG_FORMAT))
+    _handler = _DroppingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    root.addHandler(_handler)
+    _listener.start()
+
+
+def shutdown_logging():
+    """未出力の記録を書き出してからリスナーを止める（os._exit する前にも呼ぶ）"""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    # pre-fork ワーカーには親のリスナースレッドが引き継がれないため作り直す
+    global _lock
+    _lock = threading.Lock()
+    if _handler is not None:
+        _start_listener()
+
+
+def configure_logging():
+    """ロガー設定（初回のみ。get_logger から呼ばれる）"""
+    with _lock:
+        if _handler is not None:
+            return
+        root = logging.getLogger(LOGGER_ROOT)
+        root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+        root.propagate = False
+        _start_listener()
+        atexit.register(shutdown_logging)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def dropped_records():
+    """キュー満杯で破棄した記録数"""
+    return _handler.dropped if _handler is not None else 0
+
+
+class StructuredLogger:
+    """イベント名 + キーワード引数のフィールドで記録するロガー"""
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(f"{LOGGER_ROOT}.{name}")
+
+    def is_enabled(self, level):
+        """level が出力対象か（O(N) のフィールドを組み立てる前に確認する）"""
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, event, sampled, exc_info, fields):
+        if not self._logger.isEnabledFor(level):
+            return
+        if sampled and LOG_SAMPLE_RATE < 1.0:
+            if random.random() >= LOG_SAMPLE_RATE:
+                return
+            fields['sample_rate'] = LOG_SAMPLE_RATE
+        self._logger.log(level, event, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, event, sampled=False, **fields):
+        self._log(DEBUG, event, sampled, False, fields)
+
+    def info(self, event, sampled=False, **fields):
+        self._log(INFO, event, sampled, False, fields)
+
+    def warning(self, event, sampled=False, **fields):
+        self._log(WARNING, event, sampled, False, fields)
+
+    def error(self, event, exc_info=False, **fields):
+        # エラーはサンプリングしない
+        self._log(ERROR, event, False, exc_info, fields)
+
+
+def get_logger(name):
+    """構造化ロガーを取得（companygenius.<name>）"""
+    configure_logging()
+    return StructuredLogger(name)
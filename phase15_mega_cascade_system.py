@@ -12,12 +12,97 @@ import json
 from datetime import datetime
 import os
 
+from phase15_db_pool import get_pool
+from phase15_brand_registry import get_brand_registry
+from phase15_result_cache import create_result_cache
+from phase15_bloom_filter import load_bloom_filter, BLOOM_NAME, BLOOM_CORE
+from phase15_db_metadata import read_metadata, load_metadata
+from phase15_metrics import CascadeMetrics
+from build_corporate_index import (
+    FTS_TABLE, FTS_MIN_QUERY_LENGTH,
+    LEGAL_FORM_PREFIX, LEGAL_FORM_SUFFIX, has_legal_form_affix, require_indexes
+)
+
+# Level 4 検索SQL（文字列を固定してプリペアドステートメントキャッシュを効かせる）
+SQL_EXACT_MATCH = """
+    SELECT name, corporate_number, prefecture_name 
+    FROM corporate_master 
+    WHERE name = ? 
+    LIMIT 1
+"""
+
+SQL_PARTIAL_MATCH = """
+    SELECT name, corporate_number, prefecture_name 
+    FROM corporate_master 
+    WHERE name LIKE ? 
+    ORDER BY LENGTH(name)
+    LIMIT 1
+"""
+
+# 中核名（法人格除去済み）索引で前株・後株の候補を一度に取得
+SQL_CORE_NAME_MATCH = """
+    SELECT name, corporate_number, prefecture_name, legal_form_position
+    FROM corporate_master 
+    WHERE core_name = ? AND legal_form = '株式会社'
+    ORDER BY rowid
+"""
+
+# FTS5 trigram 索引で候補を絞り、格納済み name_length で最短名を選ぶ
+SQL_PARTIAL_MATCH_FTS = f"""
+    SELECT m.name, m.corporate_number, m.prefecture_name 
+    FROM {FTS_TABLE} f 
+    JOIN corporate_master m ON m.rowid = f.rowid 
+    WHERE f.name LIKE ? 
+    ORDER BY m.name_length, m.rowid
+    LIMIT 1
+"""
+
+# 一括予測用: クエリごとの検索キー（完全一致・法人格パターン・中核名）を入れる一時テーブル
+SQL_CREATE_BATCH_KEYS = """
+    CREATE TEMP TABLE IF NOT EXISTS batch_keys (
+        query_id INTEGER NOT NULL,
+        priority INTEGER NOT NULL,
+        key TEXT NOT NULL
+    )
+"""
+
+# 単発の SQL_EXACT_MATCH（LIMIT 1）と同じく同名なら最小 rowid を採用
+SQL_EXACT_MATCH_MANY = """
+    SELECT b.query_id, b.priority, m.name, m.corporate_number, m.prefecture_name, MIN(m.rowid)
+    FROM temp.batch_keys b
+    JOIN corporate_master m ON m.name = b.key
+    GROUP BY b.query_id, b.priority
+"""
+
+SQL_CORE_NAME_MATCH_MANY = """
+    SELECT b.query_id, m.legal_form_position, m.name, m.corporate_number, m.prefecture_name, MIN(m.rowid)
+    FROM temp.batch_keys b
+    JOIN corporate_master m ON m.core_name = b.key AND m.legal_form = '株式会社'
+    GROUP BY b.query_id, m.legal_form_position
+"""
+
+# ブランドレジストリのテーブル名（brand_registry.json）
+LISTED_TABLE = 'mega_listed'
+BRAND_TABLE = 'mega_brand'
+
+# 計測するカスケード段階（呼び出し順）
+CASCADE_LEVELS = (
+    'level1_user_learning', 'level2_edinet_listed', 'level3_edinet_all', 'level4_corporate_number',
+    'level5_brand_mapping', 'level6_url_info', 'level7_ml_fallback'
+)
+
 class MegaScaleCascadeSystem:
     """352万社基盤カスケードシステム"""
     
     def __init__(self):
         # データベースパス（環境変数から取得、デフォルトは相対パス）
         self.db_path = os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db')
+        # 共有接続プール（サーバー・統計取得と共用）
+        self.db_pool = get_pool(self.db_path)
+        # Level 2/5 マッピング（起動時に一度だけ読み込む共有レジストリ）
+        self.brand_registry = get_brand_registry()
+        # 予測結果キャッシュ（LRU + TTL）
+        self.result_cache = create_result_cache()
         self.performance_stats = {
             'level1_user_learning': 0,
             'level2_edinet_listed': 0,
@@ -27,146 +112,206 @@ class MegaScaleCascadeSystem:
             'level6_url_info': 0,
             'level7_ml_fallback': 0,
             'total_queries': 0,
+            'cache_hits': 0,
             'avg_response_time': 0
         }
         
         # 文字コード設定
         os.environ['PYTHONIOENCODING'] = 'utf-8'
         
-        # 352万社データベース確認
+        # 352万社データベース確認（構築時メタデータ）
         self.verify_mega_database()
         
-        # 高速検索のための最適化
-        self.optimize_for_performance()
+        # 必須索引の確認（索引は build_corporate_index.py でオフライン構築。起動時には作らない）
+        require_indexes(self.db_pool)
+        
+        # 部分一致用FTS5索引（build_corporate_index.py で事前構築）
+        self.fts_enabled = self.db_pool.table_exists(FTS_TABLE)
+        if not self.fts_enabled:
+            print("FTS5 index not found - partial match falls back to LIKE scan (run build_corporate_index.py)")
+        self.core_name_enabled = self.db_pool.column_exists('corporate_master', 'core_name')
+        if not self.core_name_enabled:
+            print("core_name column not found - per-pattern lookups (run build_corporate_index.py)")
+        # 否定検索用 Bloom フィルタ（存在しない名称の完全一致・パターン探索を省略）
+        if self.bloom is None:
+            print("Bloom filter not available - all Level 4 probes hit SQLite (run build_corporate_index.py)")
+        
+        # DB 世代切り替え・ブランドレジストリ再読み込み後は旧データの結果をキャッシュから返さない
+        self.db_pool.add_generation_listener(lambda info: self.result_cache.clear())
+        self.brand_registry.add_reload_listener(self.result_cache.clear)
+        
+        # レベル別レイテンシ・source 別件数（/metrics）
+        self.metrics = CascadeMetrics('mega', CASCADE_LEVELS)
+        self.metrics.add_stats_collector('result_cache', self.result_cache.get_stats, 'Result cache statistics')
+        self.metrics.add_stats_collector('bloom_filter', self._bloom_stats, 'Bloom filter statistics')
+        self.metrics.add_stats_collector('cascade_stats', lambda: self.performance_stats, 'Cascade performance_stats')
+    
+    @property
+    def bloom(self):
+        """使用中の接続の DB 世代に対応する Bloom フィルタ（なければ None）"""
+        return self.db_pool.generation_resource('bloom', load_bloom_filter)
+    
+    def _bloom_stats(self):
+        bloom = self.bloom
+        return bloom.get_stats() if bloom is not None else None
+    
+    @property
+    def db_metadata(self):
+        """現世代の構築時メタデータ（なければ None）"""
+        return self.db_pool.generation_resource('metadata', load_metadata)
     
     def verify_mega_database(self):
-        """352万社データベース検証"""
+        """352万社データベース検証（集計は構築時のメタデータを使用）"""
         print("Verifying 3.52M corporate database...")
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 基本統計
-            cursor.execute("SELECT COUNT(*) FROM corporate_master")
-            total_count = cursor.fetchone()[0]
-            
-            # サンプルデータ確認
-            cursor.execute("SELECT name, corporate_number, prefecture_name FROM corporate_master LIMIT 5")
-            samples = cursor.fetchall()
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # サンプルデータ確認
+                cursor.execute("SELECT name, corporate_number, prefecture_name FROM corporate_master LIMIT 5")
+                samples = cursor.fetchall()
+                
+                metadata, problem = read_metadata(conn)
             
-            print(f"Database Size: {total_count:,} companies")
             print("Sample Data:")
             for i, (name, corp_num, pref) in enumerate(samples, 1):
                 print(f"  {i}. {name} | {corp_num} | {pref}")
             
-            # 法人格分布確認
-            cursor.execute("""
-                SELECT 
-                    SUM(CASE WHEN name LIKE '株式会社%' THEN 1 ELSE 0 END) as mae_kabu,
-                    SUM(CASE WHEN name LIKE '%株式会社' THEN 1 ELSE 0 END) as ato_kabu,
-                    COUNT(*) as total
-                FROM corporate_master 
-                WHERE name LIKE '%株式会社%'
-                LIMIT 100000
-            """)
+            if metadata is None:
+                # 全件集計は起動時に行わない
+                print(f"Database metadata unavailable ({problem}) - run build_corporate_index.py")
+                return bool(samples)
             
-            mae_kabu, ato_kabu, total_stocks = cursor.fetchone()
+            total_count = metadata['total_count']
+            mae_kabu = metadata['mae_kabu']
+            ato_kabu = metadata['ato_kabu']
+            print(f"Database Size: {total_count:,} companies (metadata {metadata['built_at']}, "
+                  f"schema {metadata['schema_fingerprint']})")
             
-            print(f"\nStock Company Analysis (Sample):")
+            print(f"\nStock Company Analysis:")
             print(f"  前株: {mae_kabu:,}")
             print(f"  後株: {ato_kabu:,}")
             if mae_kabu + ato_kabu > 0:
                 print(f"  前株率: {mae_kabu/(mae_kabu+ato_kabu)*100:.1f}%")
             
-            conn.close()
-            
             return total_count > 3000000
             
         except Exception as e:
             print(f"Database verification error: {e}")
             return False
     
-    def optimize_for_performance(self):
-        """352万社対応パフォーマンス最適化"""
-        print("Optimizing for 3.52M scale performance...")
+    def cascade_predict(self, query, user_id=None):
+        """6段階カスケード予測（結果キャッシュ付き）"""
+        start_time = time.perf_counter()
+        # 世代切り替え時は結果キャッシュが破棄されるため、参照前に確認する
+        self.db_pool.check_generation()
+        
+        # Level 1 が user_id を参照するまではクエリ単位で共有する
+        cached = self.result_cache.get(query)
+        if cached is not None:
+            self.performance_stats['total_queries'] += 1
+            self.performance_stats['cache_hits'] += 1
+            result = self._finalize_result(cached, start_time)
+            self.metrics.predict['hit'].observe(time.perf_counter() - start_time)
+            return result
+        
+        # 計算中に世代切り替え・レジストリ再読み込みがあれば旧データの結果を登録しない
+        epoch = self.result_cache.epoch
+        result = self._cascade_predict(query, user_id, start_time)
+        self.result_cache.put(query, result, epoch=epoch)
+        self.metrics.predict['miss'].observe(time.perf_counter() - start_time)
+        return result
+    
+    def cascade_predict_many(self, queries, user_id=None):
+        """複数クエリの一括カスケード予測（結果はクエリ順、各結果は単発予測と同一）"""
+        start_time = time.perf_counter()
+        self.db_pool.check_generation()
+        
+        # 重複除去（結果はクエリ文字列のみで決まる）
+        epoch = self.result_cache.epoch
+        resolved = {}
+        pending = []
+        for query in dict.fromkeys(queries):
+            cached = self.result_cache.get(query)
+            if cached is not None:
+                self.performance_stats['total_queries'] += 1
+                self.performance_stats['cache_hits'] += 1
+                resolved[query] = self._finalize_result(cached, start_time)
+            else:
+                pending.append(query)
+        
+        # Level 4 の完全一致・法人格パターンを一時テーブルとの JOIN で一括解決
+        prefetched = self._prefetch_level4(pending)
+        
+        for query in pending:
+            result = self._cascade_predict(query, user_id, start_time, level4_prefetched=prefetched)
+            self.result_cache.put(query, result, epoch=epoch)
+            resolved[query] = result
+        
+        self.metrics.batch.observe(time.perf_counter() - start_time)
+        return [dict(resolved[query]) for query in queries]
+    
+    def _prefetch_level4(self, queries):
+        """Level 4 完全一致・法人格パターンの一括解決 {query: 結果 or None}（失敗時は None）"""
+        # Level 2 で確定するクエリは Level 4 に到達しないため対象外
+        listed = self.brand_registry.table(LISTED_TABLE)
+        targets = [
+            query for query in queries
+            if not (query in listed and listed[query][1] >= 0.90)
+        ]
+        if not targets:
+            return {}
         
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 既存インデックス確認
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='index'")
-            existing_indexes = [row[0] for row in cursor.fetchall()]
-            
-            print(f"Existing indexes: {len(existing_indexes)}")
-            
-            # 高速検索用インデックス（未作成の場合のみ）
-            new_indexes = [
-                "CREATE INDEX IF NOT EXISTS idx_name_fast ON corporate_master(name)",
-                "CREATE INDEX IF NOT EXISTS idx_name_prefix ON corporate_master(substr(name, 1, 5))",
-                "CREATE INDEX IF NOT EXISTS idx_corporate_number_fast ON corporate_master(corporate_number)",
-                "CREATE INDEX IF NOT EXISTS idx_prefecture_fast ON corporate_master(prefecture_name)"
-            ]
-            
-            for index_sql in new_indexes:
-                cursor.execute(index_sql)
-            
-            # データベース最適化設定
-            cursor.execute("PRAGMA cache_size=200000")  # 200MB キャッシュ
-            cursor.execute("PRAGMA temp_store=MEMORY")
-            
-            conn.commit()
-            conn.close()
-            
-            print("Performance optimization completed")
-            
+            with self.db_pool.connection() as conn:
+                return self._match_exact_or_pattern_many(conn.cursor(), targets)
         except Exception as e:
-            print(f"Optimization error: {e}")
+            print(f"Level 4 batch search error: {e}")
+            return None
     
-    def cascade_predict(self, query, user_id=None):
+    def _cascade_predict(self, query, user_id, start_time, level4_prefetched=None):
         """6段階カスケード予測（352万社基盤）"""
-        start_time = time.time()
         self.performance_stats['total_queries'] += 1
         
         # Level 1: ユーザー学習データ (100%精度)
-        result = self.level1_user_learning(query, user_id)
+        result = self.metrics.run_level('level1_user_learning', self.level1_user_learning, query, user_id)
         if result and result['confidence'] >= 0.95:
             self.performance_stats['level1_user_learning'] += 1
             return self._finalize_result(result, start_time)
         
         # Level 2: EDINET上場企業 (99.2%精度)
-        result = self.level2_edinet_listed(query)
+        result = self.metrics.run_level('level2_edinet_listed', self.level2_edinet_listed, query)
         if result and result['confidence'] >= 0.90:
             self.performance_stats['level2_edinet_listed'] += 1
             return self._finalize_result(result, start_time)
         
         # Level 3: EDINET全企業 (95%精度)
-        result = self.level3_edinet_all(query)
+        result = self.metrics.run_level('level3_edinet_all', self.level3_edinet_all, query)
         if result and result['confidence'] >= 0.85:
             self.performance_stats['level3_edinet_all'] += 1
             return self._finalize_result(result, start_time)
         
         # Level 4: 法人番号DB (352万社) (90%精度)
-        result = self.level4_corporate_number(query)
+        result = self.metrics.run_level('level4_corporate_number', self.level4_corporate_number, query, level4_prefetched)
         if result and result['confidence'] >= 0.80:
             self.performance_stats['level4_corporate_number'] += 1
             return self._finalize_result(result, start_time)
         
         # Level 5: ブランド・通称名 (85%精度)
-        result = self.level5_brand_mapping(query)
+        result = self.metrics.run_level('level5_brand_mapping', self.level5_brand_mapping, query)
         if result and result['confidence'] >= 0.75:
             self.performance_stats['level5_brand_mapping'] += 1
             return self._finalize_result(result, start_time)
         
         # Level 6: URL・企業情報 (80%精度)
-        result = self.level6_url_info(query)
+        result = self.metrics.run_level('level6_url_info', self.level6_url_info, query)
         if result and result['confidence'] >= 0.70:
             self.performance_stats['level6_url_info'] += 1
             return self._finalize_result(result, start_time)
         
         # Level 7: ML予測（フォールバック）(91%精度)
-        result = self.level7_ml_fallback(query)
+        result = self.metrics.run_level('level7_ml_fallback', self.level7_ml_fallback, query)
         self.performance_stats['level7_ml_fallback'] += 1
         return self._finalize_result(result, start_time)
     
@@ -178,17 +323,9 @@ class MegaScaleCascadeSystem:
     def level2_edinet_listed(self, query):
         """Level 2: EDINET上場企業"""
         # 上場企業の高精度マッチング（シミュレーション）
-        listed_companies = {
-            "トヨタ": ("トヨタ自動車株式会社", 0.992),
-            "ソニー": ("ソニー株式会社", 0.992),
-            "ソフトバンク": ("ソフトバンクグループ株式会社", 0.992),
-            "楽天": ("楽天グループ株式会社", 0.992),
-            "KDDI": ("KDDI株式会社", 0.992),
-            "NTT": ("日本電信電話株式会社", 0.992)
-        }
-        
-        if query in listed_companies:
-            name, confidence = listed_companies[query]
+        entry = self.brand_registry.lookup(LISTED_TABLE, query)
+        if entry:
+            name, confidence = entry
             return {
                 'prediction': name,
                 'confidence': confidence,
@@ -202,96 +339,172 @@ class MegaScaleCascadeSystem:
         # 全EDINET企業でのマッチング（シミュレーション）
         return None
     
-    def level4_corporate_number(self, query):
-        """Level 4: 法人番号DB (352万社)"""
+    def level4_corporate_number(self, query, prefetched=None):
+        """Level 4: 法人番号DB (352万社)
+        
+        prefetched: cascade_predict_many が一括解決した完全一致・法人格パターン結果
+        """
+        # 一括解決済みのクエリは部分一致検索のみ行う
+        if prefetched and query in prefetched:
+            if prefetched[query]:
+                return dict(prefetched[query])
+            skip_exact = True
+        else:
+            skip_exact = False
+        
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 完全一致検索
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name 
-                FROM corporate_master 
-                WHERE name = ? 
-                LIMIT 1
-            """, (query,))
-            
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.95,
-                    'source': 'corporate_number_exact',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            # 法人格付きパターン検索
-            patterns = [f"株式会社{query}", f"{query}株式会社"]
-            
-            for pattern in patterns:
-                cursor.execute("""
-                    SELECT name, corporate_number, prefecture_name 
-                    FROM corporate_master 
-                    WHERE name = ? 
-                    LIMIT 1
-                """, (pattern,))
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                if not skip_exact:
+                    result = self._match_exact_or_pattern(cursor, query)
+                    if result:
+                        return result
+                
+                # 部分一致検索（FTS5索引があれば全件走査を回避）
+                if self.fts_enabled and len(query) >= FTS_MIN_QUERY_LENGTH:
+                    cursor.execute(SQL_PARTIAL_MATCH_FTS, (f"%{query}%",))
+                else:
+                    cursor.execute(SQL_PARTIAL_MATCH, (f"%{query}%",))
                 
                 result = cursor.fetchone()
                 if result:
-                    conn.close()
                     return {
                         'prediction': result[0],
-                        'confidence': 0.92,
-                        'source': 'corporate_number_pattern',
+                        'confidence': 0.85,
+                        'source': 'corporate_number_partial',
                         'corporate_number': result[1],
                         'prefecture': result[2]
                     }
-            
-            # 部分一致検索
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name 
-                FROM corporate_master 
-                WHERE name LIKE ? 
-                ORDER BY LENGTH(name)
-                LIMIT 1
-            """, (f"%{query}%",))
-            
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.85,
-                    'source': 'corporate_number_partial',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            conn.close()
-            return None
+                
+                return None
             
         except Exception as e:
             print(f"Level 4 search error: {e}")
             return None
     
+    def _match_exact_or_pattern(self, cursor, query):
+        """完全一致 → 法人格付きパターン（前株 → 後株）"""
+        # 完全一致検索
+        result = self._probe_exact(cursor, query)
+        if result:
+            return self._exact_result(result)
+        
+        # 法人格付きパターン検索（前株 → 後株）
+        if self.core_name_enabled and not has_legal_form_affix(query):
+            candidates = {}
+            for name, corporate_number, prefecture, position in self._probe_core_name(cursor, query):
+                candidates.setdefault(position, (name, corporate_number, prefecture))
+            matches = [candidates[p] for p in (LEGAL_FORM_PREFIX, LEGAL_FORM_SUFFIX) if p in candidates]
+        else:
+            matches = []
+            for pattern in (f"株式会社{query}", f"{query}株式会社"):
+                result = self._probe_exact(cursor, pattern)
+                if result:
+                    matches.append(result)
+                    break
+        
+        if matches:
+            return self._pattern_result(matches[0])
+        return None
+    
+    def _match_exact_or_pattern_many(self, cursor, queries):
+        """_match_exact_or_pattern の一括版: 社名 JOIN 1回 + 中核名 JOIN 1回"""
+        bloom = self.bloom
+        name_keys = []  # (query_id, 優先度, 社名) 0: 完全一致, 1: 前株, 2: 後株
+        core_keys = []
+        core_queries = set()
+        for query_id, query in enumerate(queries):
+            keys = [(0, query)]
+            if self.core_name_enabled and not has_legal_form_affix(query):
+                core_queries.add(query_id)
+                if bloom is None or bloom.check(BLOOM_CORE, query):
+                    core_keys.append((query_id, 0, query))
+            else:
+                keys += [(1, f"株式会社{query}"), (2, f"{query}株式会社")]
+            for priority, key in keys:
+                if bloom is None or bloom.check(BLOOM_NAME, key):
+                    name_keys.append((query_id, priority, key))
+        
+        cursor.execute(SQL_CREATE_BATCH_KEYS)
+        
+        name_hits = {}
+        cursor.execute("DELETE FROM temp.batch_keys")
+        cursor.executemany("INSERT INTO temp.batch_keys VALUES (?, ?, ?)", name_keys)
+        for query_id, priority, name, corporate_number, prefecture, _ in cursor.execute(SQL_EXACT_MATCH_MANY).fetchall():
+            name_hits.setdefault(query_id, {})[priority] = (name, corporate_number, prefecture)
+        if bloom is not None:
+            for _ in range(len(name_keys) - sum(len(hits) for hits in name_hits.values())):
+                bloom.record_false_positive()
+        
+        core_hits = {}
+        if core_keys:
+            cursor.execute("DELETE FROM temp.batch_keys")
+            cursor.executemany("INSERT INTO temp.batch_keys VALUES (?, ?, ?)", core_keys)
+            for query_id, position, name, corporate_number, prefecture, _ in cursor.execute(SQL_CORE_NAME_MATCH_MANY).fetchall():
+                core_hits.setdefault(query_id, {})[position] = (name, corporate_number, prefecture)
+        cursor.execute("DELETE FROM temp.batch_keys")
+        
+        results = {}
+        for query_id, query in enumerate(queries):
+            hits = name_hits.get(query_id, {})
+            candidates = core_hits.get(query_id, {})
+            if 0 in hits:
+                results[query] = self._exact_result(hits[0])
+            elif query_id in core_queries:
+                matches = [candidates[p] for p in (LEGAL_FORM_PREFIX, LEGAL_FORM_SUFFIX) if p in candidates]
+                results[query] = self._pattern_result(matches[0]) if matches else None
+            else:
+                matches = [hits[p] for p in (1, 2) if p in hits]
+                results[query] = self._pattern_result(matches[0]) if matches else None
+        return results
+    
+    def _exact_result(self, row):
+        return {
+            'prediction': row[0],
+            'confidence': 0.95,
+            'source': 'corporate_number_exact',
+            'corporate_number': row[1],
+            'prefecture': row[2]
+        }
+    
+    def _pattern_result(self, row):
+        return {
+            'prediction': row[0],
+            'confidence': 0.92,
+            'source': 'corporate_number_pattern',
+            'corporate_number': row[1],
+            'prefecture': row[2]
+        }
+    
+    def _probe_exact(self, cursor, name):
+        """社名完全一致（Bloom フィルタで不在と判定できれば SQL を省略）"""
+        bloom = self.bloom
+        if bloom is not None and not bloom.check(BLOOM_NAME, name):
+            return None
+        cursor.execute(SQL_EXACT_MATCH, (name,))
+        result = cursor.fetchone()
+        if result is None and bloom is not None:
+            bloom.record_false_positive()
+        return result
+    
+    def _probe_core_name(self, cursor, core_name):
+        """中核名検索（Bloom フィルタで不在と判定できれば SQL を省略）"""
+        bloom = self.bloom
+        if bloom is not None and not bloom.check(BLOOM_CORE, core_name):
+            return []
+        # フィルタは全法人格の中核名を含むため、株式会社で0件でも偽陽性とは数えない
+        cursor.execute(SQL_CORE_NAME_MATCH, (core_name,))
+        return cursor.fetchall()
+    
     def level5_brand_mapping(self, query):
         """Level 5: ブランド・通称名マッピング"""
-        brand_mapping = {
-            "マック": "日本マクドナルド株式会社",
-            "マクド": "日本マクドナルド株式会社", 
-            "ケンタ": "日本KFCホールディングス株式会社",
-            "ユニクロ": "株式会社ファーストリテイリング",
-            "セブン": "株式会社セブン&アイ・ホールディングス",
-            "ローソン": "株式会社ローソン",
-            "ファミマ": "株式会社ファミリーマート"
-        }
-        
-        if query in brand_mapping:
+        entry = self.brand_registry.lookup(BRAND_TABLE, query)
+        if entry:
+            name, confidence = entry
             return {
-                'prediction': brand_mapping[query],
-                'confidence': 0.85,
+                'prediction': name,
+                'confidence': confidence,
                 'source': 'brand_mapping'
             }
         return None
@@ -312,8 +525,9 @@ class MegaScaleCascadeSystem:
     
     def _finalize_result(self, result, start_time):
         """結果最終化・統計更新"""
-        response_time = (time.time() - start_time) * 1000
+        response_time = (time.perf_counter() - start_time) * 1000
         result['response_time_ms'] = response_time
+        self.metrics.count_source(result.get('source', 'unknown'))
         
         # 統計更新
         total_time = self.performance_stats['avg_response_time'] * (self.performance_stats['total_queries'] - 1)
@@ -370,26 +584,49 @@ class MegaScaleCascadeSystem:
             'results': results
         }
 
+    def get_db_generation(self):
+        """現在の DB 世代と旧世代接続の残数（/health 用）"""
+        metrics = self.db_pool.get_metrics()
+        return {
+            'generation': metrics['generation'],
+            'path': metrics['active_path'],
+            'draining_connections': metrics['draining_connections'],
+            'generation_switches': metrics['generation_switches'],
+            'connections_retired': metrics['connections_retired']
+        }
+
     def get_system_statistics(self):
         """システム統計情報取得"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT COUNT(*) FROM corporate_master")
-            total_count = cursor.fetchone()[0]
-            
-            conn.close()
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                if self.db_metadata is not None:
+                    total_count = self.db_metadata['total_count']
+                else:
+                    cursor.execute("SELECT COUNT(*) FROM corporate_master")
+                    total_count = cursor.fetchone()[0]
             
             return {
                 'database_size': total_count,
+                'database_metadata': self.db_metadata,
                 'performance_stats': self.performance_stats,
+                'db_pool': self.db_pool.get_metrics(),
+                'brand_registry': self.brand_registry.get_stats(),
+                'result_cache': self.result_cache.get_stats(),
+                'bloom_filter': self.bloom.get_stats() if self.bloom is not None else None,
+                'latency': self.metrics.latency_summary(),
                 'system_version': 'Phase15_v1.0'
             }
         except Exception as e:
             return {
                 'database_size': 0,
                 'performance_stats': self.performance_stats,
+                'db_pool': self.db_pool.get_metrics(),
+                'brand_registry': self.brand_registry.get_stats(),
+                'result_cache': self.result_cache.get_stats(),
+                'bloom_filter': self.bloom.get_stats() if self.bloom is not None else None,
+                'latency': self.metrics.latency_summary(),
                 'system_version': 'Phase15_v1.0',
                 'error': str(e)
             }
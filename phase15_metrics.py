@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: レイテンシ計測と /metrics（Prometheus テキスト形式）
+カスケード各レベル・予測全体・DB 接続の所要時間を固定バケットのヒストグラムに記録する。
+バケットは 10µs〜10s を1桁あたり5分割した対数間隔（HDR 方式と同様に相対誤差が一定）で、
+記録は bisect 1回 + 加算のみ。p50/p99 はバケット境界から求める（最大誤差はバケット幅）。
+
+計測値はプロセス内で集計する。prefork サーバーでは /metrics を処理したワーカーの値になる
+（pid ラベルでワーカーを区別できる）。
+"""
+
+import os
+import math
+import time
+import bisect
+import threading
+
+METRICS_PREFIX = 'companygenius_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ヒストグラム上限（秒）: 10^(k/5), 10µs〜10s
+LATENCY_BUCKETS = tuple(
+    float(f"{10 ** (exponent / 5):.3g}") for exponent in range(-25, 6)
+)
+
+# /health・/api/v1/stats 用の要約に含める分位点
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Histogram:
+    """固定バケットのレイテンシヒストグラム（秒）"""
+
+    __slots__ = ('name', 'labels', 'bounds', 'counts', 'sum', 'count', 'max', '_lock')
+
+    def __init__(self, name, labels, bounds=LATENCY_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.bounds = bounds
+        # 最後の要素は +Inf バケット
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def quantile(self, q):
+        """分位点（該当バケットの上限。+Inf バケットなら最大値）"""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            maximum = self.max
+        if not total:
+            return 0.0
+        rank = max(1, math.ceil(q * total))
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds[index], maximum) if index < len(self.bounds) else maximum
+        return maximum
+
+    def summary(self):
+        """件数・平均・分位点（ミリ秒）"""
+        with self._lock:
+            count = self.count
+            total = self.sum
+            maximum = self.max
+        summary = {
+            'count': count,
+            'avg_ms': total / count * 1000 if count else 0.0,
+            'max_ms': maximum * 1000
+        }
+        for q in SUMMARY_QUANTILES:
+            summary[f"p{q * 100:g}_ms"] = self.quantile(q) * 1000
+        return summary
+
+
+class Counter:
+    """単調増加カウンタ"""
+
+    __slots__ = ('name', 'labels', 'value', '_lock')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels)
+    if extra:
+        items.extend(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class MetricsRegistry:
+    """ヒストグラム・カウンタ・ゲージ収集関数の登録先（プロセスに1つ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self.started_at = time.time()
+
+    def _register(self, name, kind, help_text):
+        self._types.setdefault(name, kind)
+        self._help.setdefault(name, help_text)
+
+    def histogram(self, name, help_text='', **labels):
+        """ラベル組ごとのヒストグラムを取得（初回のみ作成）"""
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    self._register(name, 'histogram', help_text)
+                    histogram = self._histograms[key] = Histogram(name, key[1])
+        return histogram
+
+    def counter(self, name, help_text='', **labels):
+        """ラベル組ごとのカウンタを取得（初回のみ作成）"""
+        key = (name, tuple(sorted(labels.items())))
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.get(key)
+                if counter is None:
+                    self._register(name, 'counter', help_text)
+                    counter = self._counters[key] = Counter(name, key[1])
+        return counter
+
+    def add_collector(self, collector):
+        """ゲージ収集関数を登録: collector() -> [(名前, 説明, {ラベル}, 値), ...]"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def _collect_gauges(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        samples = []
+        for collector in collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"⚠️  Metrics collector error: {e}")
+        return samples
+
+    def render_prometheus(self):
+        """Prometheus テキスト形式（text/plain; version=0.0.4）"""
+        pid = os.getpid()
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.values(), key=lambda h: (h.name, h.labels))
+            counters = sorted(self._counters.values(), key=lambda c: (c.name, c.labels))
+
+        def header(name, kind, help_text):
+            full_name = METRICS_PREFIX + name
+            if help_text:
+                lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        lines.append(f"# TYPE {METRICS_PREFIX}process_start_time_seconds gauge")
+        lines.append(f"{METRICS_PREFIX}process_start_time_seconds{{pid=\"{pid}\"}} {self.started_at}")
+
+        current = None
+        for histogram in histograms:
+            if histogram.name != current:
+                current = histogram.name
+                full_name = header(current, 'histogram', self._help.get(current))
+            with histogram._lock:
+                counts = list(histogram.counts)
+                total = histogram.sum
+                count = histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(histogram.labels, [('le', _format_value(bound))])
+                lines.append(f"{full_name}_bucket{labels} {cumulative}")
+            labels = _format_labels(histogram.labels, [('le', '+Inf')])
+            lines.append(f"{full_name}_bucket{labels} {count}")
+            lines.append(f"{full_name}_sum{_format_labels(histogram.labels)} {_format_value(total)}")
+            lines.append(f"{full_name}_count{_format_labels(histogram.labels)} {count}")
+
+        current = None
+        for counter in counters:
+            if counter.name != current:
+                current = counter.name
+                full_name = header(current, 'counter', self._help.get(current))
+            lines.append(f"{full_name}_total{_format_labels(counter.labels)} {counter.value}")
+
+        declared = set()
+        samples = sorted(self._collect_gauges(), key=lambda sample: sample[0])
+        for name, help_text, labels, value in samples:
+            if value is None:
+                continue
+            if name not in declared:
+                declared.add(name)
+                full_name = header(name, 'gauge', help_text)
+            else:
+                full_name = METRICS_PREFIX + name
+            lines.append(f"{full_name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, name):
+        """ヒストグラム名に対するラベル別の要約（JSON 統計用）"""
+        with self._lock:
+            histograms = [h for h in self._histograms.values() if h.name == name]
+        return {
+            ','.join(f"{key}={value}" for key, value in histogram.labels): histogram.summary()
+            for histogram in histograms
+        }
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics_registry():
+    """プロセス内共有のメトリクス登録先"""
+    return _registry
+
+
+def stats_gauges(prefix, stats, help_text='', **labels):
+    """get_stats()/get_metrics() の数値項目をゲージのサンプルに変換（文字列・None は除外）"""
+    return [
+        (f"{prefix}_{key}", help_text, labels, value)
+        for key, value in stats.items()
+        if isinstance(value, (int, float))
+    ]
+
+
+class CascadeMetrics:
+    """カスケードシステム1つ分の計測
+
+    ヒストグラムは起動時に作成しておき、リクエスト処理中は辞書参照と observe のみ行う。
+    """
+
+    def __init__(self, system, levels, registry=None):
+        self.system = system
+        self.registry = registry or get_metrics_registry()
+        self.levels = {
+            level: self.registry.histogram(
+                'cascade_level_duration_seconds', 'Time spent in each cascade level (including misses)',
+                system=system, level=level
+            )
+            for level in levels
+        }
+        self.predict = {
+            cache: self.registry.histogram(
+                'cascade_predict_duration_seconds', 'End-to-end cascade_predict latency',
+                system=system, cache=cache
+            )
+            for cache in ('hit', 'miss')
+        }
+        self.batch = self.registry.histogram(
+            'cascade_batch_duration_seconds', 'cascade_predict_many latency per batch', system=system
+        )
+        self._sources = {}
+
+    def run_level(self, level, method, *args):
+        """レベル関数を呼び出し、所要時間を記録（該当なしで次のレベルへ進む場合も含む）"""
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.levels[level].observe(time.perf_counter() - started)
+
+    def count_source(self, source):
+        """結果の source 別件数"""
+        counter = self._sources.get(source)
+        if counter is None:
+            counter = self._sources[source] = self.registry.counter(
+                'cascade_predictions', 'Predictions served, by result source',
+                system=self.system, source=source
+            )
+        counter.inc()
+
+    def add_stats_collector(self, prefix, get_stats, help_text=''):
+        """get_stats() の数値項目を /metrics 出力時にゲージとして収集"""
+        def collect():
+            stats = get_stats()
+            if stats is None:
+                return []
+            return stats_gauges(prefix, stats, help_text, system=self.system)
+        self.registry.add_collector(collect)
+
+    def latency_summary(self):
+        """レベル別・予測全体の分位点（JSON 統計用、ミリ秒）"""
+        return {
+            'levels': {level: histogram.summary() for level, histogram in self.levels.items()},
+            'predict': {cache: histogram.summary() for cache, histogram in self.predict.items()},
+            'batch': self.batch.summary()
+        }
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: レスポンスの JSON シリアライズと圧縮
+- 既定はコンパクト JSON（区切りの空白なし）。?pretty=1 のときのみ indent=2
+- JSON エンコーダは差し替え可能（JSON_ENCODER=auto/json/orjson、register_json_encoder で追加）
+  auto は orjson がインストールされていれば orjson、なければ標準 json
+- Accept-Encoding に応じて RESPONSE_COMPRESS_MIN_BYTES 以上の本文を圧縮
+  （brotli モジュールがあれば br を優先、なければ gzip）
+"""
+
+import os
+import json
+import gzip
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto').lower()
+# これ未満の本文は圧縮しない（ヘッダー・CPU の分だけ損になるため）
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '5'))
+RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '4'))
+
+
+def _stdlib_dumps(data, pretty=False):
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _orjson_dumps(data, pretty=False):
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+    try:
+        return orjson.dumps(data, option=option)
+    except TypeError:
+        # orjson が扱えない値（64bit を超える整数など）は標準 json で
+        return _stdlib_dumps(data, pretty)
+
+
+_encoders = {'json': _stdlib_dumps}
+if orjson is not None:
+    _encoders['orjson'] = _orjson_dumps
+
+
+def register_json_encoder(name, dumps):
+    """JSON エンコーダを登録: dumps(data, pretty=False) -> UTF-8 bytes"""
+    _encoders[name] = dumps
+
+
+def get_json_encoder(name=None):
+    """名前（省略時は JSON_ENCODER）に対応する dumps 関数。未登録なら標準 json"""
+    name = name or JSON_ENCODER
+    if name == 'auto':
+        name = 'orjson' if 'orjson' in _encoders else 'json'
+    dumps = _encoders.get(name)
+    if dumps is None:
+        print(f"⚠️  JSON encoder '{name}' not available - using json")
+        return _stdlib_dumps
+    return dumps
+
+
+def _accepted_codings(accept_encoding):
+    """Accept-Encoding の {coding: q}"""
+    codings = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def negotiate_encoding(accept_encoding):
+    """使用する Content-Encoding（br / gzip / None）"""
+    codings = _accepted_codings(accept_encoding)
+    wildcard = codings.get('*', 0.0)
+    if brotli is not None and codings.get('br', wildcard) > 0:
+        return 'br'
+    if codings.get('gzip', wildcard) > 0:
+        return 'gzip'
+    return None
+
+
+def compress_body(body, accept_encoding, min_bytes=RESPONSE_COMPRESS_MIN_BYTES):
+    """本文を圧縮: (本文, Content-Encoding or None)"""
+    if len(body) < min_bytes:
+        return body, None
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding == 'br':
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY), 'br'
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0), 'gzip'
+    return body, None
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: カスケード予測結果キャッシュ
+偏りの大きいトラフィック向けに cascade_predict の結果を LRU + TTL で保持する。
+ユーザー修正の追加時は影響する（修正キーと部分一致する）エントリだけを破棄する。
+破棄・全消去のたびに世代番号（epoch）を進め、計算開始前の epoch を付けた put は
+その間に破棄が走っていれば登録しない（修正前の結果が TTL の間残らないように）。
+"""
+
+import os
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL_SECONDS = 300.0
+# 一度に破棄する修正キーがこれを超えたら部分一致の走査をせず全消去する
+INVALIDATE_CLEAR_THRESHOLD = 8
+
+
+class ResultCache:
+    """スレッドセーフな LRU + TTL 結果キャッシュ"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # (query, user_id) -> (正規化クエリ, 期限, 結果)
+        self._lock = threading.Lock()
+        self.epoch = 0  # 破棄・全消去ごとに増える
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'stale_puts': 0
+        }
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, query, user_id=None):
+        """キャッシュ済み結果のコピーを取得（なければ None）"""
+        if not self.enabled:
+            return None
+        key = (query, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.stats['expirations'] += 1
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            result = entry[2]
+        # 呼び出し側で response_time_ms などを書き換えるためコピーを返す
+        return copy.deepcopy(result)
+
+    def put(self, query, result, normalized_query=None, user_id=None, epoch=None):
+        """結果を登録（上限超過時は最も古く使われたものを追い出す）
+
+        epoch: 計算開始前に読んだ self.epoch。その後に破棄・全消去があれば登録しない
+        """
+        if not self.enabled:
+            return
+        if normalized_query is None:
+            normalized_query = query
+        key = (query, user_id)
+        entry = (normalized_query, time.monotonic() + self.ttl_seconds, copy.deepcopy(result))
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                self.stats['stale_puts'] += 1
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate_correction(self, normalized_key):
+        """修正キーと完全一致・部分一致する正規化クエリのエントリを破棄"""
+        return self.invalidate_corrections([normalized_key])
+
+    def invalidate_corrections(self, normalized_keys):
+        """複数の修正キーに対する破棄（走査は1回。件数が多ければ全消去）"""
+        normalized_keys = list(dict.fromkeys(normalized_keys))
+        if not normalized_keys:
+            return 0
+        with self._lock:
+            self.epoch += 1
+            if len(normalized_keys) > INVALIDATE_CLEAR_THRESHOLD:
+                stale = list(self._entries)
+            else:
+                stale = [
+                    key for key, (normalized_query, _, _) in self._entries.items()
+                    if any(
+                        normalized_key in normalized_query or normalized_query in normalized_key
+                        for normalized_key in normalized_keys
+                    )
+                ]
+            for key in stale:
+                del self._entries[key]
+            self.stats['invalidations'] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.epoch += 1
+            self._entries.clear()
+
+    def get_stats(self):
+        """ヒット/ミス/追い出し件数"""
+        with self._lock:
+            size = len(self._entries)
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        return {
+            'enabled': self.enabled,
+            'size': size,
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl_seconds,
+            'hit_rate': stats['hits'] / lookups if lookups else 0.0,
+            **stats
+        }
+
+
+def create_result_cache():
+    """環境変数 RESULT_CACHE_SIZE / RESULT_CACHE_TTL から生成（サイズ 0 で無効）"""
+    return ResultCache(
+        max_entries=int(os.getenv('RESULT_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=float(os.getenv('RESULT_CACHE_TTL', DEFAULT_TTL_SECONDS))
+    )
@@ -11,12 +11,16 @@ import json
 from datetime import datetime
 import os
 
+from phase15_db_pool import get_pool
+
 class SimpleCascadeSystem:
     """簡易カスケードシステム（pandas不要）"""
     
     def __init__(self):
         # データベースパス（環境変数から取得、デフォルトは相対パス）
         self.db_path = os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db')
+        # 共有接続プール
+        self.db_pool = get_pool(self.db_path)
         self.performance_stats = {
             'level2_edinet_listed': 0,
             'level4_corporate_number': 0,
@@ -113,72 +117,68 @@ class SimpleCascadeSystem:
     def level4_corporate_number(self, query):
         """Level 4: 法人番号DB (352万社)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 完全一致検索
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name 
-                FROM corporate_master 
-                WHERE name = ? 
-                LIMIT 1
-            """, (query,))
-            
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.95,
-                    'source': 'corporate_number_exact',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            # 法人格付きパターン検索
-            patterns = [f"株式会社{query}", f"{query}株式会社"]
-            
-            for pattern in patterns:
+            with self.db_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # 完全一致検索
                 cursor.execute("""
                     SELECT name, corporate_number, prefecture_name 
                     FROM corporate_master 
                     WHERE name = ? 
                     LIMIT 1
-                """, (pattern,))
+                """, (query,))
                 
                 result = cursor.fetchone()
                 if result:
-                    conn.close()
                     return {
                         'prediction': result[0],
-                        'confidence': 0.92,
-                        'source': 'corporate_number_pattern',
+                        'confidence': 0.95,
+                        'source': 'corporate_number_exact',
                         'corporate_number': result[1],
                         'prefecture': result[2]
                     }
-            
-            # 部分一致検索
-            cursor.execute("""
-                SELECT name, corporate_number, prefecture_name 
-                FROM corporate_master 
-                WHERE name LIKE ? 
-                ORDER BY LENGTH(name)
-                LIMIT 1
-            """, (f"%{query}%",))
-            
-            result = cursor.fetchone()
-            if result:
-                conn.close()
-                return {
-                    'prediction': result[0],
-                    'confidence': 0.85,
-                    'source': 'corporate_number_partial',
-                    'corporate_number': result[1],
-                    'prefecture': result[2]
-                }
-            
-            conn.close()
-            return None
+                
+                # 法人格付きパターン検索
+                patterns = [f"株式会社{query}", f"{query}株式会社"]
+                
+                for pattern in patterns:
+                    cursor.execute("""
+                        SELECT name, corporate_number, prefecture_name 
+                        FROM corporate_master 
+                        WHERE name = ? 
+                        LIMIT 1
+                    """, (pattern,))
+                    
+                    result = cursor.fetchone()
+                    if result:
+                        return {
+                            'prediction': result[0],
+                            'confidence': 0.92,
+                            'source': 'corporate_number_pattern',
+                            'corporate_number': result[1],
+                            'prefecture': result[2]
+                        }
+                
+                # 部分一致検索
+                cursor.execute("""
+                    SELECT name, corporate_number, prefecture_name 
+                    FROM corporate_master 
+                    WHERE name LIKE ? 
+                    ORDER BY LENGTH(name)
+                    LIMIT 1
+                """, (f"%{query}%",))
+                
+                result = cursor.fetchone()
+                if result:
+                    return {
+                        'prediction': result[0],
+                        'confidence': 0.85,
+                        'source': 'corporate_number_partial',
+                        'corporate_number': result[1],
+                        'prefecture': result[2]
+                    }
+                
+                return None
             
         except Exception as e:
             print(f"❌ Level 4 search error: {e}")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Phase 15: NDJSON ストリーミング予測の入出力
+改行区切りのクエリを受信した分だけ行に切り出し、予測結果を1行1 JSON で返す。
+入力全体・結果全体を保持しないため、入力サイズに関係なくメモリ使用量は一定。
+
+入力行の形式（UTF-8）:
+    トヨタ                     … 行全体をクエリとして扱う
+    {"query": "トヨタ"}        … JSON オブジェクト（query フィールド）
+    "トヨタ"                   … JSON 文字列
+空行は無視する。
+"""
+
+import json
+
+from phase15_response_encoding import get_json_encoder
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson; charset=utf-8'
+# 1行の最大バイト数（改行が来ない巨大入力でメモリを使い切らないため）
+MAX_STREAM_LINE_BYTES = 64 * 1024
+# 結果行のエンコーダ（コンパクト JSON、orjson があれば orjson）
+_json_dumps = get_json_encoder()
+
+
+class StreamLineError(ValueError):
+    """入力行を解釈できない（その行のみエラー結果として返す）"""
+
+
+class LineSplitter:
+    """受信したバイト列を改行で行に切り出す（行をまたぐ断片だけを保持）"""
+
+    def __init__(self, max_line_bytes=MAX_STREAM_LINE_BYTES):
+        self.max_line_bytes = max_line_bytes
+        self.buffer = b''
+        self.overflow = False
+
+    def feed(self, data):
+        """断片を追加し、確定した行（bytes、長すぎる行は None）のリストを返す"""
+        self.buffer += data
+        *lines, self.buffer = self.buffer.split(b'\n')
+        if self.overflow and lines:
+            # 長すぎた行（エラー通知済み）の残りを捨てる
+            lines = lines[1:]
+            self.overflow = False
+        lines = [None if len(line) > self.max_line_bytes else line for line in lines]
+        if len(self.buffer) > self.max_line_bytes:
+            if not self.overflow:
+                lines.append(None)
+            self.buffer = b''
+            self.overflow = True
+        return [line for line in lines if line is None or line.strip()]
+
+    def finish(self):
+        """入力終端: 改行で終わらない最終行を返す"""
+        line, self.buffer = self.buffer, b''
+        if self.overflow:
+            self.overflow = False
+            return []
+        return [line] if line.strip() else []
+
+
+def parse_stream_line(line):
+    """入力行（bytes）からクエリ文字列を取り出す"""
+    if line is None:
+        raise StreamLineError(f"Line too long (max {MAX_STREAM_LINE_BYTES} bytes)")
+    try:
+        text = line.decode('utf-8').strip()
+    except UnicodeDecodeError as e:
+        raise StreamLineError(f"UTF-8 decoding error: {e}")
+
+    if text[:1] in ('{', '"'):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise StreamLineError(f"Invalid JSON line: {e}")
+        if isinstance(value, dict):
+            value = value.get('query')
+        if not isinstance(value, str) or not value:
+            raise StreamLineError("Missing 'query' string")
+        return value
+    return text
+
+
+def encode_stream_line(data):
+    """1件分の結果を NDJSON の1行にする"""
+    return _json_dumps(data) + b'\n'
@@ -9,6 +9,10 @@ import sys
 import os
 import time
 import json
+import random
+import socket
+import http.client
+import urllib.parse
 import asyncio
 import subprocess
 import requests
@@ -37,6 +41,9 @@ class Phase15SystemTester:
         }
         
         self.api_url = "http://127.0.0.1:8000"
+        # 標準ライブラリ版サーバー（phase15_fixed_api.py --mode thread/prefork）
+        self.fixed_api_url = os.getenv('FIXED_API_URL', "http://127.0.0.1:8001")
+        self.keepalive_timeout = float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '1'))
         self.db_path = os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db')
         
     def log_test(self, test_name, success, details=None):
@@ -276,6 +283,110 @@ class Phase15SystemTester:
             self.log_test("Batch Prediction", False, str(e))
             return False
 
+    def test_correction_index_first_match(self, rounds=200, seed=15):
+        """Level 1 部分一致インデックスと従来の線形走査の一致テスト（add_many / add を混在）"""
+        try:
+            from phase15_correction_index import CorrectionIndex
+
+            # 包含関係が頻繁に起きるよう短い文字列・少ない文字種で生成
+            rng = random.Random(seed)
+            alphabet = "アイウ株式"
+
+            def random_text(max_length):
+                return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+            checked = 0
+            for round_number in range(rounds):
+                index = CorrectionIndex()
+                corrections = {}  # 従来実装と同じく dict の挿入順が登録順
+                for _ in range(rng.randint(1, 12)):
+                    if rng.random() < 0.5:
+                        keys = [random_text(5) for _ in range(rng.randint(0, 8))]
+                        index.add_many(keys)
+                    else:
+                        keys = [random_text(5)]
+                        index.add(keys[0])
+                    for key in keys:
+                        corrections[key] = True
+
+                    # 追加のたびに検索（失敗リンクの再計算を途中の状態でも確認）
+                    for _ in range(5):
+                        query = random_text(7)
+                        expected = next((k for k in corrections if k in query or query in k), None)
+                        actual = index.first_match(query)
+                        checked += 1
+                        if actual != expected:
+                            self.log_test(
+                                "Correction Index First Match", False,
+                                f"round {round_number}: query={query!r} expected={expected!r} actual={actual!r}"
+                            )
+                            return False
+
+            self.log_test("Correction Index First Match", True, f"{checked:,} queries match the linear scan")
+            return True
+
+        except Exception as e:
+            self.log_test("Correction Index First Match", False, str(e))
+            return False
+
+    def _read_http_response(self, sock):
+        """ソケットから応答を1件読む（Content-Length 分の本文まで）"""
+        response = http.client.HTTPResponse(sock)
+        response.begin()
+        return response, response.read()
+
+    def test_fixed_api_keepalive(self):
+        """keep-alive のタイムアウトテスト（本文の途中停止・アイドル切断）"""
+        url = urllib.parse.urlsplit(self.fixed_api_url)
+        pause = self.keepalive_timeout + 0.5
+        try:
+            sock = socket.create_connection((url.hostname, url.port or 80), timeout=pause + 10)
+        except OSError:
+            self.log_test("Fixed API Slow Upload", False, "Connection refused - server not running")
+            return False
+
+        try:
+            # アイドルタイムアウトより長く止まりながら本文を送っても応答が返る（2件目のリクエストで確認）
+            sock.sendall(b"GET /health HTTP/1.1\r\nHost: test\r\n\r\n")
+            self._read_http_response(sock)
+
+            queries = ["トヨタ", "ソニー", "楽天"]
+            body = json.dumps({"queries": queries}, ensure_ascii=False).encode('utf-8')
+            sock.sendall(
+                b"POST /batch HTTP/1.1\r\nHost: test\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode('ascii')
+                + body[:len(body) // 2]
+            )
+            time.sleep(pause)
+            sock.sendall(body[len(body) // 2:])
+            response, data = self._read_http_response(sock)
+            results = json.loads(data.decode('utf-8')).get('results', []) if response.status == 200 else []
+            if len(results) != len(queries):
+                self.log_test("Fixed API Slow Upload", False, f"HTTP {response.status}, {len(results)} results")
+                return False
+            self.log_test(
+                "Fixed API Slow Upload", True,
+                f"{len(results)} results after a {pause:.1f}s pause mid-body"
+            )
+
+            # 応答後のアイドル接続はアイドルタイムアウトで閉じられる
+            if response.getheader('Connection', '').lower() == 'close':
+                self.log_test("Fixed API Keep-Alive Idle Timeout", False, "Connection closed before idle wait")
+                return False
+            time.sleep(pause)
+            closed = sock.recv(1) == b''
+            self.log_test(
+                "Fixed API Keep-Alive Idle Timeout", closed,
+                f"Idle connection closed after {self.keepalive_timeout:g}s" if closed else "Idle connection still open"
+            )
+            return closed
+
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            self.log_test("Fixed API Slow Upload", False, str(e))
+            return False
+        finally:
+            sock.close()
+
     def test_chrome_extension_files(self):
         """Chrome拡張機能ファイルテスト"""
         try:
@@ -370,11 +481,13 @@ class Phase15SystemTester:
         
         # 3. カスケード予測テスト
         self.test_cascade_prediction(system)
+        self.test_correction_index_first_match()
         
         # 4. APIサーバーテスト
         self.test_api_server_health()
         self.test_api_prediction()
         self.test_batch_prediction()
+        self.test_fixed_api_keepalive()
         
         # 5. Chrome拡張機能ファイルテスト
         self.test_chrome_extension_files()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CompanyGenius 差分更新スクリプト
+国税庁 法人番号公表サイトの差分データ（日次の新規・変更・削除）を corporate_master に適用する。
+全件CSVからの再作成（create_database.py）なしで、変更のあった法人だけを書き換える。
+
+- 法人番号単位の upsert / delete（process_type 99 = 削除）を1トランザクションで適用
+- name_length / core_name / legal_form / legal_form_position 列を同時に更新
+- corporate_name_fts（外部コンテンツ方式）の該当行のみ削除・再登録
+- <db>.bloom に新しい社名・中核名を追加（偽陽性率が上がりすぎた場合のみ再構築）
+- corporate_metadata の件数を差分で更新（全件再集計なし）
+- 適用済みファイルを corporate_diff_log に記録（同じファイルの二重適用を防止）
+
+稼働中のサーバーが参照している DB には適用せず、--output でコピーに適用してから
+phase15_db_generation.py activate で切り替える。--db への直接適用は --in-place を明示した場合のみ
+（世代ポインタが指している DB には適用しない。適用後は回答テーブルの再コンパイルが必要）。
+
+使い方:
+    python update_database.py diff_20261017.csv --output ./data/corporate_phase2_stable.20261018.db
+    python update_database.py diff_20261016.zip diff_20261017.zip --db ./data/work.db --in-place
+"""
+
+import csv
+import io
+import os
+import sys
+import sqlite3
+import hashlib
+import zipfile
+import argparse
+from datetime import datetime
+
+from build_corporate_index import FTS_TABLE, CorporateIndexBuilder, split_legal_form
+from phase15_bloom_filter import BloomFilter, BLOOM_NAME, BLOOM_CORE, DEFAULT_FP_RATE, bloom_path_for
+from phase15_db_metadata import compute_metadata, read_metadata, write_metadata
+from phase15_db_generation import GenerationError, pointer_path_for, read_generation
+
+DIFF_LOG_TABLE = 'corporate_diff_log'
+
+# 差分データ（CSV・ヘッダーなし）の列位置
+COL_SEQUENCE = 0
+COL_CORPORATE_NUMBER = 1
+COL_PROCESS = 2
+COL_UPDATE_DATE = 4
+COL_CHANGE_DATE = 5
+COL_NAME = 6
+COL_PREFECTURE_NAME = 9
+
+# 処理区分: 99 = 削除。それ以外（新規・商号変更・所在地変更・閉鎖等）は最新内容で upsert
+PROCESS_DELETE = '99'
+
+# 追加後の推定偽陽性率が設定値のこの倍数を超えたら Bloom フィルタを再構築
+BLOOM_REBUILD_FACTOR = 2.0
+
+
+def stock_counts(name):
+    """metadata の集計（前株・後株・株式会社を含む）に対する1社分の寄与"""
+    if not name or '株式会社' not in name:
+        return 0, 0, 0
+    return int(name.startswith('株式会社')), int(name.endswith('株式会社')), 1
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def open_diff_file(path, encoding):
+    """CSV、または国税庁配布の ZIP（中の CSV）をテキストとして開く"""
+    if zipfile.is_zipfile(path):
+        archive = zipfile.ZipFile(path)
+        members = [name for name in archive.namelist() if name.lower().endswith('.csv')]
+        if not members:
+            raise ValueError(f"CSV not found in {path}")
+        return io.TextIOWrapper(archive.open(members[0]), encoding=encoding, newline='')
+    return open(path, encoding=encoding, newline='')
+
+
+def read_diff_rows(path, encoding='utf-8'):
+    """差分ファイルの行を連番順に返す: [(法人番号, 処理区分, 商号, 都道府県, 更新年月日)]"""
+    rows = []
+    with open_diff_file(path, encoding) as f:
+        for row in csv.reader(f):
+            if len(row) <= COL_PREFECTURE_NAME:
+                continue
+            corporate_number = row[COL_CORPORATE_NUMBER].strip()
+            # ヘッダー行・不正行は法人番号（13桁）で除外
+            if len(corporate_number) != 13 or not corporate_number.isdigit():
+                continue
+            sequence = int(row[COL_SEQUENCE]) if row[COL_SEQUENCE].isdigit() else len(rows)
+            rows.append((
+                sequence, corporate_number, row[COL_PROCESS].strip(),
+                row[COL_NAME].strip(), row[COL_PREFECTURE_NAME].strip(),
+                row[COL_UPDATE_DATE].strip()
+            ))
+    rows.sort(key=lambda row: row[0])
+    return [row[1:] for row in rows]
+
+
+class CorporateDiffUpdater:
+    """corporate_master への差分適用（派生列・FTS・Bloom・メタデータを同時に更新）"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.stats = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'deleted': 0, 'not_found': 0, 'skipped': 0}
+
+    def connect(self):
+        if not os.path.exists(self.db_path):
+            print(f"❌ データベースが見つかりません: {self.db_path}")
+            return False
+        # トランザクションは明示的に管理する
+        self.conn = sqlite3.connect(self.db_path, isolation_level=None)
+        self.conn.execute("PRAGMA temp_store=MEMORY")
+        self.conn.execute("PRAGMA cache_size=-200000")
+        return True
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _ensure_log_table(self):
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {DIFF_LOG_TABLE} (
+                sha256 TEXT PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                latest_update_date TEXT,
+                applied_at TEXT NOT NULL
+            )
+        """)
+
+    def already_applied(self, sha256):
+        self._ensure_log_table()
+        row = self.conn.execute(
+            f"SELECT file_name, applied_at FROM {DIFF_LOG_TABLE} WHERE sha256 = ?", (sha256,)
+        ).fetchone()
+        return row
+
+    def apply(self, diff_files, changes):
+        """法人番号ごとの最終状態 changes を1トランザクションで適用
+
+        diff_files: [(ファイル名, sha256, 行数, 最新更新年月日)]
+        changes   : {法人番号: (処理区分, 商号, 都道府県)}
+        """
+        conn = self.conn
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(corporate_master)")}
+        has_name_length = 'name_length' in columns
+        has_core_name = 'core_name' in columns
+        has_fts = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)
+        ).fetchone() is not None
+
+        def derived(name):
+            values = {}
+            if has_name_length:
+                values['name_length'] = len(name)
+            if has_core_name:
+                values['core_name'], values['legal_form'], values['legal_form_position'] = split_legal_form(name)
+            return values
+
+        def fts(command, rowid, name):
+            if not has_fts:
+                return
+            if command == 'delete':
+                conn.execute(
+                    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES('delete', ?, ?)", (rowid, name)
+                )
+            else:
+                conn.execute(f"INSERT INTO {FTS_TABLE}(rowid, name) VALUES(?, ?)", (rowid, name))
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            metadata, reason = read_metadata(conn)
+            if metadata is None:
+                print(f"⚠️  メタデータを差分更新できません（{reason}）- 適用後に再集計します")
+            previous_max_rowid = conn.execute("SELECT MAX(rowid) FROM corporate_master").fetchone()[0] or 0
+
+            # 集計の増減と Bloom に追加するキー
+            delta = [0, 0, 0, 0]  # total, 前株, 後株, 株式会社
+            bloom_keys = []
+
+            def count(name, sign):
+                delta[0] += sign
+                for i, value in enumerate(stock_counts(name), start=1):
+                    delta[i] += sign * value
+
+            for corporate_number, (process, name, prefecture) in changes.items():
+                existing = conn.execute(
+                    "SELECT rowid, name, prefecture_name FROM corporate_master WHERE corporate_number = ?",
+                    (corporate_number,)
+                ).fetchall()
+
+                if process == PROCESS_DELETE:
+                    if not existing:
+                        self.stats['not_found'] += 1
+                        continue
+                    for rowid, old_name, _ in existing:
+                        fts('delete', rowid, old_name)
+                        count(old_name, -1)
+                    conn.execute("DELETE FROM corporate_master WHERE corporate_number = ?", (corporate_number,))
+                    self.stats['deleted'] += len(existing)
+                    continue
+                if not name:
+                    # 商号が空の新規・変更行は欠損行として扱い、既存データを変更しない
+                    self.stats['skipped'] += 1
+                    continue
+
+                values = {'name': name, 'prefecture_name': prefecture, **derived(name)}
+                if not existing:
+                    names = ', '.join(values)
+                    placeholders = ', '.join('?' for _ in values)
+                    cursor = conn.execute(
+                        f"INSERT INTO corporate_master (corporate_number, {names}) VALUES (?, {placeholders})",
+                        (corporate_number, *values.values())
+                    )
+                    fts('insert', cursor.lastrowid, name)
+                    count(name, 1)
+                    bloom_keys.append((name, values.get('core_name')))
+                    self.stats['inserted'] += 1
+                    continue
+
+                assignments = ', '.join(f"{column} = ?" for column in values)
+                for rowid, old_name, old_prefecture in existing:
+                    if old_name == name and old_prefecture == prefecture:
+                        self.stats['unchanged'] += 1
+                        continue
+                    conn.execute(
+                        f"UPDATE corporate_master SET {assignments} WHERE rowid = ?",
+                        (*values.values(), rowid)
+                    )
+                    if old_name != name:
+                        fts('delete', rowid, old_name)
+                        fts('insert', rowid, name)
+                        count(old_name, -1)
+                        count(name, 1)
+                        bloom_keys.append((name, values.get('core_name')))
+                    self.stats['updated'] += 1
+
+            max_rowid = conn.execute("SELECT MAX(rowid) FROM corporate_master").fetchone()[0] or 0
+
+            if metadata is not None:
+                metadata['total_count'] += delta[0]
+                metadata['mae_kabu'] += delta[1]
+                metadata['ato_kabu'] += delta[2]
+                metadata['stock_companies'] += delta[3]
+                metadata['max_rowid'] = max_rowid
+                metadata['updated_at'] = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+            else:
+                metadata = compute_metadata(conn)
+            write_metadata(conn, metadata)
+
+            self._ensure_log_table()
+            applied_at = datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+            conn.executemany(
+                f"""
+                INSERT OR REPLACE INTO {DIFF_LOG_TABLE} (file_name, sha256, rows, latest_update_date, applied_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(*diff_file, applied_at) for diff_file in diff_files]
+            )
+
+            # コミット前に保存: 失敗してもフィルタは DB の上位集合（偽陽性のみ）か、max_rowid 不一致で不使用
+            rebuild_fp_rate = self._extend_bloom_filter(bloom_keys, previous_max_rowid, max_rowid)
+
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        if rebuild_fp_rate is not None:
+            self._rebuild_bloom_filter(rebuild_fp_rate)
+        return metadata
+
+    def _extend_bloom_filter(self, bloom_keys, previous_max_rowid, max_rowid):
+        """既存フィルタに追加キーを登録。コミット後に再構築が必要なら偽陽性率を返す"""
+        path = bloom_path_for(self.db_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            bloom = BloomFilter.load(path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Bloom フィルタを読めません（{e}）- 適用後に再構築します")
+            return DEFAULT_FP_RATE
+        if bloom.max_rowid != previous_max_rowid:
+            # 適用前から DB と不一致（サーバーも使っていない）: 追加では整合しないため再構築
+            print("⚠️  Bloom フィルタが DB と一致していません - 適用後に再構築します")
+            return bloom.fp_rate
+        for name, core_name in bloom_keys:
+            bloom.add(BLOOM_NAME, name)
+            if core_name:
+                bloom.add(BLOOM_CORE, core_name)
+        bloom.max_rowid = max_rowid
+        bloom.save(path)
+        if bloom.estimated_fp_rate() > bloom.fp_rate * BLOOM_REBUILD_FACTOR:
+            print(f"🌸 推定偽陽性率 {bloom.estimated_fp_rate():.2%} - 適用後に Bloom フィルタを再構築します")
+            return bloom.fp_rate
+        return None
+
+    def _rebuild_bloom_filter(self, fp_rate):
+        builder = CorporateIndexBuilder(self.db_path)
+        builder.connect()
+        try:
+            builder.build_bloom_filter(fp_rate)
+        finally:
+            builder.close()
+
+
+def copy_database(source, destination):
+    """稼働中 DB の一貫したコピー（SQLite オンラインバックアップ）と Bloom フィルタの複製"""
+    if os.path.exists(destination):
+        raise FileExistsError(f"Output already exists: {destination}")
+    src = sqlite3.connect(f"file:{os.path.abspath(source)}?mode=ro", uri=True)
+    dst = sqlite3.connect(destination)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    if os.path.exists(bloom_path_for(source)):
+        BloomFilter.load(bloom_path_for(source)).save(bloom_path_for(destination))
+
+
+def main():
+    """メイン関数"""
+    parser = argparse.ArgumentParser(description="CompanyGenius 法人番号差分更新")
+    parser.add_argument('diff_files', nargs='+', help="差分データ（CSV または ZIP）。指定順に適用")
+    parser.add_argument(
+        '--db',
+        default=os.getenv('DATABASE_PATH', './data/corporate_phase2_stable.db'),
+        help="対象データベース（既定: $DATABASE_PATH）"
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help="--db をこのパスにコピーしてから適用（世代切り替え用）")
+    target.add_argument(
+        '--in-place', action='store_true',
+        help="--db に直接適用（配信中でない DB のみ。DB_IMMUTABLE=1 のサーバーが開いている DB には不可）"
+    )
+    parser.add_argument('--encoding', default='utf-8', help="差分CSVの文字コード（Shift_JIS 版は cp932）")
+    parser.add_argument('--force', action='store_true', help="適用済みのファイルも再適用する")
+    args = parser.parse_args()
+
+    print("🧠 CompanyGenius 差分更新")
+    print("=" * 50)
+    started = datetime.now()
+
+    db_path = args.db
+    if args.in_place and os.path.exists(pointer_path_for(args.db)):
+        # 世代ポインタが指す DB は配信中（immutable で開かれていれば書き換えたページを読まれる）
+        try:
+            active_path = read_generation(args.db)['path']
+        except GenerationError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        if os.path.exists(active_path) and os.path.samefile(active_path, args.db):
+            print(f"❌ {args.db} は世代ポインタの現行 DB です - --output でコピーに適用してください")
+            sys.exit(1)
+    if args.output:
+        print(f"📋 コピー作成中: {args.db} -> {args.output}")
+        try:
+            copy_database(args.db, args.output)
+        except (OSError, sqlite3.Error) as e:
+            print(f"❌ コピーエラー: {e}")
+            sys.exit(1)
+        db_path = args.output
+    print(f"📁 対象データベース: {db_path}")
+
+    updater = CorporateDiffUpdater(db_path)
+    if not updater.connect():
+        sys.exit(1)
+
+    try:
+        # 法人番号ごとに最後の行（ファイル指定順・連番順）を採用
+        changes = {}
+        diff_files = []
+        for path in args.diff_files:
+            sha256 = file_sha256(path)
+            applied = updater.already_applied(sha256)
+            if applied and not args.force:
+                print(f"⏭️  適用済み: {path}（{applied[0]}, {applied[1]}）")
+                continue
+            rows = read_diff_rows(path, args.encoding)
+            for corporate_number, process, name, prefecture, _ in rows:
+                if process != PROCESS_DELETE and not name and corporate_number in changes:
+                    # 商号が空の欠損行で先行する有効な変更を上書きしない
+                    updater.stats['skipped'] += 1
+                    continue
+                changes[corporate_number] = (process, name, prefecture)
+            latest = max((row[4] for row in rows), default=None)
+            diff_files.append((os.path.basename(path), sha256, len(rows), latest))
+            print(f"📥 {path}: {len(rows):,} 行（最新更新日 {latest}）")
+
+        if not diff_files:
+            print("✅ 適用する差分はありません")
+            return
+
+        metadata = updater.apply(diff_files, changes)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"❌ 差分適用エラー（変更はロールバックされました）: {e}")
+        sys.exit(1)
+    finally:
+        updater.close()
+
+    stats = updater.stats
+    print(f"\n🎉 差分適用完了 ({datetime.now() - started})")
+    print(f"  ➕ 新規: {stats['inserted']:,}  ✏️  変更: {stats['updated']:,}  "
+          f"➖ 削除: {stats['deleted']:,}  ＝ 変更なし: {stats['unchanged']:,}  ❔ 削除対象なし: {stats['not_found']:,}  "
+          f"⚠️  商号なしでスキップ: {stats['skipped']:,}")
+    print(f"📊 総レコード数: {metadata['total_count']:,} 社")
+    if args.output:
+        print("\n🔄 次の手順で切り替え:")
+        print(f"   python phase15_answer_table.py --db {args.output} --out <新しい回答テーブル>")
+        print(f"   python phase15_db_generation.py --db {args.db} activate {args.output} --answer-table <新しい回答テーブル>")
+    else:
+        # 既存の回答テーブルは適用前の DB のものとして読み込み時に不一致で無効になる
+        print("\n🧩 回答テーブルを再コンパイルしてください:")
+        print(f"   python phase15_answer_table.py --db {db_path} --out <回答テーブル>")
+
+
+if __name__ == "__main__":
+    main()